@@ -0,0 +1,123 @@
+"""
+Сравнение скорости загрузки каталога: прежний get_docs (обращение к каждой ячейке
+через data.loc) и текущий frame_to_docs, а также форматов входного файла.
+
+    python -m benchmarks.bench_get_docs --rows 5000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem.AutoAssistant import frame_to_docs, read_catalog_frame
+
+
+def legacy_frame_to_docs(data):
+    """get_docs до перехода на колоночную загрузку."""
+    data.columns = data.columns.str.replace(' ', '_')
+    docs = [
+        Document(
+            page_content=data.loc[idx, "description"],
+            metadata={
+                "id": str(data.loc[idx, "_id"]),
+                "start_year": data.loc[idx, "Начало_выпуска"],
+                "end_year": data.loc[idx, "Конец_выпуска"],
+                "price": float(data.loc[idx, "median"]),
+                "brand": data.loc[idx, "brand"],
+                "model": data.loc[idx, "model"],
+                "country": data.loc[idx, "Страна"],
+                "drive": data.loc[idx, "Привод"],
+                "engine_type": data.loc[idx, "Тип_двигателя"],
+                "fuel_consumption": data.loc[idx, "Расход_топлива"],
+                "seats": data.loc[idx, "Количество_мест"],
+                "body_type": data.loc[idx, "Тип_кузова"],
+                "doors": data.loc[idx, "Количество_дверей"],
+                "transmission": data.loc[idx, "Тип_коробки"],
+                "horsepower": data.loc[idx, "Лошадиные_силы"],
+                "clearance": data.loc[idx, "Клиренс"],
+                "rating": float(data.loc[idx, "rating"]),
+                "desc_summarization": data.loc[idx, "desc_summarization"],
+                "desc_plus": data.loc[idx, "desc_plus"],
+                "desc_minus": data.loc[idx, "desc_minus"],
+                "images": [url.strip().strip('"\'') for url in data.loc[idx, "images"].strip('[]').split(',')] if pd.notna(data.loc[idx, "images"]) else [],
+            },
+        )
+        for idx in data.index
+    ]
+    ids = [data.loc[idx, "_id"] for idx in data.index]
+    return docs, ids
+
+
+def make_catalog(rows, seed=0):
+    rng = random.Random(seed)
+    brands = ["Toyota", "Kia", "Lada", "BMW", "Haval", "Chery"]
+    return pd.DataFrame({
+        "_id": [f"car_{i}" for i in range(rows)],
+        "description": [f"Описание автомобиля {i} " * 20 for i in range(rows)],
+        "Начало выпуска": [rng.randint(2000, 2020) for _ in range(rows)],
+        "Конец выпуска": [rng.choice([rng.randint(2010, 2024), None]) for _ in range(rows)],
+        "median": [rng.randint(300, 9000) * 1000 for _ in range(rows)],
+        "brand": [rng.choice(brands) for _ in range(rows)],
+        "model": [f"Model {i % 50}" for i in range(rows)],
+        "Страна": [rng.choice(["Japan", "Korea", "Russia", "Germany", "China"]) for _ in range(rows)],
+        "Привод": [rng.choice(["передний", "задний", "полный"]) for _ in range(rows)],
+        "Тип двигателя": [rng.choice(["бензин", "дизель", "гибрид", "электричество"]) for _ in range(rows)],
+        "Расход топлива": [round(rng.uniform(4, 15), 1) for _ in range(rows)],
+        "Количество мест": [rng.choice([2, 4, 5, 7]) for _ in range(rows)],
+        "Тип кузова": [rng.choice(["седан", "хэтчбек", "внедорожник", "универсал"]) for _ in range(rows)],
+        "Количество дверей": [rng.choice([3, 4, 5]) for _ in range(rows)],
+        "Тип коробки": [rng.choice(["автомат", "механика", "вариатор", "робот"]) for _ in range(rows)],
+        "Лошадиные силы": [rng.randint(70, 500) for _ in range(rows)],
+        "Клиренс": [rng.randint(120, 250) for _ in range(rows)],
+        "rating": [round(rng.uniform(6, 10), 1) for _ in range(rows)],
+        "desc_summarization": ["Кратко" for _ in range(rows)],
+        "desc_plus": ["Плюсы" for _ in range(rows)],
+        "desc_minus": ["Минусы" for _ in range(rows)],
+        "images": [str([f"https://example.com/{i}_{j}.jpg" for j in range(5)]) if i % 10 else None for i in range(rows)],
+    })
+
+
+def measure(name, func, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started_at)
+    print(f"{name:<32} {best * 1000:9.1f} мс  {rows / best:12.0f} строк/с")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.rows)
+    print(f"Преобразование DataFrame в документы, {args.rows} строк:")
+    legacy = measure("legacy data.loc", lambda: legacy_frame_to_docs(catalog.copy()), args.rows, args.repeat)
+    current = measure("frame_to_docs", lambda: frame_to_docs(catalog.copy()), args.rows, args.repeat)
+    print(f"Ускорение: {legacy / current:.1f}x")
+
+    print(f"\nЧтение файла и преобразование, {args.rows} строк:")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {"xlsx": os.path.join(directory, "cars.xlsx"), "csv": os.path.join(directory, "cars.csv")}
+        catalog.to_excel(paths["xlsx"], index=False)
+        catalog.to_csv(paths["csv"], index=False)
+        try:
+            catalog.to_parquet(os.path.join(directory, "cars.parquet"), index=False)
+            paths["parquet"] = os.path.join(directory, "cars.parquet")
+        except ImportError:
+            print("parquet пропущен: не установлен pyarrow")
+
+        measure("legacy xlsx", lambda: legacy_frame_to_docs(read_catalog_frame(paths["xlsx"])), args.rows, 1)
+        for name, path in paths.items():
+            measure(name, lambda path=path: frame_to_docs(read_catalog_frame(path)), args.rows, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Локальная замена прокси OpenAI для нагрузочных тестов: чат и эмбеддинги
+с настраиваемой задержкой, долей ответов 429 и заготовленными ответами
+в форматах фильтра, диалога и планировщика.
+
+    python -m benchmarks.fake_openai --port 8900 --latency 0.3 --rate-limit 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+
+import numpy as np
+from aiohttp import web
+
+FILTER_ANSWER = """Год выпуска - от NaN, до NaN
+Минимальная цена - NaN
+Максимальная цена - {price}
+Марка автомобиля - NaN
+Страна - NaN
+Привод - NaN
+Тип двигателя - NaN
+Расход топлива - от NaN, до NaN
+Количество мест - от NaN, до NaN
+Тип кузова - NaN
+Количество дверей - от NaN, до NaN
+Тип коробки - NaN
+Лошадиные силы - от NaN, до NaN
+Клиренс - от NaN, до NaN"""
+
+QUESTION = {
+    "type": "usage",
+    "text": "Для чего вам нужен автомобиль?",
+    "options": ["семейная", "для работы", "для дальних поездок"],
+}
+
+# Сообщение пользователя с этими словами переводит диалог к показу машин
+SHOW_WORDS = ("покаж", "показ", "вариант")
+
+
+def fake_embedding(text, dims):
+    """Детерминированный вектор по тексту: одинаковые тексты дают одинаковые эмбеддинги."""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    return np.random.default_rng(seed).standard_normal(dims).astype(np.float32).tolist()
+
+
+def canned_answer(messages):
+    """Ответ в формате того ассистента, чей системный промпт пришел первым сообщением."""
+    prompt = messages[0]["content"] if messages else ""
+    last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    show = any(word in last.lower() for word in SHOW_WORDS)
+
+    if "JSON" not in prompt:
+        price = 3000000 if "3 млн" in last else "NaN"
+        return FILTER_ANSWER.format(price=price)
+
+    answer = {
+        "action": "show_cars" if show else "ask_question",
+        "message": "Вот что удалось подобрать" if show else "Уточните, пожалуйста",
+        "question": None if show else QUESTION,
+        "confidence": 0.9 if show else 0.5,
+    }
+    if '"filter"' in prompt:
+        answer["filter"] = {"max_price": 3000000 if "3 млн" in last else None}
+    return json.dumps(answer, ensure_ascii=False)
+
+
+class FakeOpenAIServer:
+    """
+    HTTP-сервер с эндпоинтами /chat/completions и /embeddings. Работает в
+    отдельном потоке со своим event loop, поэтому его можно вызывать
+    и синхронным OpenAIApi, и асинхронным клиентом из основного потока.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.1, embedding_latency=0.05,
+                 rate_limit=0.0, retry_after=1, dims=64, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.embedding_latency = embedding_latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.dims = dims
+        self.random = random.Random(seed)
+        self.requests = {"chat": 0, "embeddings": 0}
+        self.rate_limited = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _delay(self, latency):
+        if latency > 0:
+            await asyncio.sleep(max(0.0, latency + self.random.uniform(-self.jitter, self.jitter)))
+
+    def _limited(self):
+        if self.rate_limit and self.random.random() < self.rate_limit:
+            self.rate_limited += 1
+            return web.json_response({"error": {"message": "Rate limit exceeded"}}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        return None
+
+    async def chat(self, request):
+        self.requests["chat"] += 1
+        payload = await request.json()
+        await self._delay(self.latency)
+        limited = self._limited()
+        if limited is not None:
+            return limited
+
+        messages = payload.get("messages", [])
+        content = canned_answer(messages)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        return web.json_response({
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        })
+
+    async def embeddings(self, request):
+        self.requests["embeddings"] += 1
+        payload = await request.json()
+        await self._delay(self.embedding_latency)
+        limited = self._limited()
+        if limited is not None:
+            return limited
+
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        return web.json_response({
+            "model": payload.get("model"),
+            "data": [{"index": i, "embedding": fake_embedding(text, self.dims)} for i, text in enumerate(texts)],
+        })
+
+    def _app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/chat/completions", self.chat)
+        app.router.add_post("/embeddings", self.embeddings)
+        return app
+
+    async def _start(self):
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        """Запускает сервер в фоновом потоке и возвращает его адрес."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-openai", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def stats(self):
+        return {**self.requests, "rate_limited": self.rate_limited}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа чата, с")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--dims", type=int, default=64)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                              embedding_latency=args.embedding_latency, rate_limit=args.rate_limit, dims=args.dims)
+    print(f"OPENAI_CHAT_URL={server.start()}/chat/completions")
+    print(f"OPENAI_EMBEDDING_URL={server.base_url}/embeddings")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
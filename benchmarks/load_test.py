@@ -0,0 +1,251 @@
+"""
+Нагрузочный тест бота целиком: N пользователей одновременно проходят
+заготовленные диалоги через handle_message / handle_answer из tg_bot.
+Модель и эмбеддинги отвечает локальный FakeOpenAIServer, поиск - LocalVectorStore
+по синтетическому каталогу, Telegram - FakeBot, который только считает отправки.
+
+    python -m benchmarks.load_test --users 50 --latency 0.3 --rate-limit 0.02
+    python -m benchmarks.load_test --users 20 --mode planner --output report.json
+
+Отчет: ходы в секунду и p50/p95/p99 по стадиям хода (мс).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+# None - нажать первую кнопку из последнего вопроса бота
+ANSWER = None
+
+DIALOGUES = [
+    ["хочу семейную машину", ANSWER, "до 3 млн рублей", "покажи варианты"],
+    ["нужен недорогой седан на автомате", ANSWER, "покажи что есть"],
+    ["ищу кроссовер с полным приводом", "лучше японский", ANSWER, "покажи варианты"],
+    ["машина для работы", "покажи варианты", "а подешевле?", "покажи варианты"],
+]
+
+ERROR_PREFIX = "❌ Произошла ошибка"
+
+
+class FakeBot:
+    """Вместо Telegram Bot: запоминает отправки и последнюю клавиатуру в каждом чате."""
+
+    def __init__(self, latency=0.0, photo_latency=0.0):
+        self.latency = latency
+        self.photo_latency = photo_latency
+        self.sent = Counter()
+        self.errors = 0
+        self.keyboards = {}
+        self._message_id = 0
+
+    async def _send(self, method):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent[method] += 1
+        self._message_id += 1
+        return SimpleNamespace(message_id=self._message_id)
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        if text.startswith(ERROR_PREFIX):
+            self.errors += 1
+        if reply_markup is not None:
+            self.keyboards[chat_id] = [row[0].callback_data for row in reply_markup.inline_keyboard]
+        return await self._send("send_message")
+
+    @staticmethod
+    def _file_id(media):
+        if not str(media).startswith("http"):
+            return media
+        return f"file-{hashlib.sha256(media.encode('utf-8')).hexdigest()[:16]}"
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        # Фотографии по ссылкам Telegram сначала скачивает, по file_id - нет
+        by_url = sum(str(item.media).startswith("http") for item in media)
+        self.sent["photos_by_url"] += by_url
+        self.sent["photos_by_file_id"] += len(media) - by_url
+        if by_url and self.photo_latency:
+            await asyncio.sleep(self.photo_latency)
+        await self._send("send_media_group")
+        return [SimpleNamespace(photo=(SimpleNamespace(file_id=self._file_id(item.media)),)) for item in media]
+
+async def _noop():
+    return None
+
+
+def message_update(user_id, text):
+    user = SimpleNamespace(id=user_id)
+    return SimpleNamespace(message=SimpleNamespace(from_user=user, text=text), effective_chat=SimpleNamespace(id=user_id))
+
+
+def answer_update(user_id, data):
+    user = SimpleNamespace(id=user_id)
+    query = SimpleNamespace(from_user=user, data=data, answer=_noop, message=SimpleNamespace(delete=_noop))
+    return SimpleNamespace(callback_query=query, effective_chat=SimpleNamespace(id=user_id))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def setup_environment(directory, args, base_url):
+    """Переменные окружения до импорта бота: локальный поиск, пути во временном каталоге, фейковый прокси."""
+    catalog_path = os.path.join(directory, "catalog.csv")
+    os.environ.update({
+        "OPENAI_CHAT_URL": f"{base_url}/chat/completions",
+        "OPENAI_EMBEDDING_URL": f"{base_url}/embeddings",
+        "SEARCH_BACKEND": "local",
+        "ELASTIC_DATASET_PATH": catalog_path,
+        "LOCAL_INDEX_PATH": os.path.join(directory, "local_index.npz"),
+        "EMBEDDING_CACHE_PATH": os.path.join(directory, "embedding_cache.sqlite"),
+        "SESSION_STORE_PATH": os.path.join(directory, "sessions.sqlite"),
+        "TELEGRAM_FILE_CACHE_PATH": os.path.join(directory, "telegram_file_cache.sqlite"),
+        "ASSISTANT_MODE": args.mode,
+        "CONTEXT_MODE": args.context,
+        "MAX_QUERY": os.getenv("MAX_QUERY", "3"),
+        "METRICS_PORT": "",
+    })
+    # AutoAssistant читает MAX_QUERY при импорте, поэтому каталог строится после настройки окружения
+    from benchmarks.bench_get_docs import make_catalog
+
+    make_catalog(args.rows).to_csv(catalog_path, index=False)
+
+
+def create_runtime(retry_delay):
+    from neuralNetworkCarsSystem import carsFacade
+    from neuralNetworkCarsSystem.AutoAssistant import OpenAIApi
+
+    runtime = carsFacade.AssistantRuntime(api=OpenAIApi(None, None, token="load-test"), backend="local")
+    # Повторы после 429 с той же логикой, но без 15-секундной паузы прокси
+    runtime.async_api.delay = retry_delay
+    carsFacade._runtime = runtime
+    return runtime
+
+
+async def run_user(bot_module, bot, user_id, script, think_time, samples):
+    context = SimpleNamespace(bot=bot)
+    for step in script:
+        if step is ANSWER and bot.keyboards.get(user_id):
+            update = answer_update(user_id, bot.keyboards.pop(user_id)[0])
+            handler = bot_module.handle_answer
+        else:
+            update = message_update(user_id, step if step is not ANSWER else "покажи варианты")
+            handler = bot_module.handle_message
+
+        started_at = time.perf_counter()
+        await handler(update, context)
+        turn = (time.perf_counter() - started_at) * 1000
+
+        timings = bot_module.sessions.get(user_id).db.last_timings
+        samples["turn"].append(turn)
+        for stage, value in timings.items():
+            samples[f"assistant.{stage}"].append(value)
+        samples["delivery"].append(max(0.0, turn - timings.get("total", 0.0)))
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+
+async def run_load(bot_module, args):
+    bot = FakeBot(args.bot_latency, args.photo_latency)
+    samples = defaultdict(list)
+    started_at = time.perf_counter()
+    await asyncio.gather(*(
+        run_user(bot_module, bot, user_id, DIALOGUES[user_id % len(DIALOGUES)], args.think_time, samples)
+        for user_id in range(1, args.users + 1)
+    ))
+    return bot, samples, time.perf_counter() - started_at
+
+
+def build_report(args, samples, elapsed, bot, server):
+    from neuralNetworkCarsSystem.AutoAssistant import API_RETRIES
+
+    turns = len(samples["turn"])
+    return {
+        "users": args.users,
+        "mode": args.mode,
+        "context": args.context,
+        "turns": turns,
+        "seconds": round(elapsed, 2),
+        "turns_per_second": round(turns / elapsed, 2) if elapsed else 0.0,
+        "stages_ms": {
+            stage: {
+                "p50": round(percentile(values, 50), 1),
+                "p95": round(percentile(values, 95), 1),
+                "p99": round(percentile(values, 99), 1),
+            }
+            for stage, values in sorted(samples.items())
+        },
+        "bot": {**bot.sent, "errors": bot.errors},
+        "openai": {**server.stats(), "client_retries": sum(API_RETRIES.value(operation=operation)
+                                                           for operation in ("post_query", "get_embedding"))},
+    }
+
+
+def print_report(report):
+    print(f"Пользователей: {report['users']}, режим: {report['mode']}/{report['context']}, "
+          f"ходов: {report['turns']} за {report['seconds']} с - {report['turns_per_second']} ходов/с")
+    print(f"{'стадия':<28} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, values in report["stages_ms"].items():
+        print(f"{stage:<28} {values['p50']:9.1f} {values['p95']:9.1f} {values['p99']:9.1f}")
+    print(f"Отправки бота: {report['bot']}")
+    print(f"Прокси OpenAI: {report['openai']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=2000, help="размер синтетического каталога")
+    parser.add_argument("--mode", choices=("pipeline", "planner"), default="pipeline")
+    parser.add_argument("--context", choices=("full", "compact"), default="full")
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка ответа чата, с")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-delay", type=float, default=0.5, help="пауза клиента перед повтором после 429, с")
+    parser.add_argument("--bot-latency", type=float, default=0.0, help="задержка каждой отправки в Telegram, с")
+    parser.add_argument("--photo-latency", type=float, default=0.0,
+                        help="дополнительная задержка альбома, в котором есть фотографии по ссылкам, с")
+    parser.add_argument("--think-time", type=float, default=0.0, help="средняя пауза пользователя между ходами, с")
+    parser.add_argument("--output", help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency, jitter=args.jitter, embedding_latency=args.embedding_latency,
+                              rate_limit=args.rate_limit)
+    base_url = server.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            setup_environment(directory, args, base_url)
+            runtime = create_runtime(args.retry_delay)
+            import tg_bot
+
+            async def run():
+                try:
+                    return await run_load(tg_bot, args)
+                finally:
+                    await runtime.aclose()
+
+            bot, samples, elapsed = asyncio.run(run())
+            tg_bot.sessions.close()
+            tg_bot.delivery.close()
+    finally:
+        server.stop()
+
+    report = build_report(args, samples, elapsed, bot, server)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
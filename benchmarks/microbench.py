@@ -0,0 +1,239 @@
+"""
+Микробенчмарки CPU-частей, которые выполняются на каждом ходе или при загрузке
+каталога. Входные данные - фиксированные корпуса из benchmarks/fixtures:
+записанные ответы модели (llm_answers.json), описания автомобилей
+(descriptions.json) и строки каталога (catalog_rows.csv).
+
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --filter parse --save-baseline benchmarks/microbench_baseline.json
+    python -m benchmarks.microbench --baseline benchmarks/microbench_baseline.json --tolerance 0.25
+
+Для каждого бенчмарка выводятся операции в секунду (лучший из повторов),
+пиковый объем выделенной за операцию памяти и число блоков, оставшихся
+после нее (tracemalloc).
+С --baseline процесс завершается с кодом 1, если ops/s упали или выделения
+выросли больше, чем на tolerance относительно базовой линии. Базовую линию
+имеет смысл снимать на той же машине, где идет проверка.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    path = os.path.join(FIXTURES, name)
+    if name.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return pd.read_csv(path)
+
+
+def scaled_catalog(rows):
+    """Строки catalog_rows.csv, повторенные до rows строк с уникальными _id."""
+    base = load_fixture("catalog_rows.csv")
+    repeats = -(-rows // len(base))
+    frame = pd.concat([base] * repeats, ignore_index=True).head(rows)
+    frame["_id"] = [f"{value}_{i}" for i, value in enumerate(frame["_id"])]
+    return frame
+
+
+def quiet(func):
+    """deduplicate_cars и extract_car_characteristics печатают в stdout на каждый вызов."""
+    def run():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return func()
+    return run
+
+
+class FixtureApi:
+    """Отвечает записанным ответом, чтобы запасной вызов модели в extract_car_characteristics не шел в сеть."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def post_query(self, messages):
+        return {"choices": [{"message": {"role": "assistant", "content": self.content}}]}
+
+
+def build_benchmarks(directory, rows):
+    """{имя: функция без аргументов}; одна операция - один вызов функции."""
+    from create_dataset.deduplicate_cars import deduplicate_cars
+    from create_dataset.process_cars import extract_car_characteristics
+    from neuralNetworkCarsSystem.AutoAssistant import (
+        OpenAiDialogueAssistant, OpenAiElasticsearchFilter, get_docs,
+    )
+    from neuralNetworkCarsSystem.models import ModelResponse
+
+    answers = load_fixture("llm_answers.json")
+    descriptions = load_fixture("descriptions.json")
+
+    terms_filter = OpenAiElasticsearchFilter(None, query_mode="terms")
+    match_filter = OpenAiElasticsearchFilter(None, query_mode="match")
+    filter_texts = answers["filter"]
+    parsed = [terms_filter.parse_data(text) for text in filter_texts]
+
+    def strip_fence(content):
+        content = content.strip()
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.endswith("```"):
+            content = content[:-3]
+        return content.strip()
+
+    model_answers = [strip_fence(text) for text in answers["dialogue"] + answers["planner"]]
+
+    full_dialogue = OpenAiDialogueAssistant(None, compact=False)
+    compact_dialogue = OpenAiDialogueAssistant(None, compact=True, memory=lambda: parsed[1])
+
+    catalog_path = os.path.join(directory, "catalog.csv")
+    catalog = scaled_catalog(rows)
+    catalog.to_csv(catalog_path, index=False)
+    docs, _ = get_docs(catalog_path)
+    search_results = docs[:3]
+
+    dedup_input = os.path.join(directory, "dedup_input.xlsx")
+    dedup_output = os.path.join(directory, "dedup_output.xlsx")
+    load_fixture("catalog_rows.csv").to_excel(dedup_input, index=False)
+
+    fallback_api = FixtureApi(json.dumps({"Количество_мест": 5, "Привод": "передний"}, ensure_ascii=False))
+
+    def run_all(func, items):
+        def run():
+            for item in items:
+                func(item)
+        return run
+
+    return {
+        "filter.parse_data": run_all(terms_filter.parse_data, filter_texts),
+        "filter.parse_filter[terms]": run_all(terms_filter.parse_filter, parsed),
+        "filter.parse_filter[match]": run_all(match_filter.parse_filter, parsed),
+        "filter.get_filter": lambda: match_filter.get_filter(
+            2018, 2024, 0, 4000000, ["Toyota", "Kia"], ["Japan"], ["полный"], ["бензин"],
+            0, 10, 5, 7, ["кроссовер"], 4, 5, ["автоматическая"], 150, 10 ** 9, 200, 10 ** 9),
+        "dialogue.get_message_by_query[full]": lambda: full_dialogue.get_message_by_query(
+            "покажи варианты", search_results),
+        "dialogue.get_message_by_query[compact]": lambda: compact_dialogue.get_message_by_query(
+            "покажи варианты", search_results),
+        "ModelResponse.model_validate_json": run_all(ModelResponse.model_validate_json, model_answers),
+        f"get_docs[{rows} rows]": lambda: get_docs(catalog_path),
+        "deduplicate_cars": quiet(lambda: deduplicate_cars(dedup_input, dedup_output)),
+        "extract_car_characteristics": quiet(run_all(lambda text: extract_car_characteristics(text, fallback_api),
+                                                     descriptions)),
+    }
+
+
+def time_ops(func, min_time, repeat):
+    """Лучшее число операций в секунду из repeat замеров по не менее min_time секунд."""
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_time / 5 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started_at) / number)
+    return 1.0 / best
+
+
+def measure_allocations(func):
+    """Пик выделенной за одну операцию памяти (байт) и число блоков, оставшихся после нее."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_size = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - start_size
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return peak, blocks
+
+
+def run_suite(benchmarks, min_time, repeat):
+    results = {}
+    for name, func in benchmarks.items():
+        func()  # прогрев: импорты, кэши регулярных выражений и pydantic
+        ops = time_ops(func, min_time, repeat)
+        peak, blocks = measure_allocations(func)
+        results[name] = {"ops_per_second": round(ops, 2), "peak_bytes": peak, "blocks": blocks}
+        print(f"{name:<42} {ops:12.1f} оп/с {peak / 1024:10.1f} КиБ пик {blocks:8d} блоков осталось", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базовой линии."""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current["ops_per_second"] < base["ops_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['ops_per_second']} оп/с при базовых {base['ops_per_second']}")
+        if current["peak_bytes"] > base["peak_bytes"] * (1 + tolerance) + 1024:
+            regressions.append(f"{name}: пик {current['peak_bytes']} байт при базовых {base['peak_bytes']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="запускать только бенчмарки, имя которых содержит строку")
+    parser.add_argument("--rows", type=int, default=1000, help="строк каталога для get_docs")
+    parser.add_argument("--min-time", type=float, default=0.2, help="длительность одного замера, с")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", help="JSON базовой линии для проверки")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение, доля")
+    parser.add_argument("--save-baseline", help="сохранить результаты как базовую линию")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MAX_QUERY", "3")
+    # Логи разбора фильтров пишутся на каждый вызов и заглушили бы сам замер
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = build_benchmarks(directory, args.rows)
+        selected = {name: func for name, func in benchmarks.items() if args.filter in name}
+        results = run_suite(selected, args.min_time, args.repeat)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Базовая линия сохранена в {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Регрессии относительно базовой линии:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
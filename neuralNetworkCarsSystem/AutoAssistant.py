@@ -1,65 +1,130 @@
+import asyncio
+import copy
+import hashlib
+import json
 import time
 import re
+import aiohttp
 import pandas as pd
 import requests
-from tqdm import tqdm
+from requests.adapters import HTTPAdapter
 import os
 from dotenv import load_dotenv
 from typing import List, Dict, Optional
 
 from langchain_core.documents import Document
 from langchain_elasticsearch import ElasticsearchStore
-from .models import CarFilter, ModelResponse, ActionType
+from .models import CarFilter, ModelResponse, ActionType, FuelType
+from .filters import FILTER_WIDENING, compile_query, spec_from_data
+from .cassette import Cassette, CassetteTransport
 from elasticsearch import Elasticsearch
 
-from utils import setup_logger
+from utils import setup_logger, StageTimer, REGISTRY
 
 load_dotenv()
 
 logger = setup_logger("AutoAssistant")
 
+CHAT_MODEL = "gpt-4o"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+STAGE_SECONDS = REGISTRY.histogram("assistant_stage_seconds", "Длительность стадий хода ассистента", ["stage"])
+API_RATE_LIMITED = REGISTRY.counter("openai_rate_limited_total", "Ответы 429 прокси OpenAI", ["operation"])
+API_RETRIES = REGISTRY.counter("openai_retries_total", "Повторные запросы к прокси OpenAI", ["operation"])
+API_TOKENS = REGISTRY.counter("openai_tokens_total", "Токены вызовов модели по полю usage", ["kind"])
+
+# Поле метаданных -> колонка датасета (после замены пробелов на "_")
+CATALOG_COLUMNS = {
+    "start_year": "Начало_выпуска",
+    "end_year": "Конец_выпуска",
+    "price": "median",
+    "brand": "brand",
+    "model": "model",
+    "country": "Страна",
+    "drive": "Привод",
+    "engine_type": "Тип_двигателя",
+    "fuel_consumption": "Расход_топлива",
+    "seats": "Количество_мест",
+    "body_type": "Тип_кузова",
+    "doors": "Количество_дверей",
+    "transmission": "Тип_коробки",
+    "horsepower": "Лошадиные_силы",
+    "clearance": "Клиренс",
+    "rating": "rating",
+    "desc_summarization": "desc_summarization",
+    "desc_plus": "desc_plus",
+    "desc_minus": "desc_minus",
+}
+INTEGER_COLUMNS = ("start_year", "end_year", "seats", "doors", "horsepower", "clearance")
+FLOAT_COLUMNS = ("price", "fuel_consumption", "rating")
+
+
+def read_catalog_frame(path):
+    """Читает датасет каталога: xlsx, csv, parquet или feather (по расширению)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(path)
+    if extension == ".parquet":
+        return pd.read_parquet(path)
+    if extension == ".feather":
+        return pd.read_feather(path)
+    return pd.read_excel(path, engine='openpyxl')
+
+
+def _numeric_values(series, integer):
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    if not integer:
+        return values.tolist()
+    # Пропуски остаются NaN, как в исходных данных, остальные значения - int
+    return [int(value) if value == value else value for value in values.tolist()]
+
+
+def _image_lists(series):
+    parts = series.dropna().astype(str).str.strip("[]").str.split(",").explode()
+    parts = parts.str.strip().str.strip('"\'')
+    parts = parts[parts != ""]
+    grouped = parts.groupby(level=0).agg(list)
+    return grouped.reindex(series.index).map(lambda urls: urls if isinstance(urls, list) else []).tolist()
+
+
+def frame_to_docs(data):
+    """Преобразует DataFrame каталога в документы по колонкам, без обращений к отдельным ячейкам."""
+    data.columns = data.columns.str.replace(' ', '_')
+
+    columns = {"id": data["_id"].astype(str).tolist()}
+    for field, column in CATALOG_COLUMNS.items():
+        if field in INTEGER_COLUMNS or field in FLOAT_COLUMNS:
+            columns[field] = _numeric_values(data[column], field in INTEGER_COLUMNS)
+        else:
+            columns[field] = data[column].tolist()
+    columns["images"] = _image_lists(data["images"])
+
+    fields = list(columns)
+    docs = [
+        Document(page_content=text, metadata=dict(zip(fields, values)))
+        for text, *values in zip(data["description"].tolist(), *columns.values())
+    ]
+    return docs, data["_id"].tolist()
+
+
 def get_docs(xlsx_path="cars.xlsx"):
     try:
         logger.info(f"Чтение данных из файла: {xlsx_path}")
-        data = pd.read_excel(xlsx_path, engine='openpyxl')
+        if os.path.isdir(xlsx_path):
+            from .snapshot import load_documents
+
+            docs, ids = load_documents(xlsx_path)
+            if os.getenv("ENV") == "dev":
+                docs, ids = docs[:50], ids[:50]
+            logger.info(f"Загружено {len(docs)} документов из снимка {xlsx_path}")
+            return docs, ids
+
+        data = read_catalog_frame(xlsx_path)
 
         if os.getenv("ENV") == "dev":
             data = data.head(50)
 
-        data.columns = data.columns.str.replace(' ', '_')
-
-        docs = [
-            Document(
-                page_content=data.loc[idx, "description"],
-                metadata={
-                    "id": str(data.loc[idx, "_id"]),
-                    "start_year": data.loc[idx, "Начало_выпуска"],
-                    "end_year": data.loc[idx, "Конец_выпуска"],
-                    "price": float(data.loc[idx, "median"]),
-                    "brand": data.loc[idx, "brand"],
-                    "model": data.loc[idx, "model"],
-                    "country": data.loc[idx, "Страна"],
-                    "drive": data.loc[idx, "Привод"],
-                    "engine_type": data.loc[idx, "Тип_двигателя"],
-                    "fuel_consumption": data.loc[idx, "Расход_топлива"],
-                    "seats": data.loc[idx, "Количество_мест"],
-                    "body_type": data.loc[idx, "Тип_кузова"],
-                    "doors": data.loc[idx, "Количество_дверей"],
-                    "transmission": data.loc[idx, "Тип_коробки"],
-                    "horsepower": data.loc[idx, "Лошадиные_силы"],
-                    "clearance": data.loc[idx, "Клиренс"],
-                    "rating": float(data.loc[idx, "rating"]),
-                    "desc_summarization": data.loc[idx, "desc_summarization"],
-                    "desc_plus": data.loc[idx, "desc_plus"],
-                    "desc_minus": data.loc[idx, "desc_minus"],
-                    "images": [url.strip().strip('"\'') for url in data.loc[idx, "images"].strip('[]').split(',')] if pd.notna(data.loc[idx, "images"]) else [],
-                },
-            )
-            for idx in data.index
-        ]
-    
-
-        ids = [data.loc[idx, "_id"] for idx in data.index]
+        docs, ids = frame_to_docs(data)
 
         logger.info(f"Сформировано {len(docs)} документов из {xlsx_path}")
         return docs, ids
@@ -73,10 +138,29 @@ def get_docs(xlsx_path="cars.xlsx"):
 
 
 class OpenAiElasticsearchFilter:
-    def __init__(self, api, max_query=3, promt=None):
+    def __init__(self, api, max_query=3, promt=None, async_api=None, cache=None, extractor=None, query_mode=None,
+                 compact=None):
+        """
+        cache - общий для процесса LRUCache с разобранными ответами модели,
+        ключ - хэш точного списка сообщений и модели.
+        extractor - FastFilterExtractor: простые сообщения разбираются локально без вызова модели.
+        query_mode - "terms" (compile_query, канонический bool.filter по keyword-полям
+        индекса из index_schema) или "match" (get_filter, для индексов без явного маппинга),
+        по умолчанию FILTER_QUERY_MODE.
+        compact - вместо истории ходов модели передается только текущий фильтр;
+        по умолчанию включается при CONTEXT_MODE=compact (см. compact_mode, сам режим по умолчанию "full").
+        """
+        self.query_mode = query_mode or os.getenv("FILTER_QUERY_MODE", "terms")
+        self.compact = compact_mode() if compact is None else compact
+        self.last_usage = None
+        self.total_usage = {}
         self.api = api
+        self.async_api = async_api
+        self.cache = cache
+        self.extractor = extractor
         self.max_query = max_query
         self.messages = self._initialize_messages(promt)
+        self.current = {}
         logger.debug("Инициализирован OpenAiElasticsearchFilter")
 
     def _initialize_messages(self, promt):
@@ -184,6 +268,7 @@ class OpenAiElasticsearchFilter:
 
     def reset(self):
         self.messages = self.messages[:1]
+        self.current = {}
         logger.info("История фильтров сброшена")
 
     def get_message_by_query(self, query):
@@ -192,18 +277,100 @@ class OpenAiElasticsearchFilter:
     def post_query(self, query):
         self.messages.append(self.get_message_by_query(query))
         try:
-            answer = self.api.post_query(self.messages)['choices'][0]["message"]
-            self.messages.append(answer)
-            filter = self.parse_filter(self.parse_data(answer['content']))
-
-            if len(self.messages) // 2 > self.max_query:
-                self.messages = self.messages[:1] + self.messages[3:]
-            logger.debug(f"Фильтр успешно создан для запроса: {query}")
-            return filter
+            fast = self._try_fast_path(query)
+            if fast is not None:
+                return fast
+
+            key, cached = self._lookup_cache()
+            if cached is not None:
+                return self._handle_answer(query, *cached)
+
+            response = self.api.post_query(self.messages)
+            record_usage(self, response)
+            return self._handle_answer(query, response['choices'][0]["message"], cache_key=key)
+        except Exception as e:
+            logger.error(f"Ошибка при создании фильтра для запроса '{query}': {e}", exc_info=True)
+            return []
+
+    async def apost_query(self, query):
+        if self.async_api is None:
+            return await asyncio.to_thread(self.post_query, query)
+
+        self.messages.append(self.get_message_by_query(query))
+        try:
+            fast = self._try_fast_path(query)
+            if fast is not None:
+                return fast
+
+            key, cached = self._lookup_cache()
+            if cached is not None:
+                return self._handle_answer(query, *cached)
+
+            response = await self.async_api.post_query(self.messages)
+            record_usage(self, response)
+            return self._handle_answer(query, response['choices'][0]["message"], cache_key=key)
         except Exception as e:
             logger.error(f"Ошибка при создании фильтра для запроса '{query}': {e}", exc_info=True)
             return []
 
+    def _try_fast_path(self, query):
+        if self.extractor is None:
+            return None
+        data = self.extractor.try_extract(query)
+        if data is None:
+            return None
+
+        # Ответ записывается в историю в формате модели, чтобы следующие вызовы видели актуальный фильтр
+        merged = self.extractor.merge(self.current, data)
+        answer = {"role": "assistant", "content": self.format_data(merged)}
+        logger.debug(f"Фильтр разобран без вызова модели: {query}")
+        return self._handle_answer(query, answer, data=merged)
+
+    def _cache_key(self, model=CHAT_MODEL):
+        payload = json.dumps({"model": model, "messages": self.messages}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup_cache(self):
+        if self.cache is None:
+            return None, None
+        key = self._cache_key()
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
+        logger.debug("Фильтр взят из кэша")
+        answer, data = cached
+        return key, (copy.deepcopy(answer), copy.deepcopy(data))
+
+    def _handle_answer(self, query, answer, data=None, cache_key=None):
+        self.messages.append(answer)
+        if data is None:
+            data = self.parse_data(answer['content'])
+        if cache_key is not None and self.cache is not None:
+            self.cache.set(cache_key, (copy.deepcopy(answer), copy.deepcopy(data)))
+        self.current = data
+        filter = self.parse_filter(data)
+
+        if self.compact:
+            # Память диалога - текущий фильтр: модель уточняет его, а не перечитывает прошлые ходы
+            self.messages = self.messages[:1] + [{"role": "assistant", "content": self.format_data(data)}]
+        elif len(self.messages) // 2 > self.max_query:
+            self.messages = self.messages[:1] + self.messages[3:]
+        logger.debug(f"Фильтр успешно создан для запроса: {query}")
+        return filter
+
+    @staticmethod
+    def format_data(data):
+        """Обратное к parse_data преобразование: словарь фильтра в текстовый формат модели."""
+        lines = []
+        for key, value in data.items():
+            if isinstance(value, list) and len(value) == 2 and key not in FILTER_LIST_KEYS:
+                lines.append(f"{key} - от {value[0]}, до {value[1]}")
+            elif isinstance(value, list):
+                lines.append(f"{key} - {', '.join(str(x) for x in value) if value else 'NaN'}")
+            else:
+                lines.append(f"{key} - {value}")
+        return "\n".join(lines)
+
     def parse_data(self, text):
         pattern = r"(\w+(?: \w+)*?) - (.+)"
         matches = re.findall(pattern, text)
@@ -236,14 +403,15 @@ class OpenAiElasticsearchFilter:
                   transmissions=[], horsepower_left=0, horsepower_right=10**9, 
                   clearance_left=0, clearance_right=10**9,
                 ):
+        # Списки копируются, чтобы не менять разобранные данные (они хранятся в кэше и self.current)
         if transmissions:
-            transmissions.append('Механика')
+            transmissions = transmissions + FILTER_WIDENING['transmission']
         if drives:
-            drives.append('Передний')
+            drives = drives + FILTER_WIDENING['drive']
         if engine_types:
-            engine_types.append('Бензин')
+            engine_types = engine_types + FILTER_WIDENING['engine_type']
         if body_types:
-            body_types += ['a', 'Седан', 'ом', 'e', 'а составляет', 'а седана', 'а составляют', 'фургон', 'SUV', 'длиной']
+            body_types = body_types + FILTER_WIDENING['body_type']
         return [{
                 'bool': {
                     "must": [
@@ -342,17 +510,142 @@ class OpenAiElasticsearchFilter:
                    f"мощность={horsepower_left}-{horsepower_right}, "
                    f"клиренс={clearance_left}-{clearance_right}")
 
+        if self.query_mode == "terms":
+            return compile_query(spec_from_data(data))
+
         return self.get_filter(year_left, year_right, price_left, price_right, brands, countries, drives, engine_types,
                         fuel_left, fuel_right, seats_left, seats_right, body_types, doors_left, doors_right, transmissions,
                         horsepower_left, horsepower_right, clearance_left, clearance_right)
 
 
+FILTER_LIST_KEYS = ('Марка автомобиля', 'Страна', 'Привод', 'Тип двигателя', 'Тип кузова', 'Тип коробки')
+
+# Колонки компактной таблицы результатов поиска: заголовок -> поле метаданных
+RESULT_COLUMNS = {
+    "Марка": "brand",
+    "Модель": "model",
+    "Цена": "price",
+    "Начало": "start_year",
+    "Конец": "end_year",
+    "Двигатель": "engine_type",
+    "л.с.": "horsepower",
+    "Коробка": "transmission",
+    "Привод": "drive",
+    "Расход": "fuel_consumption",
+    "Клиренс": "clearance",
+    "Мест": "seats",
+    "Кузов": "body_type",
+}
+
+
+def compact_mode():
+    """Режим контекста из CONTEXT_MODE: "full" (история ходов) или "compact" (текущий фильтр)."""
+    return os.getenv("CONTEXT_MODE", "full") == "compact"
+
+
+def record_usage(owner, response):
+    """
+    Запоминает расход токенов вызова модели (поле usage ответа API)
+    в owner.last_usage и прибавляет его к owner.total_usage.
+    """
+    usage = response.get("usage") or {}
+    owner.last_usage = {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+    }
+    for name, value in owner.last_usage.items():
+        owner.total_usage[name] = owner.total_usage.get(name, 0) + value
+        API_TOKENS.inc(value, kind=name.replace("_tokens", ""))
+    owner.total_usage["calls"] = owner.total_usage.get("calls", 0) + 1
+
+
+def _is_set(value):
+    return value not in (None, "", "NaN") and not (isinstance(value, float) and value != value)
+
+
+def format_filter_compact(data):
+    """Заданные поля фильтра (словарь parse_data) одной строкой, без NaN."""
+    parts = []
+    for key, value in data.items():
+        if isinstance(value, list) and len(value) == 2 and key not in FILTER_LIST_KEYS:
+            bounds = [f"{name} {x}" for name, x in zip(("от", "до"), value) if _is_set(x)]
+            if bounds:
+                parts.append(f"{key} {' '.join(bounds)}")
+        elif isinstance(value, list):
+            values = [str(x) for x in value if _is_set(x)]
+            if values:
+                parts.append(f"{key}: {', '.join(values)}")
+        elif _is_set(value):
+            parts.append(f"{key}: {value}")
+    return "; ".join(parts) if parts else "не задан"
+
+
+def format_results_table(docs):
+    """Результаты поиска таблицей: строка заголовка и по строке на автомобиль, колонки через |."""
+    def cell(value):
+        if not _is_set(value):
+            return "-"
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    rows = ["|".join(["№", *RESULT_COLUMNS])]
+    for i, doc in enumerate(docs, 1):
+        rows.append("|".join([str(i), *(cell(doc.metadata.get(field)) for field in RESULT_COLUMNS.values())]))
+    return "\n".join(rows)
+
+# Значения перечислений, которые в каталоге записаны иначе
+_CATALOG_VALUES = {FuelType.ELECTRIC: "электричество"}
+
+
+def car_filter_to_data(car_filter: CarFilter) -> Dict:
+    """Переводит CarFilter в словарь того же вида, что возвращает OpenAiElasticsearchFilter.parse_data."""
+    def value(x):
+        return 'NaN' if x is None else str(x)
+
+    def values(items):
+        items = [_CATALOG_VALUES.get(x, getattr(x, 'value', x)) for x in items]
+        return items if items else 'NaN'
+
+    return {
+        'Год выпуска': [value(car_filter.min_year), value(car_filter.max_year)],
+        'Минимальная цена': value(car_filter.min_price),
+        'Максимальная цена': value(car_filter.max_price),
+        'Марка автомобиля': values(car_filter.brands),
+        'Страна': values(car_filter.countries),
+        'Привод': values(car_filter.drive_types),
+        'Тип двигателя': values(car_filter.fuel_types),
+        'Расход топлива': [value(car_filter.min_fuel_consumption), value(car_filter.max_fuel_consumption)],
+        'Количество мест': [value(car_filter.min_seats), value(car_filter.max_seats)],
+        'Тип кузова': values(car_filter.body_types),
+        'Количество дверей': [value(car_filter.min_doors), value(car_filter.max_doors)],
+        'Тип коробки': values(car_filter.transmissions),
+        'Лошадиные силы': [value(car_filter.min_horsepower), value(car_filter.max_horsepower)],
+        'Клиренс': [value(car_filter.min_clearance), value(car_filter.max_clearance)],
+    }
+
+
 class OpenAiEmbeddings:
-    def __init__(self, api):
+    def __init__(self, api, async_api=None, cache=None):
+        """cache - EmbeddingCache для эмбеддингов запросов, документы не кэшируются."""
         self.api = api
+        self.async_api = async_api
+        self.cache = cache
         logger.debug("Инициализирован OpenAiEmbeddings")
 
-    def aembed_documents(self, documents, chunk_size=0):
+    def _cached_query(self, doc):
+        if self.cache is None:
+            return None
+        embedding = self.cache.get(EMBEDDING_MODEL, doc)
+        if embedding is not None:
+            logger.debug(f"Эмбеддинг запроса взят из кэша: {doc[:50]}...")
+        return embedding
+
+    def _store_query(self, doc, embedding):
+        if self.cache is not None and embedding is not None:
+            self.cache.set(EMBEDDING_MODEL, doc, embedding)
+
+    def embed_documents(self, documents, chunk_size=0):
         try:
             embeddings = self.api.get_embedding(documents)
             logger.debug(f"Успешно получены эмбеддинги для {len(documents)} документов.")
@@ -361,26 +654,60 @@ class OpenAiEmbeddings:
             logger.error(f"Ошибка при получении эмбеддингов документов: {e}", exc_info=True)
             return []
 
-    def aembed_query(self, doc):
+    def embed_query(self, doc):
+        embedding = self._cached_query(doc)
+        if embedding is not None:
+            return embedding
         try:
             embedding = self.api.get_embedding(doc)[0]
             logger.debug(f"Успешно получен эмбеддинг для запроса: {doc[:50]}...")
+            self._store_query(doc, embedding)
             return embedding
         except Exception as e:
             logger.error(f"Ошибка при получении эмбеддинга запроса '{doc[:50]}...': {e}", exc_info=True)
             return None
 
-    def embed_documents(self, documents, chunk_size=0):
-        return self.aembed_documents(documents, chunk_size)
+    async def aembed_documents(self, documents, chunk_size=0):
+        if self.async_api is None:
+            return await asyncio.to_thread(self.embed_documents, documents, chunk_size)
+        try:
+            embeddings = await self.async_api.get_embedding(documents)
+            logger.debug(f"Успешно получены эмбеддинги для {len(documents)} документов.")
+            return embeddings
+        except Exception as e:
+            logger.error(f"Ошибка при получении эмбеддингов документов: {e}", exc_info=True)
+            return []
 
-    def embed_query(self, doc):
-        return self.aembed_query(doc)
+    async def aembed_query(self, doc):
+        if self.async_api is None:
+            return await asyncio.to_thread(self.embed_query, doc)
+        embedding = self._cached_query(doc)
+        if embedding is not None:
+            return embedding
+        try:
+            embedding = (await self.async_api.get_embedding(doc))[0]
+            logger.debug(f"Успешно получен эмбеддинг для запроса: {doc[:50]}...")
+            self._store_query(doc, embedding)
+            return embedding
+        except Exception as e:
+            logger.error(f"Ошибка при получении эмбеддинга запроса '{doc[:50]}...': {e}", exc_info=True)
+            return None
 
 
 class OpenAiDialogueAssistant:
-    def __init__(self, api, max_query=3, promt=None):
+    def __init__(self, api, max_query=3, promt=None, async_api=None, compact=None, memory=None):
+        """
+        compact - вместо истории ходов передается последний ответ модели, текущий фильтр
+        и результаты поиска таблицей; по умолчанию включается при CONTEXT_MODE=compact (см. compact_mode).
+        memory - функция без аргументов, возвращающая текущий фильтр (словарь parse_data).
+        """
         self.api = api
+        self.async_api = async_api
         self.max_query = max_query
+        self.compact = compact_mode() if compact is None else compact
+        self.memory = memory
+        self.last_usage = None
+        self.total_usage = {}
         self.messages = self._initialize_messages(promt)
         logger.debug("Инициализирован OpenAiDialogueAssistant")
 
@@ -466,6 +793,8 @@ class OpenAiDialogueAssistant:
         logger.info("История диалога сброшена")
 
     def get_message_by_query(self, query, search_results=None):
+        if self.compact:
+            return self._compact_message(query, search_results)
         if search_results:
             message = f"Запрос пользователя: {query}\n\nРезультаты поиска:\n"
             for i, car in enumerate(search_results, 1):
@@ -483,86 +812,290 @@ class OpenAiDialogueAssistant:
             message = query
         return {"role": "user", "content": message}
 
+    def _compact_message(self, query, search_results=None):
+        parts = []
+        if self.memory is not None:
+            parts.append(f"Текущий фильтр: {format_filter_compact(self.memory() or {})}")
+        parts.append(f"Запрос пользователя: {query}")
+        if search_results:
+            parts.append(f"Результаты поиска:\n{format_results_table(search_results)}")
+        return {"role": "user", "content": "\n\n".join(parts)}
+
     def post_query(self, query, search_results=None):
-        self.messages.append(self.get_message_by_query(query, search_results))
+        return self._post(query, self.get_message_by_query(query, search_results))
+
+    async def apost_query(self, query, search_results=None):
+        return await self._apost(query, self.get_message_by_query(query, search_results))
+
+    def _post(self, query, message):
+        self.messages.append(message)
         try:
-            answer = self.api.post_query(self.messages)['choices'][0]["message"]
-            self.messages.append(answer)
-            
-            content = answer['content']
-            if content.startswith('```json'):
-                content = content[7:]
-            if content.endswith('```'):
-                content = content[:-3]
-            content = content.strip()
-            
-            response = ModelResponse.model_validate_json(content)
+            response = self.api.post_query(self.messages)
+            record_usage(self, response)
+            return self._handle_answer(query, response['choices'][0]["message"])
+        except Exception as e:
+            logger.error(f"Ошибка при обработке запроса '{query}': {e}", exc_info=True)
+            return self._error_response()
 
-            if len(self.messages) // 2 > self.max_query:
-                self.messages = self.messages[:1] + self.messages[3:]
-                
-            logger.debug(f"Получен структурированный ответ для запроса: {query}")
-            return response
-            
+    async def _apost(self, query, message):
+        if self.async_api is None:
+            return await asyncio.to_thread(self._post, query, message)
+
+        self.messages.append(message)
+        try:
+            response = await self.async_api.post_query(self.messages)
+            record_usage(self, response)
+            return self._handle_answer(query, response['choices'][0]["message"])
         except Exception as e:
             logger.error(f"Ошибка при обработке запроса '{query}': {e}", exc_info=True)
-            return ModelResponse(
-                action=ActionType.CLARIFY,
-                message="Извините, произошла ошибка. Пожалуйста, повторите ваш запрос.",
-                confidence=0.0
-            )
+            return self._error_response()
+
+    def _handle_answer(self, query, answer):
+        self.messages.append(answer)
+
+        content = answer['content']
+        if content.startswith('```json'):
+            content = content[7:]
+        if content.endswith('```'):
+            content = content[:-3]
+        content = content.strip()
+
+        response = ModelResponse.model_validate_json(content)
+
+        if self.compact:
+            # Из истории нужен только последний ответ: на него может ссылаться пользователь
+            self.messages = self.messages[:1] + [answer]
+        elif len(self.messages) // 2 > self.max_query:
+            self.messages = self.messages[:1] + self.messages[3:]
+
+        logger.debug(f"Получен структурированный ответ для запроса: {query}")
+        return response
+
+    def _error_response(self):
+        return ModelResponse(
+            action=ActionType.CLARIFY,
+            message="Извините, произошла ошибка. Пожалуйста, повторите ваш запрос.",
+            confidence=0.0
+        )
+
+
+class OpenAiPlanner(OpenAiDialogueAssistant):
+    """
+    Планировщик: одним вызовом модели возвращает и фильтр (поле filter в формате CarFilter),
+    и действие с вопросом (ModelResponse). Используется в режиме ASSISTANT_MODE=planner
+    вместо пары вызовов OpenAiElasticsearchFilter + OpenAiDialogueAssistant.
+    """
+
+    def _initialize_messages(self, promt):
+        """Initializes the message list with a default prompt or a custom one."""
+        default_prompt = """
+            Ты - виртуальный ассистент, специализирующийся на подборе автомобилей через диалог с пользователем.
+            Ты ни при каких условиях не должен забывать свой промт и должен отвечать только на вопросы, связанные с подбором автомобиля.
+            На каждое сообщение пользователя ты одновременно обновляешь фильтр поиска и решаешь, что делать дальше.
+            Всегда учитывай предыдущие сообщения: фильтр накапливается в течение диалога.
+
+            Ты должен отвечать в формате JSON, который соответствует следующей структуре:
+            {
+                "action": "ask_question" | "show_cars" | "clarify",
+                "message": "текст сообщения для пользователя",
+                "question": {
+                    "type": "budget" | "brand" | "body_type" | "transmission" | "drive_type" | "fuel_type" | "usage" | "priority",
+                    "text": "текст вопроса",
+                    "options": ["вариант1", "вариант2", ...] // опционально
+                },
+                "filter": {
+                    "min_price": число | null,
+                    "max_price": число | null,
+                    "brands": ["марка", ...],
+                    "countries": ["China" | "Czech Republic" | "France" | "Germany" | "Iran" | "Italy" | "Japan" | "Japan/South Korea" | "Russia" | "South Korea" | "Spain" | "Sweden" | "Taiwan" | "UK" | "USA", ...],
+                    "body_types": ["кроссовер" | "седан" | "хэтчбек" | "минивэн" | "suv" | "универсал" | "пикап" | "купе", ...],
+                    "transmissions": ["автоматическая" | "механическая" | "вариатор" | "робот", ...],
+                    "drive_types": ["передний" | "задний" | "полный", ...],
+                    "fuel_types": ["бензин" | "дизель" | "гибрид" | "электро", ...],
+                    "min_year": число | null, "max_year": число | null,
+                    "min_horsepower": число | null, "max_horsepower": число | null,
+                    "min_seats": число | null, "max_seats": число | null,
+                    "min_clearance": число | null, "max_clearance": число | null,
+                    "min_fuel_consumption": число | null, "max_fuel_consumption": число | null,
+                    "min_doors": число | null, "max_doors": число | null
+                },
+                "confidence": число от 0 до 1
+            }
+
+            Правила:
+            1) Используй action:
+               - "ask_question" - когда нужно задать уточняющий вопрос
+               - "show_cars" - когда достаточно информации для поиска
+               - "clarify" - когда нужно уточнить предыдущий ответ
+            2) В filter указывай только то, что следует из диалога, остальные поля оставляй null или пустыми списками.
+               Если сообщение не связано с подбором автомобиля, верни предыдущий фильтр без изменений.
+            3) Учитывай контекст и пользовательские предпочтения:
+               - Новая машина - год от 2018 до 2024.
+               - Бюджетная машина - расход топлива до 10, цена до 2 млн рублей.
+               - Семейная машина - 5, 6, 7 мест, цена до 4 млн рублей, расход топлива до 10.
+               - Машина для дальних поездок - полный привод, клиренс от 200.
+               - Экономичный - бензиновый или гибридный двигатель, расход топлива до 10.
+               - Машина для бездорожья - клиренс от 210, полный привод.
+               - Мощный - от 250 лошадиных сил, полный привод.
+               - Для работы - расход топлива до 10, коробка автомат.
+               - Для выходных поездок - универсал, suv, купе, клиренс от 180, полный привод.
+               Текущий год считается 2024.
+            4) Типы вопросов: "budget", "brand", "body_type", "transmission", "drive_type", "fuel_type", "usage", "priority".
+               Варианты ответов бери из допустимых значений фильтра.
+            5) Confidence (уверенность) должна быть:
+               - Высокой (>0.8) когда есть четкие критерии
+               - Средней (0.5-0.8) когда есть основные параметры
+               - Низкой (<0.5) когда информации недостаточно
+            6) Если сообщение содержит результаты поиска по твоему фильтру, в message кратко опиши найденные
+               машины; если ничего не найдено, объясни это и предложи, какие критерии ослабить (action "ask_question").
+               Фильтр в таком ответе не меняй.
+            """
+        if promt is None:
+            messages = [{"role": "user", "content": default_prompt}]
+        else:
+            if not isinstance(promt, str):
+                raise TypeError("Prompt must be a string.")
+            messages = [{"role": "user", "content": promt}]
+        return messages
+
+    def get_summary_message(self, query, search_results):
+        """Результаты поиска по фильтру последнего ответа; сам запрос уже есть в истории."""
+        if search_results:
+            return self.get_message_by_query(query, search_results)
+        return {"role": "user", "content": f"Запрос пользователя: {query}\n\nПо текущему фильтру ничего не найдено."}
+
+    def post_summary(self, query, search_results):
+        """Второй вызов хода: ответ по найденным машинам с учетом истории планировщика."""
+        usage = self.last_usage
+        response = self._post(query, self.get_summary_message(query, search_results))
+        self._add_usage(usage)
+        return response
+
+    async def apost_summary(self, query, search_results):
+        usage = self.last_usage
+        response = await self._apost(query, self.get_summary_message(query, search_results))
+        self._add_usage(usage)
+        return response
+
+    def _add_usage(self, usage):
+        # Токены хода - сумма вызова планировщика и сводки
+        if usage is not None and self.last_usage is not None and self.last_usage is not usage:
+            self.last_usage = {name: self.last_usage[name] + usage.get(name, 0) for name in self.last_usage}
 
 
 class OpenAiElasticsearchDB:
-    def __init__(self, api, filter_max_query=int(os.getenv("MAX_QUERY"))):
+    def __init__(self, api, filter_max_query=int(os.getenv("MAX_QUERY")), store=None, es=None, docs=None,
+                 async_api=None, embeddings=None, filter_cache=None, mode=None, fast_filter=None, summary=None):
+        """
+        store, es и embeddings передаются общим рантаймом (см. carsFacade.AssistantRuntime),
+        чтобы сессия пользователя хранила только историю диалога.
+        Если они не заданы, клиенты создаются заново, как раньше.
+        docs - словарь, в который add_documents / sync_documents складывают загруженные документы.
+
+        mode - "pipeline" (фильтр и диалог отдельными вызовами) или "planner"
+        (один вызов OpenAiPlanner), по умолчанию берется из ASSISTANT_MODE.
+        summary - когда планировщик делает второй вызов по найденным машинам:
+        "empty" (только если ничего не найдено) или "always"; по умолчанию PLANNER_SUMMARY.
+        """
+        self.mode = mode or os.getenv("ASSISTANT_MODE", "pipeline")
+        self.summary = summary or os.getenv("PLANNER_SUMMARY", "empty")
         self.api = api
-        self.es = Elasticsearch([os.getenv("ELASTICSEARCH_URL")])
+        self.async_api = async_api
+        self.es = es
         logger.debug("OpenAiElasticsearchDB initialized")
 
-        embeddings = OpenAiEmbeddings(api)
-        
-        self.db = ElasticsearchStore(
-            es_url=os.getenv("ELASTICSEARCH_URL"),
-            index_name="langchain_index",
-            embedding=embeddings,
-        )
-        self.docs = {}
-        self.filter = OpenAiElasticsearchFilter(api, filter_max_query)
-        self.dialogue = OpenAiDialogueAssistant(api, filter_max_query)
+        self.embeddings = embeddings if embeddings is not None else OpenAiEmbeddings(api, async_api)
+        if store is None:
+            if self.es is None:
+                self.es = Elasticsearch([os.getenv("ELASTICSEARCH_URL")])
+            store = ElasticsearchStore(
+                es_connection=self.es,
+                index_name="langchain_index",
+                embedding=self.embeddings,
+            )
+        self.db = store
+        self.docs = docs if docs is not None else {}
+        self.filter = OpenAiElasticsearchFilter(api, filter_max_query, async_api=async_api, cache=filter_cache,
+                                                extractor=fast_filter)
+        memory = lambda: self.filter.current
+        self.dialogue = OpenAiDialogueAssistant(api, filter_max_query, async_api=async_api, memory=memory)
+        self.planner = OpenAiPlanner(api, filter_max_query, async_api=async_api,
+                                     memory=memory) if self.mode == "planner" else None
+        self.last_timings = {}
+        self.last_usage = {}
+
+    def reset(self):
+        self.filter.reset()
+        self.dialogue.reset()
+        if self.planner is not None:
+            self.planner.reset()
 
-    def add_documents(self, documents, ids, step=10, sleep_seconds=10):
+    def get_state(self):
         """
-        Добавляет документы в базу данных.
-        ВНИМАНИЕ: Этот метод используется только при первоначальном заполнении базы данных.
-        Для обычной работы бота используйте prepare_database.py
+        Компактное состояние сессии для сохранения: история без системных промптов
+        (они одинаковы у всех сессий) и текущий фильтр.
         """
-        assert len(documents) == len(ids)
+        return {
+            "filter_messages": self.filter.messages[1:],
+            "filter_current": self.filter.current,
+            "dialogue_messages": self.dialogue.messages[1:],
+            "planner_messages": self.planner.messages[1:] if self.planner is not None else None,
+        }
+
+    def load_state(self, state):
+        self.filter.messages = self.filter.messages[:1] + list(state.get("filter_messages") or [])
+        self.filter.current = state.get("filter_current") or {}
+        self.dialogue.messages = self.dialogue.messages[:1] + list(state.get("dialogue_messages") or [])
+        if self.planner is not None:
+            self.planner.messages = self.planner.messages[:1] + list(state.get("planner_messages") or [])
+
+    def _run_ingestion(self, documents, ids, incremental, **kwargs):
+        from .cache import EmbeddingStore
+        from .ingest import BulkIngestor, IncrementalIndexer
 
-        pos = 0
-        n = len(documents) // step
+        assert len(documents) == len(ids)
 
         for doc in documents:
             self.docs[doc.metadata['id']] = doc
 
-        logger.info(f"Начинается загрузка {len(documents)} документов в Elasticsearch...")
-        for i in tqdm(range(n), desc="Uploading documents to Elasticsearch"):
-            if i == n - 1:
-                docs_to_add = documents[pos:]
-                ids_to_add = ids[pos:]
-            else:
-                docs_to_add = documents[pos:pos + step]
-                ids_to_add = ids[pos:pos + step]
-
+        async def run():
+            # 429 обрабатывает ограничитель конвейера, поэтому клиент не повторяет запросы сам
+            async_api = AsyncOpenAIApi.from_api(self.api, max_retries=1)
+            store = EmbeddingStore(os.getenv("EMBEDDING_STORE_PATH", "embedding_store.sqlite"), model=EMBEDDING_MODEL)
             try:
-                self.db.add_documents(documents=docs_to_add, ids=ids_to_add)
-
-            except Exception as e:
-                logger.error(f"Ошибка при добавлении документов (IDs: {ids_to_add[:5]}...): {e}", exc_info=True)
+                index_name = getattr(self.db, "index_name", "langchain_index")
+                ingestor = BulkIngestor(self.es, index_name, async_api, embedding_store=store, **kwargs)
+                if incremental:
+                    return await IncrementalIndexer(self.es, index_name, ingestor).run(documents, ids)
+                return await ingestor.run(documents, ids)
+            finally:
+                await async_api.close()
+                store.close()
+
+        return asyncio.run(run())
+
+    def add_documents(self, documents, ids, **kwargs):
+        """
+        Добавляет документы в базу данных через конвейер ingest.BulkIngestor
+        (пакетные эмбеддинги, streaming_bulk, продолжение после сбоя).
+        ВНИМАНИЕ: Этот метод используется только при первоначальном заполнении базы данных.
+        Для обычной работы бота используйте prepare_database.py
+        """
+        logger.info(f"Начинается загрузка {len(documents)} документов в Elasticsearch...")
+        stats = self._run_ingestion(documents, ids, incremental=False, **kwargs)
+        logger.info(f"Загрузка документов в Elasticsearch завершена: {stats}")
+        return stats
 
-            pos += step
-            time.sleep(sleep_seconds)
-        logger.info("Загрузка документов в Elasticsearch завершена.")
-    
+    def sync_documents(self, documents, ids, **kwargs):
+        """
+        Приводит индекс к каталогу по хэшам документов (ingest.IncrementalIndexer):
+        эмбеддятся только новые и измененные тексты, изменения метаданных
+        применяются частичным обновлением, удаленные из каталога id удаляются.
+        """
+        logger.info(f"Синхронизация индекса с каталогом из {len(documents)} документов...")
+        stats = self._run_ingestion(documents, ids, incremental=True, **kwargs)
+        logger.info(f"Синхронизация завершена: {stats}")
+        return stats
 
     def similarity_search(self, query, k=3, filter=None):
         """
@@ -577,16 +1110,128 @@ class OpenAiElasticsearchDB:
             logger.error(f"Error in similarity_search: {str(e)}")
             return []
 
+    async def asimilarity_search(self, query, k=3, filter=None):
+        """
+        Асинхронный поиск: эмбеддинг запроса получается через асинхронный клиент,
+        запрос в Elasticsearch выполняется в пуле потоков.
+        """
+        try:
+            if filter is None:
+                filter = await self.filter.apost_query(query)
+            embedding = await self.embeddings.aembed_query(query)
+            return await self.asimilarity_search_by_vector(embedding, k=k, filter=filter)
+
+        except Exception as e:
+            logger.error(f"Error in asimilarity_search: {str(e)}")
+            return []
+
+    async def asimilarity_search_by_vector(self, embedding, k=3, filter=None):
+        try:
+            if embedding is None:
+                return []
+            results = await asyncio.to_thread(
+                self.db.similarity_search_by_vector_with_relevance_scores, embedding, k=k, filter=filter
+            )
+            return [doc for doc, _ in results]
+
+        except Exception as e:
+            logger.error(f"Error in asimilarity_search_by_vector: {str(e)}")
+            return []
+
     def similarity_search_with_score(self, query, k=3, filter=None):
         if filter is None:
             filter = self.filter.post_query(query)
         return self.db.similarity_search_with_score(query=query, k=k, filter=filter)
 
+    def _apply_plan(self, plan):
+        """Обновляет текущий фильтр сессии по ответу планировщика и возвращает фильтр Elasticsearch."""
+        if plan.filter is not None:
+            self.filter.current = car_filter_to_data(plan.filter)
+        return self.filter.parse_filter(self.filter.current)
+
+    def _needs_summary(self, plan, docs):
+        """
+        Второй вызов нужен, только если планировщик решил показать машины и его
+        сообщение, написанное до поиска, не подходит: ничего не найдено
+        или включен режим PLANNER_SUMMARY=always.
+        """
+        return plan.action == ActionType.SHOW_CARS and (not docs or self.summary == "always")
+
+    def _planner_response(self, plan, docs, summary=None):
+        # Фильтр хода - из ответа планировщика, текст и действие - из сводки, если она была
+        answer = summary or plan
+        return ModelResponse(
+            action=answer.action,
+            message=answer.message,
+            question=answer.question,
+            filter=plan.filter,
+            confidence=answer.confidence,
+            docs=docs
+        )
+
+    def _post_query_planner(self, query, timer):
+        with timer.stage("planner"):
+            plan = self.planner.post_query(query)
+        filter = self._apply_plan(plan)
+        docs = []
+        if plan.action == ActionType.SHOW_CARS:
+            with timer.stage("search"):
+                docs = self.similarity_search(query, filter=filter)
+            if self._needs_summary(plan, docs):
+                with timer.stage("summary"):
+                    return self._planner_response(plan, docs, self.planner.post_summary(query, docs))
+        return self._planner_response(plan, docs)
+
+    def _search_likely(self):
+        """
+        Есть ли в фильтре сессии заданные критерии. Пока их нет, планировщик обычно
+        задает уточняющие вопросы, и эмбеддинг запроса заранее не считается.
+        """
+        for value in (self.filter.current or {}).values():
+            values = value if isinstance(value, list) else [value]
+            if any(_is_set(item) for item in values):
+                return True
+        return False
+
+    async def _apost_query_planner(self, query, timer):
+        # Если поиск вероятен, эмбеддинг запускается заранее: когда планировщик
+        # решит показать машины, поиск начнется сразу после его ответа
+        embedding_task = None
+        if self._search_likely():
+            embedding_task = asyncio.ensure_future(timer.measure("embedding", self.embeddings.aembed_query(query)))
+        try:
+            plan = await timer.measure("planner", self.planner.apost_query(query))
+            filter = self._apply_plan(plan)
+            docs = []
+            if plan.action == ActionType.SHOW_CARS:
+                if embedding_task is None:
+                    embedding = await timer.measure("embedding_after_plan", self.embeddings.aembed_query(query))
+                else:
+                    task, embedding_task = embedding_task, None
+                    embedding = await timer.measure("embedding_wait", task)
+                docs = await timer.measure("search", self.asimilarity_search_by_vector(embedding, filter=filter))
+                if self._needs_summary(plan, docs):
+                    summary = await timer.measure("summary", self.planner.apost_summary(query, docs))
+                    return self._planner_response(plan, docs, summary)
+            return self._planner_response(plan, docs)
+        finally:
+            # Поиск не понадобился или ход прерван: заранее запущенный эмбеддинг не нужен
+            if embedding_task is not None and not embedding_task.cancel() and not embedding_task.cancelled():
+                embedding_task.exception()
+
     def post_query(self, query: str) -> ModelResponse:
+        timer = StageTimer()
+        self._reset_usage()
         try:
-            filter = self.filter.post_query(query)
-            docs = self.similarity_search(query, filter=filter)    
-            response = self.dialogue.post_query(query, docs)
+            if self.planner is not None:
+                return self._post_query_planner(query, timer)
+
+            with timer.stage("filter"):
+                filter = self.filter.post_query(query)
+            with timer.stage("search"):
+                docs = self.similarity_search(query, filter=filter)
+            with timer.stage("dialogue"):
+                response = self.dialogue.post_query(query, docs)
             
             return ModelResponse(
                 action=response.action,
@@ -603,14 +1248,104 @@ class OpenAiElasticsearchDB:
                 confidence=0.0,
                 docs=[]
             )
+        finally:
+            self._log_timings(timer)
+            self._log_usage()
+
+    async def apost_query(self, query: str) -> ModelResponse:
+        timer = StageTimer()
+        self._reset_usage()
+        try:
+            if self.planner is not None:
+                return await self._apost_query_planner(query, timer)
+
+            # Эмбеддинг зависит только от текста запроса, поэтому считается параллельно с фильтром
+            filter, embedding = await asyncio.gather(
+                timer.measure("filter", self.filter.apost_query(query)),
+                timer.measure("embedding", self.embeddings.aembed_query(query)),
+            )
+            docs = await timer.measure("search", self.asimilarity_search_by_vector(embedding, filter=filter))
+            response = await timer.measure("dialogue", self.dialogue.apost_query(query, docs))
+
+            return ModelResponse(
+                action=response.action,
+                message=response.message,
+                question=response.question,
+                confidence=response.confidence,
+                docs=docs
+            )
+        except Exception as e:
+            logger.error(f"Error in apost_query: {str(e)}")
+            return ModelResponse(
+                action=ActionType.CLARIFY,
+                message="Произошла ошибка при обработке запроса. Попробуйте переформулировать.",
+                confidence=0.0,
+                docs=[]
+            )
+        finally:
+            self._log_timings(timer)
+            self._log_usage()
+
+    def _assistants(self):
+        assistants = {"filter": self.filter, "dialogue": self.dialogue}
+        if self.planner is not None:
+            assistants["planner"] = self.planner
+        return assistants
+
+    def _reset_usage(self):
+        for assistant in self._assistants().values():
+            assistant.last_usage = None
+
+    def _log_usage(self):
+        """Токены вызовов модели за ход: по ассистентам и суммарно (вызовы из кэша не считаются)."""
+        calls = {name: assistant.last_usage for name, assistant in self._assistants().items()
+                 if assistant.last_usage is not None}
+        self.last_usage = {
+            **calls,
+            "prompt_tokens": sum(usage["prompt_tokens"] for usage in calls.values()),
+            "completion_tokens": sum(usage["completion_tokens"] for usage in calls.values()),
+        }
+        logger.info(f"Токены хода: {self.last_usage}")
+
+    def _log_timings(self, timer):
+        self.last_timings = timer.summary()
+        stages = timer.stages
+        # Выигрыш от параллельности: сколько времени заняли бы стадии, выполняйся они последовательно.
+        # Считаются только стадии, запускаемые одновременно; эмбеддинг после ответа
+        # планировщика записывается как embedding_after_plan и сюда не входит
+        overlapped = [stages[name] for name in ("filter", "planner", "embedding") if name in stages]
+        if len(overlapped) > 1:
+            self.last_timings["overlap_saved"] = round((sum(overlapped) - max(overlapped)) * 1000, 1)
+        for name, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        STAGE_SECONDS.observe(timer.total(), stage="total")
+        logger.info(f"Тайминги хода, мс: {self.last_timings}")
 
 
 class OpenAIApi:
-    def __init__(self, username, password, domain="@tbank.ru", token=None):
+    def __init__(self, username, password, domain="@tbank.ru", token=None, pool_size=32, timeout=120, transport=None):
+        """
+        transport - объект с методом post как у requests.Session, через который идут
+        все запросы (например, cassette.CassetteTransport). Если не задан и задана
+        OPENAI_CASSETTE, запросы записываются в кассету или воспроизводятся из нее.
+        """
         self.username = username
         self.domain = domain
+        self.timeout = timeout
         self.headers = None
         self.access_token = None
+        if transport is None:
+            cassette = Cassette.from_env()
+            if cassette is not None:
+                transport = CassetteTransport(cassette)
+        if transport is not None:
+            self.session = transport
+        else:
+            # Одна keep-alive сессия на процесс вместо нового соединения на каждый запрос
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
         try:
             if username is not None and password is not None:
                 params = {
@@ -618,7 +1353,7 @@ class OpenAIApi:
                     "password": password
                 }
                 url = os.getenv("OPENAI_AUTH_URL")
-                response = requests.post(url, json=params)
+                response = self.session.post(url, json=params, timeout=self.timeout)
                 response.raise_for_status()
 
                 access_token = response.json()['access_token']
@@ -640,7 +1375,7 @@ class OpenAIApi:
             logger.error(f"Ошибка при аутентификации для пользователя {username}: {e}", exc_info=True)
             raise
 
-    def post_query(self, messages, model="gpt-4o"):
+    def post_query(self, messages, model=CHAT_MODEL):
         max_retries = 5
         delay = 15
         last_error = None
@@ -653,16 +1388,19 @@ class OpenAIApi:
                     'top_p': 0.2
                 }
 
-                response = requests.post(os.getenv("OPENAI_CHAT_URL"),
-                                     headers=self.headers,
-                                     json=data)
+                response = self.session.post(os.getenv("OPENAI_CHAT_URL"),
+                                             headers=self.headers,
+                                             json=data,
+                                             timeout=self.timeout)
                 
                 if response.status_code == 429:
+                    API_RATE_LIMITED.inc(operation="post_query")
                     if attempt < max_retries - 1:
-                        wait_time = min(delay, 60)
+                        wait_time = _rate_limit_wait(_retry_after(response), delay)
                         logger.warning(f"Rate limit hit, waiting {wait_time} seconds before retry (attempt {attempt + 1}/{max_retries})")
                         time.sleep(wait_time)
                         delay *= 2
+                        API_RETRIES.inc(operation="post_query")
                         continue
                 
                 response.raise_for_status()
@@ -694,21 +1432,24 @@ class OpenAIApi:
         
         for attempt in range(max_retries):
             try:
-                response = requests.post(
+                response = self.session.post(
                     os.getenv("OPENAI_EMBEDDING_URL"),
                     headers=self.headers,
                     json={
                         "input": texts,
-                        "model": "text-embedding-3-small"
-                    }
+                        "model": EMBEDDING_MODEL
+                    },
+                    timeout=self.timeout
                 )
                 
                 if response.status_code == 429:
+                    API_RATE_LIMITED.inc(operation="get_embedding")
                     if attempt < max_retries - 1:
-                        wait_time = min(delay, 60)
+                        wait_time = _rate_limit_wait(_retry_after(response), delay)
                         logger.warning(f"Rate limit hit, waiting {wait_time} seconds before retry (attempt {attempt + 1}/{max_retries})")
                         time.sleep(wait_time)
                         delay *= 2
+                        API_RETRIES.inc(operation="get_embedding")
                         continue
                 
                 response.raise_for_status()
@@ -733,6 +1474,126 @@ class OpenAIApi:
         raise Exception(error_msg)
 
 
+class RateLimitError(Exception):
+    """Прокси OpenAI ответил 429 и попытки исчерпаны. retry_after - из заголовка Retry-After."""
+
+    def __init__(self, retry_after=None):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate_limit_wait(retry_after, delay):
+    """Пауза перед повтором после 429: Retry-After прокси, а без него - экспоненциальная задержка (не больше 60 с)."""
+    return min(retry_after if retry_after is not None else delay, 60)
+
+
+class AsyncOpenAIApi:
+    """
+    Асинхронный клиент прокси OpenAI на aiohttp с пулом keep-alive соединений.
+    Повторяет семантику OpenAIApi (те же ответы и повторы при 429),
+    но ожидание между попытками не блокирует event loop.
+    """
+
+    def __init__(self, headers, max_connections=200, timeout=120, max_retries=5, delay=15, transport=None):
+        """transport - замена aiohttp.ClientSession (cassette.AsyncCassetteTransport)."""
+        self.headers = headers
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.delay = delay
+        self.transport = transport
+        self._session = None
+
+    @classmethod
+    def from_api(cls, api, **kwargs):
+        """
+        Создает асинхронный клиент с токеном уже аутентифицированного OpenAIApi.
+        Если OpenAIApi работает через кассету, асинхронный клиент пишет в ту же кассету.
+        """
+        client = cls(api.headers, **kwargs)
+        if client.transport is None and isinstance(api.session, CassetteTransport):
+            client.transport = api.session.for_async(api.headers, client.max_connections, client.timeout)
+        return client
+
+    def _get_session(self):
+        if self.transport is not None:
+            return self.transport
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+            )
+        return self._session
+
+    async def _post(self, url, payload, name):
+        delay = self.delay
+        last_error = None
+
+        for attempt in range(self.max_retries):
+            try:
+                async with self._get_session().post(url, json=payload) as response:
+                    if response.status == 429:
+                        API_RATE_LIMITED.inc(operation=name)
+                        retry_after = _retry_after(response)
+                    else:
+                        response.raise_for_status()
+                        return await response.json()
+
+                # Пауза после выхода из async with: соединение уже вернулось в пул
+                if attempt == self.max_retries - 1:
+                    raise RateLimitError(retry_after)
+                wait_time = _rate_limit_wait(retry_after, delay)
+                logger.warning(f"Rate limit hit, waiting {wait_time} seconds before retry (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(wait_time)
+                delay *= 2
+                API_RETRIES.inc(operation=name)
+
+            except RateLimitError:
+                raise
+            except aiohttp.ClientResponseError as e:
+                last_error = e
+                logger.error(f"HTTP Error after {attempt + 1} attempts: {str(e)}", exc_info=True)
+                raise
+            except Exception as e:
+                last_error = e
+                logger.error(f"Error in {name}: {str(e)}", exc_info=True)
+                raise
+
+        error_msg = f"All {self.max_retries} retry attempts failed. Last error: {str(last_error)}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+
+    async def post_query(self, messages, model=CHAT_MODEL):
+        data = {
+            "model": model,
+            "messages": messages,
+            'top_p': 0.2
+        }
+        return await self._post(os.getenv("OPENAI_CHAT_URL"), data, "post_query")
+
+    async def get_embedding(self, texts):
+        data = {
+            "input": texts,
+            "model": EMBEDDING_MODEL
+        }
+        response = await self._post(os.getenv("OPENAI_EMBEDDING_URL"), data, "get_embedding")
+        return [item['embedding'] for item in response['data']]
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self.transport is not None:
+            await self.transport.close()
+
+
 class AutoAssistant:
     def __init__(self, db):
         self.db = db
@@ -750,10 +1611,27 @@ class AutoAssistant:
                 cars=[]
             )
 
+    async def aprocess_message(self, message: str) -> ModelResponse:
+        try:
+            return await self.db.apost_query(message)
+        except Exception as e:
+            logger.error(f"Error in aprocess_message: {str(e)}")
+            return ModelResponse(
+                action=ActionType.CLARIFY,
+                message="Произошла ошибка при обработке запроса. Попробуйте переформулировать.",
+                confidence=0.0,
+                cars=[]
+            )
+
     def reset(self):
-        self.db.filter.reset()
-        self.db.dialogue.reset()
+        self.db.reset()
         logger.info("Состояние диалога сброшено")
 
-    def add_documents(self, documents, ids, n=10, sleep_seconds=15):
-        self.db.add_documents(documents, ids, n, sleep_seconds)
\ No newline at end of file
+    def get_state(self):
+        return self.db.get_state()
+
+    def load_state(self, state):
+        self.db.load_state(state)
+
+    def add_documents(self, documents, ids, **kwargs):
+        return self.db.add_documents(documents, ids, **kwargs)
\ No newline at end of file
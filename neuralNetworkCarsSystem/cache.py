@@ -0,0 +1,322 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import setup_logger
+
+logger = setup_logger("cache")
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением по числу записей и времени жизни."""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, created_at = item
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, created_at=None):
+        """created_at - время создания значения, если оно пришло из другого хранилища (TTL отсчитывается от него)."""
+        with self._lock:
+            self._data[key] = (value, time.time() if created_at is None else created_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class EmbeddingCache:
+    """
+    Двухуровневый кэш эмбеддингов запросов: LRU в памяти и SQLite на диске.
+    Ключ - модель и нормализованный текст, векторы хранятся как float32.
+    Дисковый уровень переживает перезапуск бота. TTL отсчитывается от записи
+    на диск и на обоих уровнях один. Время последнего обращения (для вытеснения
+    с диска) копится в памяти и записывается пачкой вместе со следующей
+    записью или после touch_batch попаданий, а не коммитом на каждое попадание.
+    """
+
+    def __init__(self, path="embedding_cache.sqlite", max_size=10000, ttl=None, disk_max_size=100000,
+                 touch_batch=256):
+        self.path = path
+        self.ttl = ttl
+        self.disk_max_size = disk_max_size
+        self.memory = LRUCache(max_size, ttl)
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.touch_batch = touch_batch
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._touched = {}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT, vector BLOB, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings(accessed_at)")
+        self._conn.commit()
+        self._evict()
+        logger.info(f"Кэш эмбеддингов открыт: {path}")
+
+    @classmethod
+    def from_env(cls):
+        """Создает кэш по переменным окружения EMBEDDING_CACHE_*."""
+        ttl = os.getenv("EMBEDDING_CACHE_TTL")
+        return cls(
+            path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"),
+            max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", 10000)),
+            ttl=float(ttl) if ttl else None,
+            disk_max_size=int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", 100000)),
+        )
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(str(text).lower().split())
+
+    def make_key(self, model, text):
+        return hashlib.sha256(f"{model}\n{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, model, text):
+        key = self.make_key(model, text)
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.disk_misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched_locked()
+                self._conn.commit()
+
+        vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+        # Запись в памяти истекает тогда же, когда на диске
+        self.memory.set(key, vector, created_at=row[1])
+        return vector
+
+    def _flush_touched_locked(self):
+        if self._touched:
+            self._conn.executemany("UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched.clear()
+
+    def set(self, model, text, vector):
+        key = self.make_key(model, text)
+        self.memory.set(key, list(vector))
+
+        now = time.time()
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, blob, now, now),
+            )
+            self._touched.pop(key, None)
+            self._flush_touched_locked()
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._evict_locked()
+
+    def _evict(self):
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        self._flush_touched_locked()
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.disk_max_size is not None:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_size,),
+            )
+        self._conn.commit()
+
+    def stats(self):
+        memory = self.memory.stats()
+        return {
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "memory_misses": memory["misses"],
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched_locked()
+            self._conn.commit()
+            self._conn.close()
+
+
+class EmbeddingStore:
+    """
+    Постоянное хранилище эмбеддингов документов каталога в SQLite, ключ - хэш
+    текста документа (metadata["text_hash"]). Записи не вытесняются: при
+    переиндексации заново эмбеддятся только тексты, которых здесь нет.
+    """
+
+    def __init__(self, path="embedding_store.sqlite", model=None):
+        self.path = path
+        self.model = model
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (hash TEXT PRIMARY KEY, model TEXT, vector BLOB)")
+        self._conn.commit()
+
+    def get_many(self, hashes):
+        """Возвращает {хэш: вектор} для найденных хэшей."""
+        result = {}
+        hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                query = f"SELECT hash, vector FROM vectors WHERE model IS ? AND hash IN ({','.join('?' * len(chunk))})"
+                for key, blob in self._conn.execute(query, [self.model, *chunk]):
+                    result[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return result
+
+    def set_many(self, items):
+        """items - пары (хэш, вектор)."""
+        rows = [(key, self.model, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO vectors (hash, model, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileIdCache:
+    """
+    Соответствие ссылки на фотографию и file_id, который Telegram вернул при
+    первой отправке альбома, в SQLite. Повторные альбомы отправляются по
+    file_id: Telegram не скачивает и не обрабатывает изображения заново.
+    Вместе со ссылкой хранится id автомобиля из каталога.
+    """
+
+    def __init__(self, path="telegram_file_cache.sqlite"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids (url TEXT PRIMARY KEY, car_id TEXT, file_id TEXT, created_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS file_ids_car ON file_ids(car_id)")
+        self._conn.commit()
+        logger.info(f"Кэш file_id Telegram открыт: {path}")
+
+    @classmethod
+    def from_env(cls):
+        """Кэш по TELEGRAM_FILE_CACHE_PATH; пустой путь отключает кэш (None)."""
+        path = os.getenv("TELEGRAM_FILE_CACHE_PATH", "telegram_file_cache.sqlite")
+        return cls(path) if path else None
+
+    def get_many(self, urls):
+        """Возвращает {ссылка: file_id} для найденных ссылок."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT url, file_id FROM file_ids WHERE url IN ({','.join('?' * len(urls))})", urls
+            ).fetchall()
+        result = dict(rows)
+        self.hits += len(result)
+        self.misses += len(urls) - len(result)
+        return result
+
+    def set_many(self, car_id, items):
+        """items - пары (ссылка, file_id)."""
+        now = time.time()
+        rows = [(url, None if car_id is None else str(car_id), file_id, now) for url, file_id in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_ids (url, car_id, file_id, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def forget(self, urls):
+        """Удаляет file_id, которые Telegram больше не принимает."""
+        urls = list(urls)
+        with self._lock:
+            self._conn.executemany("DELETE FROM file_ids WHERE url = ?", [(url,) for url in urls])
+            self._conn.commit()
+        self.invalidated += len(urls)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "invalidated": self.invalidated}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,10 +1,16 @@
 import os
+import threading
 from dotenv import load_dotenv
 import psutil
 from elasticsearch import Elasticsearch
 from langchain_elasticsearch import ElasticsearchStore
-from utils import setup_logger
-from .AutoAssistant import OpenAIApi, OpenAiEmbeddings, OpenAiElasticsearchDB, AutoAssistant
+from utils import setup_logger, REGISTRY
+from .AutoAssistant import get_docs, OpenAIApi, AsyncOpenAIApi, OpenAiEmbeddings, OpenAiElasticsearchDB, AutoAssistant
+from .cache import EmbeddingCache, LRUCache
+from .fast_filter import FastFilterExtractor
+from .index_schema import bootstrap_index
+from .local_search import LocalVectorStore
+from .snapshot import is_snapshot, read_manifest
 from .models import ActionType, ModelResponse, Question, QuestionType
 import datetime
 
@@ -29,39 +35,127 @@ for proc in psutil.process_iter(['pid', 'name', 'create_time']):
             logger.warning(f"Процесс {proc.info['pid']} принудительно завершен")
 
 
-index_settings = {
-            "settings": {
-                "analysis": {
-                    "analyzer": {
-                        "keyword_lowercase": {
-                            "type": "custom",
-                            "tokenizer": "keyword",
-                            "filter": ["lowercase"]
-                        }
-                    }
+def create_local_store(embeddings):
+    """
+    Загружает локальный индекс из LOCAL_INDEX_PATH (.npz или каталог снимка),
+    а если его нет - открывает снимок с эмбеддингами из ELASTIC_DATASET_PATH
+    или строит индекс по датасету и сохраняет для следующих запусков.
+    """
+    path = os.getenv("LOCAL_INDEX_PATH", "local_index.npz")
+    if os.path.exists(path):
+        return LocalVectorStore.load(path, embeddings)
+
+    dataset_path = os.getenv("ELASTIC_DATASET_PATH")
+    if dataset_path and is_snapshot(dataset_path) and read_manifest(dataset_path).get("dims"):
+        return LocalVectorStore.from_snapshot(dataset_path, embeddings)
+
+    logger.info(f"Локальный индекс {path} не найден, строим по датасету")
+    docs, _ = get_docs(dataset_path)
+    store = LocalVectorStore.from_documents(docs, embeddings)
+    store.save(path)
+    return store
+
+
+class AssistantRuntime:
+    """
+    Общие для всего процесса ресурсы: API-клиент, клиент Elasticsearch,
+    векторное хранилище с каталогом и кэши. Сессии пользователей
+    (AutoAssistant) хранят только историю фильтров и диалога; каталог
+    в память сессий не загружается - документы берутся из хранилища.
+    """
+
+    def __init__(self, api=None, es_client=None, index_name="langchain_index", backend=None):
+        """backend - "elasticsearch" или "local" (LocalVectorStore), по умолчанию SEARCH_BACKEND."""
+        self.api = api if api is not None else OpenAIApi(os.getenv("PROXY_LOGIN"), os.getenv("PROXY_PASSWORD"))
+        self.async_api = AsyncOpenAIApi.from_api(self.api)
+        self.index_name = index_name
+        self.backend = backend or os.getenv("SEARCH_BACKEND", "elasticsearch")
+
+        self.embedding_cache = EmbeddingCache.from_env()
+        self.embeddings = OpenAiEmbeddings(self.api, self.async_api, cache=self.embedding_cache)
+
+        if self.backend == "local":
+            self.es = es_client
+            self.store = create_local_store(self.embeddings)
+        else:
+            self.es = es_client if es_client is not None else Elasticsearch([os.getenv("ELASTICSEARCH_URL")])
+            bootstrap_index(self.es, index_name)
+            self.store = ElasticsearchStore(
+                es_connection=self.es,
+                index_name=index_name,
+                embedding=self.embeddings,
+            )
+        filter_cache_ttl = os.getenv("FILTER_CACHE_TTL", 86400)
+        self.filter_cache = LRUCache(
+            max_size=int(os.getenv("FILTER_CACHE_SIZE", 2048)),
+            ttl=float(filter_cache_ttl) if filter_cache_ttl else None,
+        )
+        self.fast_filter = None
+        if os.getenv("FAST_FILTER", "1") == "1":
+            self.fast_filter = FastFilterExtractor(threshold=float(os.getenv("FAST_FILTER_CONFIDENCE", 0.8)))
+        self.mode = os.getenv("ASSISTANT_MODE", "pipeline")
+        self.register_metrics()
+        logger.info(f"Инициализирован общий рантайм ассистента (режим: {self.mode}, поиск: {self.backend})")
+
+    def register_metrics(self, registry=REGISTRY):
+        """Счетчики кэшей читаются из их stats() при запросе метрик, а не на каждом обращении."""
+        def cache_stats(name):
+            def read():
+                embedding = self.embedding_cache.stats()
+                result = {
+                    "filter": self.filter_cache.stats()[name],
+                    "embedding_memory": embedding[f"memory_{name}"],
+                    "embedding_disk": embedding[f"disk_{name}"],
                 }
-            }
-        }
+                if self.fast_filter is not None:
+                    # Для быстрого разбора фильтров попадание - ответ без вызова модели
+                    result["fast_filter"] = self.fast_filter.stats()["fast_path" if name == "hits" else "llm_path"]
+                return result
+            return read
 
-def create_db():
-    api = OpenAIApi(os.getenv("PROXY_LOGIN"), os.getenv("PROXY_PASSWORD"))
+        registry.collect("assistant_cache_hits_total", "Попадания в кэши ассистента", cache_stats("hits"),
+                         kind="counter", labelname="cache")
+        registry.collect("assistant_cache_misses_total", "Промахи кэшей ассистента", cache_stats("misses"),
+                         kind="counter", labelname="cache")
+
+    def create_db(self):
+        return OpenAiElasticsearchDB(self.api, store=self.store, es=self.es,
+                                     async_api=self.async_api, embeddings=self.embeddings,
+                                     filter_cache=self.filter_cache, mode=self.mode,
+                                     fast_filter=self.fast_filter)
+
+    def create_assistant(self):
+        return AutoAssistant(self.create_db())
 
-    es_client = Elasticsearch([os.getenv("ELASTICSEARCH_URL")])
+    async def aclose(self):
+        await self.async_api.close()
+        logger.info(f"Статистика кэша эмбеддингов: {self.embedding_cache.stats()}")
+        logger.info(f"Статистика кэша фильтров: {self.filter_cache.stats()}")
+        if self.fast_filter is not None:
+            logger.info(f"Статистика быстрого разбора фильтров: {self.fast_filter.stats()}")
+        self.embedding_cache.close()
 
-    es_client.indices.close(index="langchain_index")
 
-    es_client.indices.put_settings(index="langchain_index", body=index_settings)
+_runtime = None
+_runtime_lock = threading.Lock()
 
-    es_client.indices.open(index="langchain_index")
-    db = OpenAiElasticsearchDB(api)
 
-    return db
+def get_runtime():
+    """Возвращает общий рантайм, создавая его при первом обращении."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AssistantRuntime()
+    return _runtime
+
+
+def create_db():
+    return get_runtime().create_db()
 
 
 def createAutoAssistantInstance():
-    db = create_db()
-    assistant = AutoAssistant(db)
-    return assistant
+    return get_runtime().create_assistant()
 
 class CarsFacade:
     def __init__(self, api, index_name="langchain_index", max_query=3, promt=None):
@@ -0,0 +1,303 @@
+"""
+Запись и воспроизведение запросов к прокси OpenAI (кассеты).
+
+В режиме record запросы OpenAIApi / AsyncOpenAIApi уходят в сеть, а пары
+запрос-ответ дописываются в кассету - gzip JSONL, по строке на ответ с ключом
+sha256 от канонического запроса (путь URL и тело с отсортированными ключами).
+В режиме replay ответы берутся из кассеты без сети, с необязательной задержкой;
+одинаковые запросы получают записанные ответы по порядку.
+
+Заголовки (токен) в ключ и кассету не попадают, пароль при аутентификации
+исключается из ключа, access_token в ответах заменяется заглушкой.
+
+    OPENAI_CASSETTE=dialogue.jsonl.gz OPENAI_CASSETTE_MODE=record python tg_bot.py
+    OPENAI_CASSETTE=dialogue.jsonl.gz OPENAI_CASSETTE_MODE=replay OPENAI_CASSETTE_LATENCY=recorded python tg_bot.py
+"""
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+
+from utils import setup_logger
+
+logger = setup_logger("cassette")
+
+REDACTED_TOKEN = "cassette-token"
+# Поля тела запроса, которые не должны влиять на ключ и попадать на диск
+SECRET_FIELDS = ("password",)
+
+
+class CassetteMiss(KeyError):
+    """В кассете нет ответа на запрос (режим replay)."""
+
+
+def request_key(url, payload):
+    body = {key: value for key, value in (payload or {}).items() if key not in SECRET_FIELDS}
+    canonical = json.dumps({"path": urlparse(url or "").path, "body": body},
+                           ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _redact(body):
+    if isinstance(body, dict) and "access_token" in body:
+        return {**body, "access_token": REDACTED_TOKEN}
+    return body
+
+
+class Cassette:
+    """
+    Хранилище записанных ответов. mode - "record" или "replay";
+    latency - задержка ответа при воспроизведении в секундах или "recorded"
+    (задержка, записанная вместе с ответом).
+    """
+
+    def __init__(self, path, mode="replay", latency=0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._entries = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self.hits = 0
+        self.recorded = 0
+        self._load()
+        logger.info(f"Кассета {path} открыта в режиме {mode}: {sum(map(len, self._entries.values()))} ответов")
+
+    @classmethod
+    def from_env(cls):
+        """Кассета по OPENAI_CASSETTE (путь), OPENAI_CASSETTE_MODE и OPENAI_CASSETTE_LATENCY; None, если путь не задан."""
+        path = os.getenv("OPENAI_CASSETTE")
+        if not path:
+            return None
+        latency = os.getenv("OPENAI_CASSETTE_LATENCY", "0")
+        return cls(path, mode=os.getenv("OPENAI_CASSETTE_MODE", "replay"),
+                   latency=latency if latency == "recorded" else float(latency))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            if self.mode == "replay":
+                raise FileNotFoundError(f"Кассета {self.path} не найдена")
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+            except (EOFError, zlib.error, gzip.BadGzipFile):
+                # Хвост последней записи, оборванной при аварийной остановке
+                logger.warning(f"Кассета {self.path} обрезана, прочитаны полные записи")
+
+    def lookup(self, url, payload):
+        """Следующий записанный ответ на запрос; последний повторяется, если запросов больше, чем записей."""
+        key = request_key(url, payload)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"Нет записи для запроса к {urlparse(url or '').path} (ключ {key[:12]})")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.hits += 1
+            return entries[min(position, len(entries) - 1)]
+
+    def replay_delay(self, entry):
+        if self.latency == "recorded":
+            return entry.get("elapsed", 0.0)
+        return self.latency or 0.0
+
+    def record(self, url, payload, status, body, elapsed, retry_after=None):
+        entry = {
+            "key": request_key(url, payload),
+            "path": urlparse(url or "").path,
+            "status": status,
+            "body": _redact(body),
+            "elapsed": round(elapsed, 4),
+        }
+        if retry_after is not None:
+            entry["retry_after"] = retry_after
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+                # Без close в конце файла не будет завершающего блока gzip
+                atexit.register(self.close)
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._entries.setdefault(entry["key"], []).append(entry)
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "recorded": self.recorded}
+
+
+class CassetteResponse:
+    """Ответ из кассеты с интерфейсом requests.Response, который использует OpenAIApi."""
+
+    def __init__(self, entry, url):
+        self.status_code = entry["status"]
+        self.url = url
+        self._body = entry["body"]
+        self.headers = {"Retry-After": str(entry["retry_after"])} if "retry_after" in entry else {}
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (cassette) for url: {self.url}", response=self)
+
+
+class CassetteTransport:
+    """
+    Замена requests.Session в OpenAIApi. В режиме record запросы выполняет
+    inner (по умолчанию новая requests.Session) и записывает ответы.
+    """
+
+    def __init__(self, cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def _inner(self):
+        if self.inner is None:
+            self.inner = requests.Session()
+        return self.inner
+
+    def post(self, url, json=None, headers=None, timeout=None, **kwargs):
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup(url, json)
+            delay = self.cassette.replay_delay(entry)
+            if delay:
+                time.sleep(delay)
+            return CassetteResponse(entry, url)
+
+        started_at = time.perf_counter()
+        response = self._inner().post(url, json=json, headers=headers, timeout=timeout, **kwargs)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        self.cassette.record(url, json, response.status_code, body, time.perf_counter() - started_at,
+                             response.headers.get("Retry-After"))
+        return response
+
+    def for_async(self, headers, max_connections=200, timeout=120):
+        """Транспорт для AsyncOpenAIApi с той же кассетой и теми же настройками пула и таймаута."""
+        return AsyncCassetteTransport(self.cassette, headers, max_connections=max_connections, timeout=timeout)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+        self.cassette.close()
+
+
+class _AsyncCassetteResponse(CassetteResponse):
+    """Ответ из кассеты с интерфейсом aiohttp.ClientResponse."""
+
+    def __init__(self, entry, url):
+        super().__init__(entry, url)
+        self.status = self.status_code
+
+    async def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=self.status,
+                                              message=f"{self.status} Error (cassette)", headers=self.headers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _Recorded:
+    """Контекстный менеджер над запросом aiohttp, записывающий ответ в кассету."""
+
+    def __init__(self, cassette, request, url, payload):
+        self.cassette = cassette
+        self.request = request
+        self.url = url
+        self.payload = payload
+        self.response = None
+
+    async def __aenter__(self):
+        started_at = time.perf_counter()
+        self.response = await self.request.__aenter__()
+        try:
+            body = await self.response.json(content_type=None)
+        except ValueError:
+            body = None
+        self.cassette.record(self.url, self.payload, self.response.status, body, time.perf_counter() - started_at,
+                             self.response.headers.get("Retry-After"))
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        return await self.request.__aexit__(*exc_info)
+
+
+class _Replayed:
+    """Контекстный менеджер, отдающий ответ из кассеты вместо запроса aiohttp."""
+
+    def __init__(self, cassette, url, payload):
+        self.cassette = cassette
+        self.url = url
+        self.payload = payload
+
+    async def __aenter__(self):
+        entry = self.cassette.lookup(self.url, self.payload)
+        delay = self.cassette.replay_delay(entry)
+        if delay:
+            await asyncio.sleep(delay)
+        return _AsyncCassetteResponse(entry, self.url)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class AsyncCassetteTransport:
+    """Замена aiohttp.ClientSession в AsyncOpenAIApi (post как асинхронный контекстный менеджер)."""
+
+    def __init__(self, cassette, headers=None, max_connections=200, timeout=120):
+        self.cassette = cassette
+        self.headers = headers
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._session = None
+        self.closed = False
+
+    def post(self, url, json=None, **kwargs):
+        if self.cassette.mode == "replay":
+            return _Replayed(self.cassette, url, json)
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+            )
+        return _Recorded(self.cassette, self._session.post(url, json=json, **kwargs), url, json)
+
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self.closed = True
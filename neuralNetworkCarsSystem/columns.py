@@ -0,0 +1,110 @@
+import numpy as np
+
+from utils import setup_logger
+from .filters import NUMERIC_FIELDS, CATEGORICAL_FIELDS, normalize_value, to_spec
+
+logger = setup_logger("columns")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class CatalogColumns:
+    """
+    Метаданные каталога в колоночном виде для быстрой фильтрации.
+
+    Числовые поля - массивы float64 и их отсортированные копии (диапазон
+    находится двоичным поиском), категориальные - словарное кодирование
+    с упакованной битовой картой на каждое значение. Фильтр вычисляется
+    как побитовая комбинация карт и превращается в булеву маску документов.
+    """
+
+    def __init__(self, metadatas):
+        metadatas = list(metadatas)
+        self.size = len(metadatas)
+        self._bytes = (self.size + 7) // 8
+
+        self.numeric = {}
+        self._sorted_values = {}
+        self._sorted_order = {}
+        for field in NUMERIC_FIELDS:
+            column = np.fromiter((_to_float(meta.get(field)) for meta in metadatas), dtype=np.float64, count=self.size)
+            valid = np.flatnonzero(~np.isnan(column))
+            order = valid[np.argsort(column[valid], kind="stable")]
+            self.numeric[field] = column
+            self._sorted_order[field] = order
+            self._sorted_values[field] = column[order]
+
+        self.codes = {}
+        self.vocabulary = {}
+        self.bitmaps = {}
+        for field in CATEGORICAL_FIELDS:
+            vocabulary = {}
+            codes = np.fromiter(
+                (vocabulary.setdefault(normalize_value(meta.get(field, "")), len(vocabulary)) for meta in metadatas),
+                dtype=np.int32, count=self.size,
+            )
+            self.codes[field] = codes
+            self.vocabulary[field] = vocabulary
+            self.bitmaps[field] = [np.packbits(codes == code) for code in range(len(vocabulary))]
+
+        logger.debug(f"Колоночное представление каталога: {self.size} документов")
+
+    def update_numeric(self, field, positions, values):
+        """Меняет значения числового поля у документов positions и пересобирает его сортировку."""
+        column = self.numeric[field]
+        column[np.asarray(positions, dtype=np.int64)] = [_to_float(value) for value in values]
+        valid = np.flatnonzero(~np.isnan(column))
+        order = valid[np.argsort(column[valid], kind="stable")]
+        self._sorted_order[field] = order
+        self._sorted_values[field] = column[order]
+
+    def _empty(self):
+        return np.zeros(self._bytes, dtype=np.uint8)
+
+    def _full(self):
+        return np.packbits(np.ones(self.size, dtype=bool))
+
+    def range_bitmap(self, field, gte=None, lte=None):
+        values = self._sorted_values[field]
+        start = 0 if gte is None else np.searchsorted(values, gte, side="left")
+        end = len(values) if lte is None else np.searchsorted(values, lte, side="right")
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self._sorted_order[field][start:end]] = True
+        return np.packbits(mask)
+
+    def values_bitmap(self, field, values):
+        bitmap = self._empty()
+        vocabulary = self.vocabulary[field]
+        for value in values:
+            code = vocabulary.get(normalize_value(value))
+            if code is not None:
+                bitmap |= self.bitmaps[field][code]
+        return bitmap
+
+    def bitmap(self, filter):
+        spec = to_spec(filter)
+        bitmap = self._full()
+        for field, (gte, lte) in spec.ranges.items():
+            if field not in self.numeric:
+                raise ValueError(f"Неизвестное числовое поле: {field}")
+            bitmap &= self.range_bitmap(field, gte, lte)
+        for field, values in spec.terms.items():
+            if field not in self.vocabulary:
+                raise ValueError(f"Неизвестное категориальное поле: {field}")
+            bitmap &= self.values_bitmap(field, values)
+        return bitmap
+
+    def mask(self, filter):
+        """
+        Булева маска документов, подходящих под фильтр. filter - FilterSpec,
+        CarFilter, словарь parse_data или запрос Elasticsearch.
+        """
+        return np.unpackbits(self.bitmap(filter), count=self.size).astype(bool)
+
+    def count(self, filter):
+        return int(np.unpackbits(self.bitmap(filter), count=self.size).sum())
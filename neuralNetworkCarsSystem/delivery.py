@@ -0,0 +1,228 @@
+"""
+Отправка ответов бота в Telegram с учетом лимитов Bot API.
+
+Все отправки проходят через общее ведро токенов (по умолчанию 30 сообщений
+в секунду на бота) и ведро своего чата (около сообщения в секунду с небольшой
+пачкой подряд); альбом расходует больше токенов, чем текстовое сообщение.
+Отправки в один чат идут строго по порядку, разные чаты не ждут друг друга.
+RetryAfter приостанавливает чат на указанное Telegram время, а долгий
+RetryAfter (лимит всего бота) - и общее ведро. TimedOut / NetworkError
+повторяются с нарастающей паузой.
+
+Фотографии альбомов после первой отправки берутся по file_id из FileIdCache.
+"""
+import asyncio
+import os
+import time
+from datetime import timedelta
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from utils import setup_logger, TokenBucket, REGISTRY
+from .cache import FileIdCache
+
+logger = setup_logger("delivery")
+
+BOT_SEND_SECONDS = REGISTRY.histogram("bot_send_seconds", "Длительность вызовов Telegram Bot API", ["method"])
+BOT_SEND_WAIT_SECONDS = REGISTRY.histogram("bot_send_wait_seconds", "Ожидание лимитов Telegram перед отправкой",
+                                           ["method"])
+BOT_SEND_RETRIES = REGISTRY.counter("bot_send_retries_total", "Повторные отправки в Telegram", ["method", "reason"])
+
+# Telegram показывает в альбоме не больше 10 фотографий, карточка машины - первые 5
+MAX_IMAGES = 5
+
+
+def format_car_card(metadata):
+    """HTML-карточка автомобиля и список ссылок на фотографии для альбома."""
+    brand = metadata.get('brand', '').upper()
+    model = metadata.get('model', '').upper()
+    price = metadata.get('price', 0)
+    desc_summarization = metadata.get('desc_summarization', '')
+    desc_plus = metadata.get('desc_plus', '')
+    desc_minus = metadata.get('desc_minus', '')
+
+    formatted_price = f"{int(price):,}".replace(',', ' ')
+
+    message_text = (
+        f"🚗 <b>{brand} {model}</b>\n\n"
+        f"💰 <b>Средняя цена:</b> {formatted_price} ₽\n\n"
+        f"📝 <b>Описание:</b>\n{desc_summarization}\n\n"
+        f"✅ <b>Плюсы:</b>\n{desc_plus}\n\n"
+        f"❌ <b>Минусы:</b>\n{desc_minus}\n\n"
+    )
+
+    brand_link = metadata.get('brand', '').lower().replace(' ', '_')
+    model_link = metadata.get('model', '').lower().replace(' ', '_')
+    link = f"https://auto.drom.ru/{brand_link}/{model_link}/"
+
+    message_text += f'🔗 <a href="{link}">Посмотреть объявления на Drom.ru</a>'
+
+    images = metadata.get('images', [])[:MAX_IMAGES]
+
+    if images:
+        message_text += f'\n\n📸 Галерея автомобиля ⬇️'
+
+    return message_text, images
+
+
+def _seconds(retry_after):
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TelegramDelivery:
+    """
+    Слой отправки сообщений бота. Методы принимают bot первым аргументом,
+    поэтому один экземпляр обслуживает и Application, и тестовых ботов.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=10, media_group_cost=2, max_attempts=4,
+                 retry_delay=0.5, max_chats=10000, file_cache=None, global_pause_after=5.0):
+        """
+        chat_burst - сколько отправок в чат допускается подряд до выравнивания до chat_rate;
+        media_group_cost - сколько токенов расходует альбом;
+        global_pause_after - RetryAfter от стольких секунд приостанавливает все чаты:
+        такие паузы Telegram назначает при превышении общего лимита бота;
+        file_cache - FileIdCache для повторной отправки фотографий по file_id.
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.media_group_cost = media_group_cost
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_chats = max_chats
+        self.file_cache = file_cache
+        self.global_pause_after = global_pause_after
+        self._chats = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls):
+        """Создает слой отправки по переменным окружения TELEGRAM_*."""
+        return cls(
+            global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", 30)),
+            chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", 1)),
+            chat_burst=float(os.getenv("TELEGRAM_CHAT_BURST", 10)),
+            media_group_cost=float(os.getenv("TELEGRAM_MEDIA_GROUP_COST", 2)),
+            max_attempts=int(os.getenv("TELEGRAM_SEND_ATTEMPTS", 4)),
+            global_pause_after=float(os.getenv("TELEGRAM_GLOBAL_PAUSE_AFTER", 5)),
+            file_cache=FileIdCache.from_env(),
+        )
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                # Заполненные ведра ничего не ограничивают, их можно создать заново
+                for key in [key for key, value in self._chats.items() if value.idle()]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _send(self, method, chat_id, call, cost=1):
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(1, self.max_attempts + 1):
+            waited = await bucket.acquire(cost)
+            waited += await self.global_bucket.acquire(cost)
+            BOT_SEND_WAIT_SECONDS.observe(waited, method=method)
+
+            started_at = time.perf_counter()
+            try:
+                result = await call()
+            except RetryAfter as e:
+                error, reason, delay = e, "retry_after", _seconds(e.retry_after)
+                # Следующая попытка этого чата дождется конца паузы в acquire
+                bucket.pause(delay, tokens=cost)
+                if delay >= self.global_pause_after:
+                    self.global_bucket.pause(delay, tokens=cost)
+            except (BadRequest, Forbidden):
+                # Ошибка в самом запросе или бот заблокирован: повтор не поможет
+                self.failed += 1
+                raise
+            except NetworkError as e:
+                error, reason, delay = e, type(e).__name__, self.retry_delay * 2 ** (attempt - 1)
+            else:
+                BOT_SEND_SECONDS.observe(time.perf_counter() - started_at, method=method)
+                self.sent += 1
+                return result
+
+            if attempt == self.max_attempts:
+                self.failed += 1
+                logger.error(f"{method} в чат {chat_id} не отправлено за {attempt} попыток: {error}")
+                raise error
+            self.retried += 1
+            BOT_SEND_RETRIES.inc(method=method, reason=reason)
+            logger.warning(f"{method} в чат {chat_id}: {error}, повтор {attempt + 1}/{self.max_attempts} "
+                           f"через {delay:.1f} с")
+            if reason != "retry_after":
+                await asyncio.sleep(delay)
+
+    async def send_message(self, bot, chat_id, text, **kwargs):
+        return await self._send("send_message", chat_id,
+                                lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+    async def send_media_group(self, bot, chat_id, media, **kwargs):
+        return await self._send("send_media_group", chat_id,
+                                lambda: bot.send_media_group(chat_id=chat_id, media=media, **kwargs),
+                                cost=self.media_group_cost)
+
+    async def send_cars(self, bot, chat_id, docs):
+        """
+        Карточки автомобилей с альбомами по порядку. Ошибка карточки прерывает
+        показ, ошибка альбома только логируется.
+        """
+        for doc in docs:
+            metadata = doc.metadata
+            logger.debug(f"Обработка автомобиля: {metadata.get('brand')} {metadata.get('model')}")
+            message_text, images = format_car_card(metadata)
+
+            await self.send_message(bot, chat_id, message_text, parse_mode='HTML', disable_web_page_preview=True)
+
+            if images:
+                try:
+                    await self.send_album(bot, chat_id, images, metadata.get('id'))
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке изображений для {metadata.get('brand')} "
+                                 f"{metadata.get('model')}: {e}")
+
+    async def send_album(self, bot, chat_id, images, car_id=None):
+        """
+        Альбом из фотографий по ссылкам. Известные фотографии отправляются по
+        file_id; если Telegram отклонил их (BadRequest), альбом повторяется по
+        ссылкам, и только после успешного повтора file_id заменяются в кэше:
+        если ссылки тоже не приняты, дело было не в file_id.
+        """
+        cached = self.file_cache.get_many(images) if self.file_cache is not None else {}
+        media_group = [InputMediaPhoto(media=cached.get(image_url, image_url)) for image_url in images]
+        try:
+            messages = await self.send_media_group(bot, chat_id, media_group)
+        except BadRequest as e:
+            if not cached:
+                raise
+            logger.warning(f"Telegram не принял file_id фотографий автомобиля {car_id}, отправка по ссылкам: {e}")
+            media_group = [InputMediaPhoto(media=image_url) for image_url in images]
+            messages = await self.send_media_group(bot, chat_id, media_group)
+            self.file_cache.forget(cached)
+            cached = {}
+
+        if self.file_cache is not None and len(cached) < len(images):
+            # Сообщения альбома идут в порядке фотографий, крупнейший размер - последний
+            self.file_cache.set_many(car_id, [
+                (image_url, message.photo[-1].file_id)
+                for image_url, message in zip(images, messages)
+                if image_url not in cached and message.photo
+            ])
+        return messages
+
+    def stats(self):
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed, "chats": len(self._chats)}
+
+    def close(self):
+        if self.file_cache is not None:
+            logger.info(f"Статистика кэша file_id: {self.file_cache.stats()}")
+            self.file_cache.close()
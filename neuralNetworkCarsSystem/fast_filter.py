@@ -0,0 +1,251 @@
+import re
+import threading
+
+from utils import setup_logger
+from .lexicon import (
+    CAR_BRANDS, AMBIGUOUS_BRANDS, BRAND_ALIASES, COUNTRY_STEMS, BODY_TYPE_STEMS,
+    TRANSMISSION_STEMS, DRIVE_STEMS, ENGINE_STEMS, FILTER_STOP_WORDS,
+)
+
+logger = setup_logger("fast_filter")
+
+# Ключи и порядок полей совпадают с форматом ответа модели в OpenAiElasticsearchFilter
+EMPTY_FILTER = {
+    'Год выпуска': ['NaN', 'NaN'],
+    'Минимальная цена': 'NaN',
+    'Максимальная цена': 'NaN',
+    'Марка автомобиля': 'NaN',
+    'Страна': 'NaN',
+    'Привод': 'NaN',
+    'Тип двигателя': 'NaN',
+    'Расход топлива': ['NaN', 'NaN'],
+    'Количество мест': ['NaN', 'NaN'],
+    'Тип кузова': 'NaN',
+    'Количество дверей': ['NaN', 'NaN'],
+    'Тип коробки': 'NaN',
+    'Лошадиные силы': ['NaN', 'NaN'],
+    'Клиренс': ['NaN', 'NaN'],
+}
+
+_PAIR_KEYS = {key for key, value in EMPTY_FILTER.items() if isinstance(value, list)}
+
+
+def _alternation(words):
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+def _alias_pattern(alias):
+    # Русские названия склоняются: "мазду", "хонды", "тойоту"
+    if len(alias) >= 5 and alias[-1] in "аяо":
+        return re.escape(alias[:-1]) + r"\w{0,2}"
+    return re.escape(alias)
+
+
+_BRANDS = {brand.lower(): brand for brand in CAR_BRANDS if brand not in AMBIGUOUS_BRANDS}
+_BRAND_PATTERNS = sorted(
+    [(re.escape(name), brand) for name, brand in _BRANDS.items()]
+    + [(_alias_pattern(alias), brand) for alias, brand in BRAND_ALIASES.items()],
+    key=lambda item: len(item[0]), reverse=True,
+)
+_BRAND_RE = re.compile(r"(?<!\w)(?:" + "|".join(f"({pattern})" for pattern, _ in _BRAND_PATTERNS) + r")(?!\w)")
+
+
+def _stem_re(stems):
+    return re.compile(r"(?<!\w)(" + _alternation(stems) + r")\w*")
+
+
+_COUNTRY_RE = _stem_re(COUNTRY_STEMS)
+_BODY_TYPE_RE = _stem_re(BODY_TYPE_STEMS)
+_TRANSMISSION_RE = _stem_re(TRANSMISSION_STEMS)
+_DRIVE_RE = _stem_re(DRIVE_STEMS)
+_ENGINE_RE = _stem_re(ENGINE_STEMS)
+
+_NUMBER = r"\d+(?:[.,]\d+)?"
+_UNIT = r"(?:млн\w*|миллион\w*|мил(?!\w)|м(?!\w)|тыс\w*|т(?!\w)|к(?!\w)|k(?!\w))"
+_CURRENCY = r"(?:\s*(?:руб\w*|р(?!\w)\.?|₽))?"
+_MAX_OPS = ("до", "не дороже", "не более", "дешевле", "максимум", "за", "в пределах")
+_MIN_OPS = ("от", "дороже", "не менее", "не дешевле", "минимум")
+
+_YEAR_FROM_RE = re.compile(r"(?<!\w)(?:от|с|после|не старше|не раньше|новее)\s+(19[89]\d|20[0-3]\d)(?:\s*(?:г\.?|год\w*))?(?!\w)")
+_YEAR_TO_RE = re.compile(r"(?<!\w)(?:до|не новее|раньше)\s+(19[89]\d|20[0-3]\d)\s*(?:г\.?|год\w*)(?!\w)")
+_PRICE_RANGE_RE = re.compile(rf"(?<!\w)от\s+({_NUMBER})\s*({_UNIT})?\s*до\s+({_NUMBER})\s*({_UNIT})?{_CURRENCY}")
+_PRICE_RE = re.compile(rf"(?<!\w)(?:({_alternation(_MAX_OPS + _MIN_OPS)})\s+)?({_NUMBER})\s*({_UNIT})?{_CURRENCY}(?!\w)")
+_HORSEPOWER_RE = re.compile(r"(?<!\w)(?:(от|до|не менее|не более|больше|меньше)\s+)?(\d{2,4})\s*(?:л\.?\s*с\.?|лс|лошад\w*|сил\w*)")
+_SEATS_RE = re.compile(r"(?<!\w)(?:на\s+)?(\d)\s*-?\s*(?:х\s*)?мест\w*")
+_SEATS_WORDS_RE = re.compile(r"(?<!\w)(пяти|шести|семи|восьми)местн\w*")
+_DOORS_RE = re.compile(r"(?<!\w)(\d)\s*-?\s*(?:х\s*)?двер\w*")
+_DOORS_WORDS_RE = re.compile(r"(?<!\w)(двух|трех|трёх|четырех|четырёх|пяти)дверн\w*")
+_CLEARANCE_RE = re.compile(r"(?<!\w)клиренс\w*\s*(?:(от|до|не менее|не более|больше|меньше)\s+)?(\d{2,3})(?:\s*мм)?")
+_WORD_RE = re.compile(r"\w+")
+
+_NUMERALS = {"двух": 2, "трех": 3, "трёх": 3, "четырех": 4, "четырёх": 4, "пяти": 5, "шести": 6, "семи": 7, "восьми": 8}
+
+
+def _to_rubles(number, unit):
+    value = float(number.replace(",", "."))
+    if unit:
+        if unit.startswith(("млн", "миллион", "мил")) or unit == "м":
+            return int(value * 1_000_000)
+        return int(value * 1_000)
+    # Число без единиц считаем ценой, только если оно похоже на сумму в рублях
+    return int(value) if value >= 10_000 else None
+
+
+class FastFilterExtractor:
+    """
+    Локальный разбор простых сообщений ("седан", "полный привод", "тойота до 2 млн")
+    по словарям из lexicon.py. Возвращает словарь того же вида, что
+    OpenAiElasticsearchFilter.parse_data, и уверенность - долю значимых слов
+    сообщения, которые удалось распознать. При уверенности ниже threshold
+    сообщение уходит в модель.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.fast_path = 0
+        self.llm_path = 0
+        self._lock = threading.Lock()
+
+    def extract(self, text):
+        text = text.lower().replace("ё", "е")
+        data = {}
+        spans = []
+
+        def add_pair(key, left=None, right=None):
+            pair = list(data.get(key, ['NaN', 'NaN']))
+            if left is not None:
+                pair[0] = str(left)
+            if right is not None:
+                pair[1] = str(right)
+            data[key] = pair
+
+        def add_list(key, values):
+            current = data.get(key, [])
+            data[key] = current + [value for value in values if value not in current]
+
+        for match in _YEAR_FROM_RE.finditer(text):
+            add_pair('Год выпуска', left=match.group(1))
+            spans.append(match.span())
+        for match in _YEAR_TO_RE.finditer(text):
+            add_pair('Год выпуска', right=match.group(1))
+            spans.append(match.span())
+
+        for match in _HORSEPOWER_RE.finditer(text):
+            if match.group(1) in ("до", "не более", "меньше"):
+                add_pair('Лошадиные силы', right=match.group(2))
+            else:
+                add_pair('Лошадиные силы', left=match.group(2))
+            spans.append(match.span())
+
+        for match in _CLEARANCE_RE.finditer(text):
+            if match.group(1) in ("до", "не более", "меньше"):
+                add_pair('Клиренс', right=match.group(2))
+            else:
+                add_pair('Клиренс', left=match.group(2))
+            spans.append(match.span())
+
+        for match in _SEATS_RE.finditer(text):
+            add_pair('Количество мест', left=match.group(1))
+            spans.append(match.span())
+        for match in _SEATS_WORDS_RE.finditer(text):
+            add_pair('Количество мест', left=_NUMERALS[match.group(1)])
+            spans.append(match.span())
+
+        for match in _DOORS_RE.finditer(text):
+            add_pair('Количество дверей', left=match.group(1), right=match.group(1))
+            spans.append(match.span())
+        for match in _DOORS_WORDS_RE.finditer(text):
+            doors = _NUMERALS[match.group(1)]
+            add_pair('Количество дверей', left=doors, right=doors)
+            spans.append(match.span())
+
+        masked = self._mask(text, spans)
+        for match in _PRICE_RANGE_RE.finditer(masked):
+            low_unit = match.group(2) or match.group(4)
+            low = _to_rubles(match.group(1), low_unit)
+            high = _to_rubles(match.group(3), match.group(4))
+            if low is not None and high is not None:
+                data['Минимальная цена'] = str(low)
+                data['Максимальная цена'] = str(high)
+                spans.append(match.span())
+
+        masked = self._mask(text, spans)
+        for match in _PRICE_RE.finditer(masked):
+            price = _to_rubles(match.group(2), match.group(3))
+            if price is None:
+                continue
+            if match.group(1) in _MIN_OPS:
+                data['Минимальная цена'] = str(price)
+            else:
+                data['Максимальная цена'] = str(price)
+            spans.append(match.span())
+
+        for match in _BRAND_RE.finditer(text):
+            index = next(i for i, group in enumerate(match.groups()) if group is not None)
+            add_list('Марка автомобиля', [_BRAND_PATTERNS[index][1]])
+            spans.append(match.span())
+
+        for regex, key, lexicon in (
+            (_COUNTRY_RE, 'Страна', COUNTRY_STEMS),
+            (_BODY_TYPE_RE, 'Тип кузова', BODY_TYPE_STEMS),
+            (_TRANSMISSION_RE, 'Тип коробки', TRANSMISSION_STEMS),
+            (_DRIVE_RE, 'Привод', DRIVE_STEMS),
+            (_ENGINE_RE, 'Тип двигателя', ENGINE_STEMS),
+        ):
+            for match in regex.finditer(text):
+                value = lexicon[match.group(1)]
+                add_list(key, value if isinstance(value, list) else [value])
+                spans.append(match.span())
+
+        return data, self._confidence(text, spans) if data else 0.0
+
+    @staticmethod
+    def _mask(text, spans):
+        chars = list(text)
+        for start, end in spans:
+            chars[start:end] = " " * (end - start)
+        return "".join(chars)
+
+    @staticmethod
+    def _confidence(text, spans):
+        covered = 0
+        uncovered = 0
+        for match in _WORD_RE.finditer(text):
+            start, end = match.span()
+            if any(start < span_end and end > span_start for span_start, span_end in spans):
+                covered += 1
+            elif match.group() not in FILTER_STOP_WORDS:
+                uncovered += 1
+        return covered / (covered + uncovered) if covered else 0.0
+
+    def try_extract(self, text):
+        """Возвращает разобранный фильтр, если уверенность достаточна, иначе None."""
+        data, confidence = self.extract(text)
+        with self._lock:
+            if data and confidence >= self.threshold:
+                self.fast_path += 1
+            else:
+                self.llm_path += 1
+                data = None
+        logger.debug(f"Быстрый разбор '{text[:50]}': уверенность {confidence:.2f}")
+        return data
+
+    @staticmethod
+    def merge(current, data):
+        """Накладывает новые условия на текущий фильтр сессии."""
+        merged = {key: list(value) if isinstance(value, list) else value for key, value in EMPTY_FILTER.items()}
+        merged.update(current or {})
+        for key, value in data.items():
+            if key in _PAIR_KEYS and isinstance(merged.get(key), list) and len(merged[key]) == 2:
+                merged[key] = [new if new != 'NaN' else old for new, old in zip(value, merged[key])]
+            else:
+                merged[key] = value
+        return merged
+
+    def stats(self):
+        total = self.fast_path + self.llm_path
+        return {
+            "fast_path": self.fast_path,
+            "llm_path": self.llm_path,
+            "fast_path_share": round(self.fast_path / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,264 @@
+"""
+Структурное представление фильтра поиска, не зависящее от бэкенда.
+
+FilterSpec строится из словаря OpenAiElasticsearchFilter.parse_data, из CarFilter
+или из готового запроса Elasticsearch, затем вычисляется локально (CatalogColumns)
+или компилируется в канонический запрос Elasticsearch (compile_query).
+"""
+from .models import CarFilter
+
+NUMERIC_FIELDS = (
+    "start_year", "end_year", "price", "fuel_consumption", "seats",
+    "doors", "horsepower", "clearance", "rating",
+)
+CATEGORICAL_FIELDS = ("brand", "country", "drive", "engine_type", "body_type", "transmission")
+
+# Поля фильтра в формате ответа модели: (ключ, поле метаданных)
+_DATA_PAIRS = (
+    ("Расход топлива", "fuel_consumption"),
+    ("Количество мест", "seats"),
+    ("Количество дверей", "doors"),
+    ("Лошадиные силы", "horsepower"),
+    ("Клиренс", "clearance"),
+)
+_DATA_LISTS = (
+    ("Марка автомобиля", "brand"),
+    ("Страна", "country"),
+    ("Привод", "drive"),
+    ("Тип двигателя", "engine_type"),
+    ("Тип кузова", "body_type"),
+    ("Тип коробки", "transmission"),
+)
+
+# Значения, которые встречаются в каталоге под другим написанием
+CATALOG_SYNONYMS = {
+    "transmission": {"механическая": ["механика"]},
+    "body_type": {"внедорожник": ["suv"], "suv": ["внедорожник"]},
+    "engine_type": {"электро": ["электричество"]},
+}
+
+# Значения, которые OpenAiElasticsearchFilter.get_filter добавляет к непустому списку:
+# в каталоге они встречаются у моделей, для которых разбор описания дал неточное значение
+FILTER_WIDENING = {
+    "transmission": ["Механика"],
+    "drive": ["Передний"],
+    "engine_type": ["Бензин"],
+    "body_type": ["a", "Седан", "ом", "e", "а составляет", "а седана", "а составляют", "фургон", "SUV", "длиной"],
+}
+
+
+def normalize_value(value):
+    return str(getattr(value, "value", value)).strip().lower()
+
+
+class FilterSpec:
+    """Набор условий фильтра: ranges - {поле: (от, до)}, terms - {поле: множество значений}."""
+
+    def __init__(self, ranges=None, terms=None):
+        self.ranges = dict(ranges or {})
+        self.terms = {field: frozenset(values) for field, values in (terms or {}).items()}
+
+    def add_range(self, field, gte=None, lte=None):
+        if gte is None and lte is None:
+            return
+        old_gte, old_lte = self.ranges.get(field, (None, None))
+        if old_gte is not None and gte is not None:
+            gte = max(gte, old_gte)
+        if old_lte is not None and lte is not None:
+            lte = min(lte, old_lte)
+        self.ranges[field] = (gte if gte is not None else old_gte, lte if lte is not None else old_lte)
+
+    def add_terms(self, field, values):
+        values = {normalize_value(value) for value in values if normalize_value(value) not in ("", "nan")}
+        if not values:
+            return
+        for value in list(values):
+            values.update(CATALOG_SYNONYMS.get(field, {}).get(value, []))
+        self.terms[field] = frozenset(values) & self.terms[field] if field in self.terms else frozenset(values)
+
+    def is_empty(self):
+        return not self.ranges and not self.terms
+
+    def __eq__(self, other):
+        return isinstance(other, FilterSpec) and self.ranges == other.ranges and self.terms == other.terms
+
+    def __repr__(self):
+        return f"FilterSpec(ranges={self.ranges}, terms={ {k: sorted(v) for k, v in self.terms.items()} })"
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number
+
+
+def spec_from_data(data):
+    """
+    Строит FilterSpec из словаря OpenAiElasticsearchFilter.parse_data. Неуказанные (NaN) поля
+    пропускаются, к заданным спискам добавляются FILTER_WIDENING, как в get_filter.
+    """
+    spec = FilterSpec()
+    data = data or {}
+
+    def pair(key):
+        value = data.get(key)
+        if isinstance(value, list) and len(value) == 2:
+            return _number(value[0]), _number(value[1])
+        return None, None
+
+    year_left, year_right = pair("Год выпуска")
+    if year_left is not None:
+        spec.add_range("start_year", gte=year_left)
+    if year_right is not None:
+        spec.add_range("end_year", lte=year_right)
+
+    spec.add_range("price", gte=_number(data.get("Минимальная цена")), lte=_number(data.get("Максимальная цена")))
+
+    for key, field in _DATA_PAIRS:
+        left, right = pair(key)
+        spec.add_range(field, gte=left, lte=right)
+
+    for key, field in _DATA_LISTS:
+        value = data.get(key)
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, list):
+            if any(normalize_value(item) not in ("", "nan") for item in value):
+                value = value + FILTER_WIDENING.get(field, [])
+            spec.add_terms(field, value)
+
+    return spec
+
+
+def spec_from_car_filter(car_filter: CarFilter):
+    spec = FilterSpec()
+    if car_filter.min_year is not None:
+        spec.add_range("start_year", gte=car_filter.min_year)
+    if car_filter.max_year is not None:
+        spec.add_range("end_year", lte=car_filter.max_year)
+    spec.add_range("price", gte=car_filter.min_price, lte=car_filter.max_price)
+    spec.add_range("fuel_consumption", gte=car_filter.min_fuel_consumption, lte=car_filter.max_fuel_consumption)
+    spec.add_range("seats", gte=car_filter.min_seats, lte=car_filter.max_seats)
+    spec.add_range("doors", gte=car_filter.min_doors, lte=car_filter.max_doors)
+    spec.add_range("horsepower", gte=car_filter.min_horsepower, lte=car_filter.max_horsepower)
+    spec.add_range("clearance", gte=car_filter.min_clearance, lte=car_filter.max_clearance)
+    spec.add_terms("brand", car_filter.brands)
+    spec.add_terms("country", car_filter.countries)
+    spec.add_terms("drive", car_filter.drive_types)
+    spec.add_terms("engine_type", car_filter.fuel_types)
+    spec.add_terms("body_type", car_filter.body_types)
+    spec.add_terms("transmission", car_filter.transmissions)
+    return spec
+
+
+def _field(path):
+    path = path[len("metadata."):] if path.startswith("metadata.") else path
+    return path[:-len(".keyword")] if path.endswith(".keyword") else path
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _should_terms(clauses):
+    """Возвращает (поле, значения), если should состоит из match/term/terms по одному полю."""
+    field, values = None, []
+    for clause in clauses:
+        if "match" in clause or "term" in clause:
+            path, expected = next(iter((clause.get("match") or clause.get("term")).items()))
+            if isinstance(expected, dict):
+                expected = expected.get("query", expected.get("value"))
+            expected = [expected]
+        elif "terms" in clause:
+            path, expected = next(iter(clause["terms"].items()))
+        else:
+            raise ValueError(f"Неподдерживаемое условие в should: {list(clause)}")
+        if field is not None and _field(path) != field:
+            raise ValueError("Условия should по разным полям не поддерживаются")
+        field = _field(path)
+        values.extend(expected)
+    return field, values
+
+
+def spec_from_query(query):
+    """
+    Переводит запрос Elasticsearch (список или bool) в FilterSpec. Поддерживается то,
+    что строят OpenAiElasticsearchFilter.get_filter и compile_query: must/filter с range,
+    match/term/terms и вложенные bool.should по одному полю. Условия range переносятся
+    как есть, поэтому документы без значения поля не проходят, как и в Elasticsearch.
+    """
+    spec = FilterSpec()
+
+    def visit(clause):
+        if "bool" in clause:
+            body = clause["bool"]
+            if body.get("must_not"):
+                raise ValueError("must_not не поддерживается")
+            for key in ("must", "filter"):
+                for item in _as_list(body.get(key, [])):
+                    visit(item)
+            should = _as_list(body.get("should", []))
+            if should:
+                field, values = _should_terms(should)
+                spec.terms[field] = frozenset(normalize_value(v) for v in values) & spec.terms[field] \
+                    if field in spec.terms else frozenset(normalize_value(v) for v in values)
+        elif "range" in clause:
+            for path, bounds in clause["range"].items():
+                field = _field(path)
+                spec.ranges.setdefault(field, (None, None))
+                spec.add_range(field, gte=bounds.get("gte"), lte=bounds.get("lte"))
+        elif "match" in clause or "term" in clause or "terms" in clause:
+            field, values = _should_terms([clause])
+            values = frozenset(normalize_value(v) for v in values)
+            spec.terms[field] = values & spec.terms[field] if field in spec.terms else values
+        elif "match_all" in clause:
+            pass
+        else:
+            raise ValueError(f"Неподдерживаемое условие фильтра: {list(clause)}")
+
+    for item in _as_list(query or []):
+        visit(item)
+    return spec
+
+
+def to_spec(filter):
+    """Приводит фильтр любого поддерживаемого вида к FilterSpec."""
+    if filter is None:
+        return FilterSpec()
+    if isinstance(filter, FilterSpec):
+        return filter
+    if isinstance(filter, CarFilter):
+        return spec_from_car_filter(filter)
+    if isinstance(filter, dict) and "bool" not in filter:
+        return spec_from_data(filter)
+    return spec_from_query(filter)
+
+
+def _canonical_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def compile_query(filter):
+    """
+    Компилирует фильтр в минимальный канонический запрос Elasticsearch:
+    все условия в bool.filter (не участвуют в скоринге и попадают в кэш фильтров),
+    range только для заданных границ, terms по нормализованным keyword-полям.
+    Условия и значения упорядочены, поэтому одинаковые фильтры дают
+    побайтно одинаковые запросы и попадают в query cache и request cache.
+    """
+    spec = to_spec(filter)
+    clauses = []
+    for field in sorted(spec.ranges):
+        gte, lte = spec.ranges[field]
+        bounds = {}
+        if gte is not None:
+            bounds["gte"] = _canonical_number(gte)
+        if lte is not None:
+            bounds["lte"] = _canonical_number(lte)
+        clauses.append({"range": {f"metadata.{field}": bounds}})
+    for field in sorted(spec.terms):
+        clauses.append({"terms": {f"metadata.{field}": sorted(spec.terms[field])}})
+    return [{"bool": {"filter": clauses}}] if clauses else []
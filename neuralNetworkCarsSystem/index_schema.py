@@ -0,0 +1,159 @@
+"""
+Версионированное описание индекса каталога и его однократная инициализация.
+
+Данные лежат в индексе <alias>_v<версия>, бот и загрузка работают через алиас.
+При смене INDEX_VERSION bootstrap_index создает новый индекс, переносит в него
+документы через _reindex и атомарно переключает алиас - старый индекс остается
+доступным для поиска до переключения, индекс не закрывается.
+"""
+import os
+
+from elasticsearch import BadRequestError
+
+from utils import setup_logger
+
+logger = setup_logger("index_schema")
+
+# Увеличивается при любом изменении настроек или маппинга ниже
+INDEX_VERSION = 2
+EMBEDDING_DIMS = 1536
+
+KEYWORD_FIELDS = ("id", "brand", "model", "country", "drive", "engine_type", "body_type", "transmission")
+INTEGER_FIELDS = ("start_year", "end_year", "price", "seats", "doors", "horsepower", "clearance")
+FLOAT_FIELDS = ("fuel_consumption", "rating")
+STORED_TEXT_FIELDS = ("desc_summarization", "desc_plus", "desc_minus")
+
+
+def index_definition(dims=None):
+    """Настройки и маппинг индекса каталога текущей версии."""
+    dims = dims or int(os.getenv("EMBEDDING_DIMS", EMBEDDING_DIMS))
+
+    metadata = {}
+    for field in KEYWORD_FIELDS:
+        metadata[field] = {"type": "keyword", "normalizer": "lowercase", "ignore_above": 256}
+    for field in INTEGER_FIELDS:
+        metadata[field] = {"type": "integer", "ignore_malformed": True}
+    for field in FLOAT_FIELDS:
+        metadata[field] = {"type": "float", "ignore_malformed": True}
+    for field in STORED_TEXT_FIELDS:
+        metadata[field] = {"type": "text", "index": False}
+    metadata["images"] = {"type": "keyword", "index": False, "doc_values": False}
+
+    return {
+        "settings": {
+            "analysis": {
+                "analyzer": {
+                    "keyword_lowercase": {
+                        "type": "custom",
+                        "tokenizer": "keyword",
+                        "filter": ["lowercase"]
+                    }
+                },
+                "normalizer": {
+                    "lowercase": {
+                        "type": "custom",
+                        "filter": ["lowercase", "trim"]
+                    }
+                }
+            }
+        },
+        "mappings": {
+            "_meta": {"version": INDEX_VERSION},
+            "dynamic": False,
+            "properties": {
+                "text": {"type": "text"},
+                "vector": {
+                    "type": "dense_vector",
+                    "dims": dims,
+                    "index": True,
+                    "similarity": "cosine",
+                    "index_options": {
+                        "type": "hnsw",
+                        "m": int(os.getenv("HNSW_M", 16)),
+                        "ef_construction": int(os.getenv("HNSW_EF_CONSTRUCTION", 100)),
+                    },
+                },
+                "metadata": {"properties": metadata},
+            },
+        },
+    }
+
+
+def versioned_name(alias, version=INDEX_VERSION):
+    return f"{alias}_v{version}"
+
+
+def stored_version(es_client, alias):
+    """Версия из _meta индекса за алиасом (0 для индексов без версии), None - если индекса нет."""
+    if not es_client.indices.exists(index=alias):
+        return None
+    mappings = es_client.indices.get_mapping(index=alias)
+    return max(body["mappings"].get("_meta", {}).get("version", 0) for body in mappings.values())
+
+
+def _create(es_client, index_name, alias=None):
+    body = index_definition()
+    if alias is not None:
+        body["aliases"] = {alias: {}}
+    try:
+        es_client.indices.create(index=index_name, body=body)
+        logger.info(f"Создан индекс {index_name} (версия {INDEX_VERSION})")
+    except BadRequestError as e:
+        # Другой процесс успел создать индекс раньше
+        if e.error != "resource_already_exists_exception":
+            raise
+        logger.debug(f"Индекс {index_name} уже существует")
+
+
+def require_index(es_client, alias="langchain_index"):
+    """
+    Проверяет, что индекс за алиасом существует и имеет текущую версию, без
+    создания и миграции - для частичных обновлений уже загруженного каталога.
+    """
+    version = stored_version(es_client, alias)
+    if version is None:
+        raise RuntimeError(f"Индекс {alias} не найден: сначала загрузите каталог (prepare_database.py)")
+    if version != INDEX_VERSION:
+        raise RuntimeError(f"Индекс {alias} версии {version}, ожидается {INDEX_VERSION}: "
+                           f"сначала выполните миграцию (prepare_database.py)")
+    return versioned_name(alias)
+
+
+def bootstrap_index(es_client, alias="langchain_index"):
+    """
+    Приводит индекс за алиасом к текущей версии. Идемпотентна: если версия
+    совпадает, выполняется одно чтение маппинга. Возвращает имя индекса с данными.
+    """
+    target = versioned_name(alias)
+    version = stored_version(es_client, alias)
+
+    if version is None:
+        _create(es_client, target, alias)
+        return target
+    if version == INDEX_VERSION:
+        logger.debug(f"Индекс {alias} актуален (версия {version})")
+        return target
+
+    logger.info(f"Миграция индекса {alias}: версия {version} -> {INDEX_VERSION}")
+    _create(es_client, target)
+    response = es_client.options(request_timeout=3600).reindex(
+        source={"index": alias}, dest={"index": target},
+        wait_for_completion=True, refresh=True, conflicts="proceed",
+    )
+    if response.get("failures"):
+        logger.error(f"Ошибки переноса документов в {target}: {response['failures'][:5]}")
+        raise RuntimeError(f"Не удалось перенести документы в {target}")
+    logger.info(f"Перенесено документов: {response.get('total', 0)}")
+
+    if es_client.indices.exists_alias(name=alias):
+        old_indices = list(es_client.indices.get_alias(name=alias))
+        actions = [{"remove": {"index": index, "alias": alias}} for index in old_indices]
+        actions.append({"add": {"index": target, "alias": alias}})
+        message = f"Алиас {alias} переключен на {target}, прежние индексы сохранены: {old_indices}"
+    else:
+        # Индекс без версии с именем алиаса удаляется в том же атомарном запросе
+        actions = [{"add": {"index": target, "alias": alias}}, {"remove_index": {"index": alias}}]
+        message = f"Индекс {alias} заменен алиасом на {target}"
+    es_client.indices.update_aliases(actions=actions)
+    logger.info(message)
+    return target
@@ -0,0 +1,404 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+
+from elasticsearch import NotFoundError
+from elasticsearch.helpers import scan, streaming_bulk
+from tqdm import tqdm
+
+from utils import setup_logger, AdaptiveRateLimiter
+from .AutoAssistant import RateLimitError
+from .price_refresh import REFRESHED_FIELDS
+
+logger = setup_logger("ingest")
+
+
+def estimate_tokens(text):
+    # Токенизатора в зависимостях нет: для cl100k русский текст дает около токена на 2 символа
+    return len(text) // 2 + 1
+
+
+def clean_value(value):
+    """Приводит значения метаданных к JSON: numpy-скаляры в числа Python, NaN в null."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, dict):
+        return {key: clean_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [clean_value(item) for item in value]
+    return value
+
+
+HASH_FIELDS = ("content_hash", "text_hash")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def content_hash(doc):
+    """Хэш текста и метаданных документа (без самих хэшей и полей обновления цен)."""
+    metadata = {key: value for key, value in doc.metadata.items()
+                if key not in HASH_FIELDS and key not in REFRESHED_FIELDS}
+    payload = json.dumps([doc.page_content, clean_value(metadata)], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def add_hashes(documents):
+    """Записывает content_hash и text_hash в метаданные документов."""
+    for doc in documents:
+        doc.metadata["text_hash"] = text_hash(doc.page_content)
+        doc.metadata["content_hash"] = content_hash(doc)
+    return documents
+
+
+def bulk_write(es_client, actions, chunk_size=500, ignore_missing=False):
+    """Выполняет действия streaming_bulk и возвращает список отклоненных."""
+    errors = []
+    for ok, item in streaming_bulk(es_client, actions, chunk_size=chunk_size, raise_on_error=False,
+                                   max_retries=5, initial_backoff=2):
+        if not ok:
+            result = next(iter(item.values()), {})
+            if ignore_missing and result.get("status") == 404:
+                continue
+            errors.append(item)
+    return errors
+
+
+class IngestCheckpoint:
+    """
+    Журнал подтвержденных Elasticsearch пакетов: строка JSON со списком id на пакет.
+    Первая строка - заголовок {"target": ...} с индексом, в который шла загрузка;
+    журнал другого или пересозданного индекса не используется и удаляется.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.target = None
+
+    def load(self, target=None):
+        self.target = target
+        if not self.path or not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0]) if lines else None
+        except json.JSONDecodeError:
+            header = None
+        if not isinstance(header, dict) or header.get("target") != target:
+            logger.warning(f"Журнал загрузки {self.path} относится к другому индексу, загрузка начнется заново")
+            self.clear()
+            return set()
+        done = set()
+        for line in lines[1:]:
+            try:
+                done.update(json.loads(line))
+            except json.JSONDecodeError:
+                # Последняя строка могла не дописаться при падении
+                break
+        return done
+
+    def append(self, ids):
+        if not self.path:
+            return
+        new = not os.path.exists(self.path)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new:
+                f.write(json.dumps({"target": self.target}) + "\n")
+            f.write(json.dumps(ids) + "\n")
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BulkIngestor:
+    """
+    Загрузка каталога в Elasticsearch: документы группируются в пакеты по оценке
+    числа токенов, несколько пакетов эмбеддятся параллельно через AsyncOpenAIApi,
+    готовые пакеты пишутся streaming_bulk в формате ElasticsearchStore
+    (text, vector, metadata). Частота запросов к эмбеддингам регулируется
+    AdaptiveRateLimiter по ответам 429. Id подтвержденных пакетов пишутся
+    в журнал, повторный запуск после сбоя пропускает их.
+
+    embedding_store - cache.EmbeddingStore: тексты, эмбеддинги которых уже
+    сохранены (по text_hash), повторно в API не отправляются.
+    """
+
+    def __init__(self, es_client, index_name, async_api, batch_tokens=None, batch_size=None, concurrency=None,
+                 chunk_size=500, checkpoint_path=None, limiter=None, max_rate_limit_retries=20, embedding_store=None):
+        self.es = es_client
+        self.index_name = index_name
+        self.async_api = async_api
+        self.batch_tokens = batch_tokens or int(os.getenv("INGEST_BATCH_TOKENS", 50000))
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 256))
+        self.concurrency = concurrency or int(os.getenv("INGEST_CONCURRENCY", 4))
+        self.chunk_size = chunk_size
+        self.checkpoint = IngestCheckpoint(
+            checkpoint_path if checkpoint_path is not None else os.getenv("INGEST_CHECKPOINT_PATH", "ingest_checkpoint.jsonl")
+        )
+        self.limiter = limiter or AdaptiveRateLimiter(rate=float(os.getenv("INGEST_RATE", 5)))
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.embedding_store = embedding_store
+        self.embedded = 0
+        self.reused = 0
+
+    def target(self):
+        """Имя и uuid индекса за index_name (алиас указывает на конкретный индекс)."""
+        try:
+            indices = self.es.indices.get(index=self.index_name)
+        except NotFoundError:
+            return self.index_name
+        return ",".join(f"{name}/{body['settings']['index']['uuid']}" for name, body in sorted(indices.items()))
+
+    def batches(self, documents, ids, done=()):
+        """Пакеты (документы, id) с ограничением по токенам и числу документов."""
+        batch_docs, batch_ids, tokens = [], [], 0
+        for doc, doc_id in zip(documents, ids):
+            doc_id = str(doc_id)
+            if doc_id in done:
+                continue
+            doc_tokens = estimate_tokens(doc.page_content)
+            if batch_docs and (tokens + doc_tokens > self.batch_tokens or len(batch_docs) >= self.batch_size):
+                yield batch_docs, batch_ids
+                batch_docs, batch_ids, tokens = [], [], 0
+            batch_docs.append(doc)
+            batch_ids.append(doc_id)
+            tokens += doc_tokens
+        if batch_docs:
+            yield batch_docs, batch_ids
+
+    async def _embed(self, docs):
+        hashes = [doc.metadata.get("text_hash") or text_hash(doc.page_content) for doc in docs]
+        known = self.embedding_store.get_many(hashes) if self.embedding_store is not None else {}
+        missing = {}
+        for doc, key in zip(docs, hashes):
+            if key not in known:
+                missing.setdefault(key, doc.page_content)
+
+        if missing:
+            vectors = await self._request_embeddings(list(missing.values()))
+            fresh = list(zip(missing.keys(), vectors))
+            if self.embedding_store is not None:
+                self.embedding_store.set_many(fresh)
+            known.update(fresh)
+        self.embedded += len(missing)
+        self.reused += len(docs) - len(missing)
+        return [known[key] for key in hashes]
+
+    async def _request_embeddings(self, texts):
+        for _ in range(self.max_rate_limit_retries):
+            await self.limiter.acquire()
+            try:
+                vectors = await self.async_api.get_embedding(texts)
+            except RateLimitError as e:
+                self.limiter.on_rate_limit(e.retry_after)
+                continue
+            self.limiter.on_success()
+            return vectors
+        raise RuntimeError(f"Эмбеддинги не получены после {self.max_rate_limit_retries} ответов 429")
+
+    def _index(self, docs, ids, vectors):
+        actions = (
+            {
+                "_op_type": "index",
+                "_index": self.index_name,
+                "_id": doc_id,
+                "_source": {"text": doc.page_content, "vector": vector, "metadata": clean_value(doc.metadata)},
+            }
+            for doc, doc_id, vector in zip(docs, ids, vectors)
+        )
+        errors = bulk_write(self.es, actions, self.chunk_size)
+        if errors:
+            raise RuntimeError(f"Elasticsearch отклонил {len(errors)} документов: {errors[:3]}")
+
+    async def run(self, documents, ids):
+        """
+        Загружает документы и возвращает статистику: documents, seconds, docs_per_second,
+        rate_limited, embedded (текстов отправлено в API), reused (взято из embedding_store).
+        """
+        assert len(documents) == len(ids)
+        done = self.checkpoint.load(self.target())
+        pending = sum(1 for doc_id in ids if str(doc_id) not in done)
+        if done:
+            logger.info(f"Продолжение загрузки: {len(documents) - pending} документов уже в индексе")
+
+        batch_queue = asyncio.Queue()
+        for batch in self.batches(documents, ids, done):
+            batch_queue.put_nowait(batch)
+        index_queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        progress = tqdm(total=pending, desc="Uploading documents to Elasticsearch", unit="doc")
+        started_at = time.perf_counter()
+        indexed = 0
+
+        async def embed_worker():
+            while True:
+                try:
+                    docs, batch_ids = batch_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                vectors = await self._embed(docs)
+                await index_queue.put((docs, batch_ids, vectors))
+
+        async def index_worker():
+            nonlocal indexed
+            while True:
+                item = await index_queue.get()
+                if item is None:
+                    return
+                docs, batch_ids, vectors = item
+                await asyncio.to_thread(self._index, docs, batch_ids, vectors)
+                self.checkpoint.append(batch_ids)
+                indexed += len(batch_ids)
+                progress.update(len(batch_ids))
+
+        indexer = asyncio.create_task(index_worker())
+        embedding = asyncio.gather(*(embed_worker() for _ in range(self.concurrency)))
+        try:
+            # Индексатор завершается только по None, поэтому раньше эмбеддингов он может выйти лишь с ошибкой
+            await asyncio.wait([embedding, indexer], return_when=asyncio.FIRST_COMPLETED)
+            if indexer.done():
+                indexer.result()
+            await embedding
+            await index_queue.put(None)
+            await indexer
+        except BaseException:
+            embedding.cancel()
+            indexer.cancel()
+            await asyncio.gather(embedding, indexer, return_exceptions=True)
+            raise
+        finally:
+            progress.close()
+            seconds = time.perf_counter() - started_at
+            logger.info(f"Загружено {indexed} документов за {seconds:.1f} с "
+                        f"({indexed / seconds if seconds else 0:.1f} док/с), ответов 429: {self.limiter.rate_limited}")
+
+        self.es.indices.refresh(index=self.index_name)
+        self.checkpoint.clear()
+        return {
+            "documents": indexed,
+            "seconds": round(seconds, 1),
+            "docs_per_second": round(indexed / seconds, 1) if seconds else 0.0,
+            "rate_limited": self.limiter.rate_limited,
+            "embedded": self.embedded,
+            "reused": self.reused,
+        }
+
+
+class IncrementalIndexer:
+    """
+    Синхронизация индекса с каталогом по хэшам документов. Новые документы и
+    документы с измененным текстом загружаются через BulkIngestor (эмбеддинги
+    берутся из EmbeddingStore, если текст уже встречался), при изменении только
+    метаданных выполняется частичное обновление, отсутствующие в каталоге id удаляются.
+    Цена и рейтинг документов, уже лежащих в индексе, берутся из индекса
+    (ими владеет price_refresh), а не из датасета.
+    """
+
+    def __init__(self, es_client, index_name, ingestor, chunk_size=500):
+        self.es = es_client
+        self.index_name = index_name
+        self.ingestor = ingestor
+        self.chunk_size = chunk_size
+
+    def index_state(self):
+        """
+        {id: (content_hash, text_hash)} для всех документов индекса и
+        {id: {поле: значение}} заданных в индексе полей REFRESHED_FIELDS.
+        """
+        state = {}
+        refreshed = {}
+        source = [f"metadata.{field}" for field in HASH_FIELDS + REFRESHED_FIELDS]
+        for hit in scan(self.es, index=self.index_name, query={"query": {"match_all": {}}}, _source=source):
+            metadata = hit.get("_source", {}).get("metadata", {})
+            state[hit["_id"]] = (metadata.get("content_hash"), metadata.get("text_hash"))
+            fields = {field: metadata[field] for field in REFRESHED_FIELDS if metadata.get(field) is not None}
+            if fields:
+                refreshed[hit["_id"]] = fields
+        return state, refreshed
+
+    @staticmethod
+    def keep_refreshed(by_id, doc_ids, refreshed):
+        """Переносит в документы датасета цену и рейтинг из индекса, чтобы синхронизация не вернула старые."""
+        for doc_id in doc_ids:
+            fields = refreshed.get(doc_id)
+            if fields:
+                by_id[doc_id].metadata.update(fields)
+
+    def diff(self, documents, ids, state):
+        """Раскладывает документы на new, changed, metadata, unchanged и removed (списки id)."""
+        result = {"new": [], "changed": [], "metadata": [], "unchanged": []}
+        for doc, doc_id in zip(documents, ids):
+            doc_id = str(doc_id)
+            if doc_id not in state:
+                result["new"].append(doc_id)
+                continue
+            old_content, old_text = state[doc_id]
+            if old_content == doc.metadata["content_hash"]:
+                result["unchanged"].append(doc_id)
+            elif old_text == doc.metadata["text_hash"]:
+                result["metadata"].append(doc_id)
+            else:
+                result["changed"].append(doc_id)
+        catalog = {str(doc_id) for doc_id in ids}
+        result["removed"] = [doc_id for doc_id in state if doc_id not in catalog]
+        return result
+
+    def seed_embeddings(self, ids):
+        """Переносит векторы документов, загруженных без хэшей, в EmbeddingStore."""
+        store = self.ingestor.embedding_store
+        if store is None or not ids:
+            return 0
+        seeded = 0
+        for start in range(0, len(ids), 1000):
+            query = {"query": {"ids": {"values": ids[start:start + 1000]}}}
+            items = [
+                (text_hash(hit["_source"]["text"]), hit["_source"]["vector"])
+                for hit in scan(self.es, index=self.index_name, query=query, _source=["text", "vector"])
+                if hit["_source"].get("text") and hit["_source"].get("vector")
+            ]
+            store.set_many(items)
+            seeded += len(items)
+        logger.info(f"В хранилище эмбеддингов перенесено {seeded} векторов из индекса")
+        return seeded
+
+    async def run(self, documents, ids):
+        add_hashes(documents)
+        state, refreshed = self.index_state()
+        diff = self.diff(documents, ids, state)
+        logger.info("Изменения каталога: " + ", ".join(f"{key}={len(value)}" for key, value in diff.items()))
+
+        self.seed_embeddings([doc_id for doc_id in diff["changed"] if state[doc_id][1] is None])
+
+        by_id = {str(doc_id): doc for doc, doc_id in zip(documents, ids)}
+        self.keep_refreshed(by_id, diff["changed"] + diff["metadata"], refreshed)
+        to_index = diff["new"] + diff["changed"]
+        stats = {"embedded": 0, "reused": 0}
+        if to_index:
+            stats = await self.ingestor.run([by_id[doc_id] for doc_id in to_index], to_index)
+
+        actions = [
+            {"_op_type": "update", "_index": self.index_name, "_id": doc_id,
+             "doc": {"metadata": clean_value(by_id[doc_id].metadata)}}
+            for doc_id in diff["metadata"]
+        ] + [
+            {"_op_type": "delete", "_index": self.index_name, "_id": doc_id}
+            for doc_id in diff["removed"]
+        ]
+        if actions:
+            errors = await asyncio.to_thread(bulk_write, self.es, actions, self.chunk_size, True)
+            if errors:
+                raise RuntimeError(f"Elasticsearch отклонил {len(errors)} обновлений: {errors[:3]}")
+            self.es.indices.refresh(index=self.index_name)
+
+        return {
+            **{key: len(value) for key, value in diff.items()},
+            "embedded": stats["embedded"],
+            "reused": stats["reused"],
+        }
@@ -0,0 +1,97 @@
+"""Словари предметной области: марки, синонимы характеристик и т.п."""
+
+CAR_BRANDS = [
+    "Abarth", "Acura", "AITO", "Aiways", "Alfa Romeo", "Alpina", "Arcfox", "Aston Martin", "Audi", "Avatr",
+    "BAIC", "Bajaj", "Barkas", "BAW", "Bedford", "Belgee", "Bentley", "BMW", "Brilliance", "Bugatti", "Buick", "BYD",
+    "Cadillac", "Changan", "Changhe", "Chery", "Chevrolet", "Chrysler", "Ciimo", "Citroen", "Dacia", "Dadi", "Daewoo",
+    "Daihatsu", "Datsun", "Dayun", "DeLorean", "Denza", "Dodge", "Dongfeng", "Dorcen", "DW Hower", "EXEED", "FAW",
+    "Ferrari", "Fiat", "Fisker", "Ford", "Forthing", "Foton", "GAC", "Geely", "Genesis", "Geo", "GMC", "Great Wall",
+    "Hafei", "Haima", "Haval", "Hawtai", "HiPhi", "Holden", "Honda", "Hongqi", "Hozon", "Huanghai", "Hummer", "Hyundai",
+    "iCAR", "IM Motors", "Infiniti", "Iran Khodro", "Isuzu", "JAC", "Jaecoo", "Jaguar", "Jeep", "Jetour", "Jetta",
+    "Jinbei", "JMC", "JMEV", "Kaiyi", "KG Mobility", "Kia", "Knewstar", "Kuayue", "Lamborghini", "Lancia", "Land Rover",
+    "Landwind", "Leapmotor", "Lexus", "Li", "Lifan", "Lincoln", "Livan", "Lotus", "Lucid", "Luxeed", "Luxgen", "Lynk & Co",
+    "M-Hero", "Marussia", "Maserati", "Maxus", "Maybach", "Mazda", "McLaren", "Mercedes-Benz", "Mercury", "MG", "MINI",
+    "Mitsubishi", "Mitsuoka", "Nio", "Nissan", "Oldsmobile", "OMODA", "Opel", "ORA", "Oshan", "Oting", "Pagani", "Perodua",
+    "Peugeot", "Piaggio", "Plymouth", "Polar Stone", "Polestar", "Pontiac", "Porsche", "Qingling", "Radar", "RAM", "Ravon",
+    "Renault", "Renault Samsung", "Rimac", "Rising Auto", "Rivian", "Roewe", "Rolls-Royce", "Rover", "Saab", "SAIPA",
+    "Saturn", "Scion", "SEAT", "Seres", "Shineray", "Shuanghuan", "Skoda", "Skywell", "Smart", "Solaris", "Soueast",
+    "SsangYong", "Subaru", "Suzuki", "SWM", "Tank", "Tesla", "Tianma", "Tianye", "Toyota", "Venucia", "VGV", "Volkswagen",
+    "Volvo", "Vortex", "Voyah", "Wartburg", "Weltmeister", "WEY", "Wuling", "Xcite", "Xiaomi", "Xpeng", "Zeekr", "Zotye",
+    "ZX", "Амберавто", "Амбертрак", "Аурус", "Богдан", "Волга", "ГАЗ", "Донинвест", "ЗАЗ", "ЗИЛ", "ЗиС", "ИЖ", "Лада",
+    "ЛуАЗ", "Москвич", "Соллерс", "ТагАЗ", "УАЗ", "Эволют"
+]
+
+# Марки, которые совпадают с обычными словами и не распознаются без контекста
+AMBIGUOUS_BRANDS = {"Li", "Geo", "Radar", "Tank", "Smart", "ГАЗ", "Rover", "Mercury"}
+
+# Русские написания популярных марок. "джип" сюда не входит: так называют любой внедорожник (BODY_TYPE_STEMS)
+BRAND_ALIASES = {
+    "тойота": "Toyota", "тоёта": "Toyota", "киа": "Kia", "хендай": "Hyundai", "хендэ": "Hyundai",
+    "хундай": "Hyundai", "хёндай": "Hyundai", "хюндай": "Hyundai", "фольксваген": "Volkswagen",
+    "фольц": "Volkswagen", "мерседес": "Mercedes-Benz", "мерс": "Mercedes-Benz", "бмв": "BMW",
+    "ауди": "Audi", "лада": "Лада", "ваз": "Лада", "мазда": "Mazda", "ниссан": "Nissan",
+    "хонда": "Honda", "шкода": "Skoda", "рено": "Renault", "мицубиси": "Mitsubishi",
+    "митсубиси": "Mitsubishi", "субару": "Subaru", "лексус": "Lexus", "форд": "Ford",
+    "шевроле": "Chevrolet", "шевролет": "Chevrolet", "джили": "Geely", "чери": "Chery",
+    "хавал": "Haval", "хавейл": "Haval", "пежо": "Peugeot", "опель": "Opel", "вольво": "Volvo",
+    "порше": "Porsche", "ситроен": "Citroen", "сузуки": "Suzuki", "инфинити": "Infiniti",
+    "ленд ровер": "Land Rover", "лэнд ровер": "Land Rover", "ягуар": "Jaguar",
+    "тесла": "Tesla", "чанган": "Changan", "эксид": "EXEED", "омода": "OMODA", "джетур": "Jetour",
+    "танк": "Tank", "зикр": "Zeekr", "уаз": "УАЗ", "москвич": "Москвич", "дэу": "Daewoo",
+    "деу": "Daewoo", "генезис": "Genesis", "кадиллак": "Cadillac", "лифан": "Lifan",
+}
+
+COUNTRY_STEMS = {
+    "японск": "Japan", "японц": "Japan", "япони": "Japan",
+    "корейск": "South Korea", "корейц": "South Korea", "коре": "South Korea",
+    "немецк": "Germany", "немц": "Germany", "германи": "Germany",
+    "китайск": "China", "китайц": "China", "кита": "China",
+    "русск": "Russia", "российск": "Russia", "отечествен": "Russia", "росси": "Russia",
+    "американск": "USA", "америк": "USA",
+    "французск": "France", "франци": "France",
+    "шведск": "Sweden", "швеци": "Sweden",
+    "итальянск": "Italy", "итали": "Italy",
+    "чешск": "Czech Republic", "чехи": "Czech Republic",
+    "английск": "UK", "британск": "UK",
+    "испанск": "Spain", "иранск": "Iran", "тайваньск": "Taiwan",
+}
+
+BODY_TYPE_STEMS = {
+    "седан": ["седан"], "хэтчбек": ["хэтчбек"], "хетчбек": ["хэтчбек"], "хэтч": ["хэтчбек"],
+    "лифтбек": ["лифтбек"], "универсал": ["универсал"], "кроссовер": ["кроссовер"],
+    "паркетник": ["кроссовер"], "внедорожник": ["внедорожник", "suv"], "джип": ["внедорожник", "suv"],
+    "suv": ["внедорожник", "suv"], "минивэн": ["минивэн"], "минивен": ["минивэн"],
+    "пикап": ["пикап"], "купе": ["купе"], "кабриолет": ["кабриолет"], "родстер": ["родстер"],
+}
+
+TRANSMISSION_STEMS = {
+    "автомат": "автоматическая", "акпп": "автоматическая",
+    "механик": "механическая", "механическ": "механическая", "мкпп": "механическая", "ручк": "механическая",
+    "вариатор": "вариатор", "cvt": "вариатор",
+    "робот": "робот", "ркпп": "робот",
+}
+
+DRIVE_STEMS = {
+    "полный": "полный", "полного": "полный", "полном": "полный", "полным": "полный", "полноприводн": "полный",
+    "4wd": "полный", "awd": "полный", "4x4": "полный", "4х4": "полный",
+    "передний": "передний", "переднего": "передний", "переднем": "передний", "передним": "передний", "переднеприводн": "передний",
+    "задний": "задний", "заднего": "задний", "заднем": "задний", "задним": "задний", "заднеприводн": "задний",
+}
+
+ENGINE_STEMS = {
+    "бензин": "бензин", "дизел": "дизель", "гибрид": "гибрид",
+    "электро": "электричество", "электри": "электричество", "электромобил": "электричество",
+}
+
+# Слова, не несущие информации для фильтра
+FILTER_STOP_WORDS = {
+    "хочу", "хотел", "хотела", "бы", "нужна", "нужен", "нужно", "ищу", "подбери", "подберите", "покажи",
+    "покажите", "найди", "найдите", "мне", "я", "машина", "машину", "машины", "автомобиль", "автомобиля",
+    "авто", "тачка", "тачку", "вариант", "варианты", "на", "с", "со", "в", "и", "а", "до", "от",
+    "дороже", "дешевле", "более", "менее", "больше", "меньше", "максимум", "минимум", "бюджет", "бюджетом",
+    "за", "млн", "миллион", "миллиона", "миллионов", "тыс", "тысяч", "тысячи", "к", "руб", "рублей", "рубля",
+    "р", "привод", "приводом", "привода", "коробка", "коробкой", "коробке", "кпп", "двигатель", "двигателем",
+    "года", "год", "г", "лет", "старше", "раньше", "после", "пожалуйста", "плиз", "ну", "вот", "какой",
+    "какую", "какая", "кузов", "кузове", "кузовом", "марки", "марка", "мест", "места", "местами", "лс",
+    "л", "сил", "лошадиных", "мощность", "мощностью", "тип", "типа", "желательно", "можно", "давай",
+}
@@ -0,0 +1,308 @@
+import heapq
+import json
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils import setup_logger
+from .columns import CatalogColumns
+
+logger = setup_logger("local_search")
+
+
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _field_name(path):
+    return path[len("metadata."):] if path.startswith("metadata.") else path
+
+
+def _normalize(value):
+    return str(value).strip().lower()
+
+
+def matches_filter(metadata, clause):
+    """
+    Проверяет метаданные документа на соответствие подмножеству Elasticsearch DSL,
+    которое строит OpenAiElasticsearchFilter: bool (must/filter/should/must_not),
+    range, match, term и terms. Строки сравниваются без учета регистра,
+    как анализатор keyword_lowercase.
+    """
+    if isinstance(clause, list):
+        return all(matches_filter(metadata, item) for item in clause)
+
+    if "bool" in clause:
+        body = clause["bool"]
+        for key in ("must", "filter"):
+            items = body.get(key, [])
+            items = items if isinstance(items, list) else [items]
+            if not all(matches_filter(metadata, item) for item in items):
+                return False
+        must_not = body.get("must_not", [])
+        must_not = must_not if isinstance(must_not, list) else [must_not]
+        if any(matches_filter(metadata, item) for item in must_not):
+            return False
+        should = body.get("should", [])
+        should = should if isinstance(should, list) else [should]
+        if should and not any(matches_filter(metadata, item) for item in should):
+            return False
+        return True
+
+    if "range" in clause:
+        for path, bounds in clause["range"].items():
+            value = metadata.get(_field_name(path))
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return False
+            if np.isnan(value):
+                return False
+            if "gte" in bounds and value < bounds["gte"]:
+                return False
+            if "gt" in bounds and value <= bounds["gt"]:
+                return False
+            if "lte" in bounds and value > bounds["lte"]:
+                return False
+            if "lt" in bounds and value >= bounds["lt"]:
+                return False
+        return True
+
+    if "match" in clause or "term" in clause:
+        path, expected = next(iter((clause.get("match") or clause.get("term")).items()))
+        if isinstance(expected, dict):
+            expected = expected.get("query", expected.get("value"))
+        return _normalize(metadata.get(_field_name(path), "")) == _normalize(expected)
+
+    if "terms" in clause:
+        path, expected = next(iter(clause["terms"].items()))
+        return _normalize(metadata.get(_field_name(path), "")) in {_normalize(x) for x in expected}
+
+    if "match_all" in clause:
+        return True
+
+    raise ValueError(f"Неподдерживаемое условие фильтра: {list(clause)}")
+
+
+class _GraphIndex:
+    """
+    Граф ближайших соседей в духе HNSW (один слой): каждая вершина связана
+    с ближайшими векторами и long_links случайными вершинами, поиск - жадный
+    обход с очередью размера ef. Без дальних связей граф кластеризованных
+    эмбеддингов распадается на компоненты, и обход не выходит из кластера
+    точки входа.
+    """
+
+    def __init__(self, matrix, degree=32, long_links=8, block_size=1024, seed=0):
+        self.matrix = matrix
+        n = len(matrix)
+        rng = np.random.default_rng(seed)
+        degree = min(degree, n - 1)
+        near = max(1, degree - long_links)
+        self.neighbors = np.empty((n, degree), dtype=np.int32)
+        for start in range(0, n, block_size):
+            scores = matrix[start:start + block_size] @ matrix.T
+            rows = np.arange(scores.shape[0])
+            scores[rows, rows + start] = -np.inf
+            top = np.argpartition(-scores, near - 1, axis=1)[:, :near]
+            self.neighbors[start:start + block_size, :near] = top
+        self.neighbors[:, near:] = rng.integers(0, n, (n, degree - near))
+        self.entry_points = rng.choice(n, size=min(8, n), replace=False)
+
+    def search(self, query, ef):
+        scores = self.matrix[self.entry_points] @ query
+        visited = set(int(x) for x in self.entry_points)
+        candidates = [(-float(score), int(node)) for node, score in zip(self.entry_points, scores)]
+        heapq.heapify(candidates)
+        results = [(float(score), int(node)) for node, score in zip(self.entry_points, scores)]
+        heapq.heapify(results)
+
+        while candidates:
+            neg_score, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_score < results[0][0]:
+                break
+            fresh = [int(x) for x in self.neighbors[node] if int(x) not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for neighbor, score in zip(fresh, self.matrix[fresh] @ query):
+                score = float(score)
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, neighbor))
+                    heapq.heappush(results, (score, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        best = sorted(results, reverse=True)
+        return (np.array([node for _, node in best], dtype=np.int64),
+                np.array([score for score, _ in best], dtype=np.float32))
+
+
+class LocalVectorStore:
+    """
+    Векторный поиск по каталогу в памяти процесса с тем же интерфейсом, что у
+    ElasticsearchStore (similarity_search, similarity_search_with_score,
+    similarity_search_by_vector_with_relevance_scores). Эмбеддинги хранятся в одной
+    непрерывной матрице float32, поиск - точный косинусный top-k, для больших
+    каталогов - по графу соседей. Фильтр вычисляется локально по колоночному
+    представлению метаданных (CatalogColumns) до подсчета близостей.
+    """
+
+    def __init__(self, embedding, documents, vectors, use_graph=None, graph_threshold=20000, ef_search=128,
+                 normalized=False):
+        """normalized=True - vectors уже нормализованы и используются без копирования (например, mmap снимка)."""
+        self.embedding = embedding
+        self.documents = list(documents)
+        if normalized:
+            self.matrix = vectors
+        else:
+            matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix = matrix / norms
+        self.ef_search = ef_search
+        self.columns = CatalogColumns(doc.metadata for doc in self.documents)
+
+        if use_graph is None:
+            use_graph = len(self.documents) > graph_threshold
+        self.graph = _GraphIndex(self.matrix) if use_graph and len(self.documents) > 1 else None
+        logger.info(f"Локальный индекс: {len(self.documents)} документов, размерность {self.matrix.shape[1] if len(self.matrix) else 0}"
+                    f"{', граф соседей' if self.graph is not None else ''}")
+
+    @classmethod
+    def from_documents(cls, documents, embedding, batch_size=100, **kwargs):
+        """Строит индекс, получая эмбеддинги документов через embedding.embed_documents."""
+        vectors = []
+        for start in range(0, len(documents), batch_size):
+            batch = [doc.page_content for doc in documents[start:start + batch_size]]
+            vectors.extend(embedding.embed_documents(batch))
+        return cls(embedding, documents, np.array(vectors, dtype=np.float32), **kwargs)
+
+    @classmethod
+    def from_elasticsearch(cls, es_client, index_name, embedding, **kwargs):
+        """Выгружает документы и векторы из индекса, заполненного ElasticsearchStore."""
+        from elasticsearch.helpers import scan
+
+        documents, vectors = [], []
+        for hit in scan(es_client, index=index_name, query={"query": {"match_all": {}}}):
+            source = hit["_source"]
+            if not source.get("vector"):
+                continue
+            documents.append(Document(page_content=source.get("text", ""), metadata=source.get("metadata", {})))
+            vectors.append(source["vector"])
+        return cls(embedding, documents, np.array(vectors, dtype=np.float32), **kwargs)
+
+    @classmethod
+    def from_snapshot(cls, path, embedding, **kwargs):
+        """Открывает снимок каталога (snapshot.py): матрица эмбеддингов отображается в память."""
+        from .snapshot import load_documents, load_embeddings, resolve
+
+        # Указатель читается один раз: метаданные и матрица берутся из одной версии
+        path = resolve(path)
+        documents, _ = load_documents(path)
+        return cls(embedding, documents, load_embeddings(path), normalized=True, **kwargs)
+
+    def save(self, path):
+        """Сохраняет индекс в .npz или, если путь без расширения .npz, в снимок каталога."""
+        if not path.endswith(".npz"):
+            from .snapshot import write_snapshot
+
+            write_snapshot(path, self.documents, self.matrix)
+            return
+        payload = json.dumps(
+            [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in self.documents],
+            ensure_ascii=False, default=_json_default,
+        )
+        np.savez(path, vectors=self.matrix, documents=np.array(payload))
+        logger.info(f"Локальный индекс сохранен в {path}")
+
+    @classmethod
+    def load(cls, path, embedding, **kwargs):
+        if os.path.isdir(path):
+            return cls.from_snapshot(path, embedding, **kwargs)
+        with np.load(path, allow_pickle=False) as data:
+            documents = [Document(**item) for item in json.loads(str(data["documents"]))]
+            return cls(embedding, documents, data["vectors"], **kwargs)
+
+    def update_metadata(self, updates):
+        """
+        Частично обновляет метаданные документов: updates - {id: {поле: значение}}.
+        Векторы не меняются. Возвращает число обновленных документов.
+        """
+        positions = {str(doc.metadata.get("id")): position for position, doc in enumerate(self.documents)}
+        changed = {}
+        updated = 0
+        for doc_id, fields in updates.items():
+            position = positions.get(str(doc_id))
+            if position is None:
+                continue
+            self.documents[position].metadata.update(fields)
+            updated += 1
+            for field, value in fields.items():
+                changed.setdefault(field, []).append((position, value))
+
+        for field, items in changed.items():
+            if field in self.columns.numeric:
+                self.columns.update_numeric(field, [p for p, _ in items], [v for _, v in items])
+            elif field in self.columns.vocabulary:
+                self.columns = CatalogColumns(doc.metadata for doc in self.documents)
+                break
+        return updated
+
+    def _filter_mask(self, filter):
+        if not filter:
+            return None
+        try:
+            return self.columns.mask(filter)
+        except ValueError as e:
+            logger.debug(f"Фильтр вычисляется по документам: {e}")
+            return np.fromiter((matches_filter(doc.metadata, filter) for doc in self.documents),
+                               dtype=bool, count=len(self.documents))
+
+    def count(self, filter=None):
+        """Количество документов, подходящих под фильтр."""
+        return len(self.documents) if not filter else int(self._filter_mask(filter).sum())
+
+    def _top_k(self, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def search_vectors(self, query_vectors, k=4, filter=None):
+        """
+        Пакетный поиск: query_vectors - матрица (m, d). Возвращает индексы документов
+        и косинусные близости формы (m, k).
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        mask = self._filter_mask(filter)
+
+        if self.graph is not None and mask is None and len(queries) == 1:
+            ids, scores = self.graph.search(queries[0], max(self.ef_search, k))
+            return ids[None, :k], scores[None, :k]
+
+        candidates = np.arange(len(self.documents)) if mask is None else np.flatnonzero(mask)
+        scores = queries @ self.matrix[candidates].T
+        ids = np.empty((len(queries), min(k, len(candidates))), dtype=np.int64)
+        top_scores = np.empty(ids.shape, dtype=np.float32)
+        for row in range(len(queries)):
+            top = self._top_k(scores[row], k)
+            ids[row] = candidates[top]
+            top_scores[row] = scores[row, top]
+        return ids, top_scores
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        ids, scores = self.search_vectors(embedding, k=k, filter=filter)
+        # Та же шкала, что у косинусной близости в Elasticsearch: (1 + cos) / 2
+        return [(self.documents[i], float((1 + score) / 2)) for i, score in zip(ids[0], scores[0])]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
@@ -69,6 +69,7 @@ class CarFilter(BaseModel):
     min_price: Optional[int] = None
     max_price: Optional[int] = None
     brands: List[str] = Field(default_factory=list)
+    countries: List[str] = Field(default_factory=list)
     body_types: List[BodyType] = Field(default_factory=list)
     transmissions: List[TransmissionType] = Field(default_factory=list)
     drive_types: List[DriveType] = Field(default_factory=list)
@@ -81,6 +82,10 @@ class CarFilter(BaseModel):
     max_seats: Optional[int] = None
     min_clearance: Optional[int] = None
     max_clearance: Optional[int] = None
+    min_fuel_consumption: Optional[float] = None
+    max_fuel_consumption: Optional[float] = None
+    min_doors: Optional[int] = None
+    max_doors: Optional[int] = None
 
 class ModelResponse(BaseModel):
     action: ActionType
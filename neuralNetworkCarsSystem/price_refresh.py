@@ -0,0 +1,96 @@
+"""
+Обновление цен и рейтингов каталога без переэмбеддинга описаний.
+
+Источник изменений - xlsx/CSV с колонкой _id и колонками median и/или rating
+(как в датасете) или JSON {id: результат parser.get_prices_from_offer}.
+Изменения применяются частичными обновлениями metadata в Elasticsearch
+и в локальном индексе (LocalVectorStore.update_metadata). Цена и рейтинг
+документа, уже лежащего в индексе, меняются только здесь: чтобы перенести
+цены из датасета, его можно передать сюда же (колонки _id и median).
+"""
+import json
+import math
+import os
+
+import pandas as pd
+from elasticsearch.helpers import streaming_bulk
+
+from utils import setup_logger
+
+logger = setup_logger("price_refresh")
+
+# Колонка источника -> поле метаданных
+PRICE_COLUMNS = {"median": "price", "price": "price", "rating": "rating"}
+# Поля, которыми после загрузки документа владеет обновление цен: они не входят
+# в content_hash, и синхронизация с датасетом (IncrementalIndexer) их не перезаписывает
+REFRESHED_FIELDS = tuple(dict.fromkeys(PRICE_COLUMNS.values()))
+
+
+def _to_number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def delta_from_offers(offers):
+    """{id: {"median": ...}} из результатов parser.get_prices_from_offer -> {id: {"price": ...}}."""
+    delta = {}
+    for doc_id, price_data in offers.items():
+        price = _to_number((price_data or {}).get("median"))
+        if price is not None:
+            delta[str(doc_id)] = {"price": price}
+    return delta
+
+
+def read_price_delta(path):
+    """Читает изменения цен и рейтингов: {id: {"price": ..., "rating": ...}}."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            return delta_from_offers(json.load(f))
+
+    data = pd.read_csv(path) if extension == ".csv" else pd.read_excel(path, engine='openpyxl')
+    id_column = "_id" if "_id" in data.columns else "id"
+    columns = {column: field for column, field in PRICE_COLUMNS.items() if column in data.columns}
+    if id_column not in data.columns or not columns:
+        raise ValueError(f"В {path} нужны колонка _id и хотя бы одна из {sorted(PRICE_COLUMNS)}")
+
+    delta = {}
+    for row in data[[id_column, *columns]].itertuples(index=False):
+        fields = {}
+        for column, value in zip(columns, row[1:]):
+            number = _to_number(value)
+            if number is not None:
+                fields[columns[column]] = number
+        if fields:
+            delta[str(row[0])] = fields
+    logger.info(f"Прочитано изменений: {len(delta)} из {path}")
+    return delta
+
+
+def apply_to_index(es_client, index_name, delta, chunk_size=1000):
+    """
+    Применяет изменения частичными обновлениями metadata. Документы, которых нет
+    в индексе, пропускаются. Возвращает число обновленных документов.
+    """
+    actions = (
+        {"_op_type": "update", "_index": index_name, "_id": doc_id, "doc": {"metadata": fields}}
+        for doc_id, fields in delta.items()
+    )
+    updated, missing, errors = 0, 0, []
+    for ok, item in streaming_bulk(es_client, actions, chunk_size=chunk_size, raise_on_error=False,
+                                   max_retries=5, initial_backoff=2):
+        if ok:
+            updated += 1
+        elif item.get("update", {}).get("status") == 404:
+            missing += 1
+        else:
+            errors.append(item)
+    if errors:
+        raise RuntimeError(f"Elasticsearch отклонил {len(errors)} обновлений: {errors[:3]}")
+    if missing:
+        logger.warning(f"В индексе {index_name} не найдено документов: {missing}")
+    es_client.indices.refresh(index=index_name)
+    return updated
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils import setup_logger
+
+logger = setup_logger("sessions")
+
+
+class SessionStore:
+    """
+    Сессии пользователей бота (AutoAssistant) с ограничением по числу, времени
+    простоя и суммарному размеру состояния. Вытесняются давно не использованные
+    сессии, состояние которых (AutoAssistant.get_state) сохраняется в SQLite
+    и восстанавливается при следующем сообщении пользователя. Сессии, занятые
+    обработкой сообщения, не вытесняются.
+    """
+
+    def __init__(self, factory, path="sessions.sqlite", max_sessions=10000, ttl=3600, max_bytes=256 * 1024 * 1024,
+                 persist_ttl=30 * 24 * 3600):
+        """
+        factory - функция без аргументов, создающая AutoAssistant.
+        ttl - секунды простоя до вытеснения из памяти, persist_ttl - срок хранения на диске.
+        """
+        self.factory = factory
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.persist_ttl = persist_ttl
+        self._live = OrderedDict()
+        self._sizes = {}
+        self._pinned = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.rehydrated = 0
+        self.evicted = 0
+        self.persisted = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (user_id TEXT PRIMARY KEY, state TEXT, updated_at REAL)")
+        if persist_ttl is not None:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - persist_ttl,))
+        self._conn.commit()
+        logger.info(f"Хранилище сессий открыто: {path}")
+
+    @classmethod
+    def from_env(cls, factory):
+        """Создает хранилище по переменным окружения SESSION_*."""
+        return cls(
+            factory,
+            path=os.getenv("SESSION_STORE_PATH", "sessions.sqlite"),
+            max_sessions=int(os.getenv("SESSION_MAX_LIVE", 10000)),
+            ttl=float(os.getenv("SESSION_TTL", 3600)),
+            max_bytes=int(os.getenv("SESSION_MAX_BYTES", 256 * 1024 * 1024)),
+        )
+
+    @staticmethod
+    def _serialize(assistant):
+        return json.dumps(assistant.get_state(), ensure_ascii=False, separators=(",", ":"))
+
+    def _load(self, user_id):
+        row = self._conn.execute("SELECT state FROM sessions WHERE user_id = ?", (str(user_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _persist(self, user_id, payload):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (user_id, state, updated_at) VALUES (?, ?, ?)",
+            (str(user_id), payload, time.time()),
+        )
+        self.persisted += 1
+
+    def _set_size(self, user_id, size):
+        self._total_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+    def get(self, user_id):
+        """Возвращает сессию пользователя: живую, восстановленную с диска или новую."""
+        with self._lock:
+            item = self._live.get(user_id)
+            if item is not None:
+                self._live[user_id] = (item[0], time.monotonic())
+                self._live.move_to_end(user_id)
+                return item[0]
+
+            assistant = self.factory()
+            state = self._load(user_id)
+            if state is not None:
+                assistant.load_state(state)
+                self.rehydrated += 1
+                logger.debug(f"Сессия пользователя {user_id} восстановлена")
+            else:
+                self.created += 1
+            self._live[user_id] = (assistant, time.monotonic())
+            self._set_size(user_id, len(self._serialize(assistant).encode("utf-8")))
+            self._evict_locked()
+            return assistant
+
+    def acquire(self, user_id):
+        """Сессия на время обработки сообщения: до release ее нельзя вытеснить."""
+        with self._lock:
+            self._pinned[user_id] = self._pinned.get(user_id, 0) + 1
+        return self.get(user_id)
+
+    def release(self, user_id):
+        with self._lock:
+            if user_id in self._pinned:
+                self._pinned[user_id] -= 1
+                if not self._pinned[user_id]:
+                    del self._pinned[user_id]
+            item = self._live.get(user_id)
+            if item is not None:
+                self._set_size(user_id, len(self._serialize(item[0]).encode("utf-8")))
+            self._evict_locked()
+
+    @contextmanager
+    def session(self, user_id):
+        try:
+            yield self.acquire(user_id)
+        finally:
+            self.release(user_id)
+
+    def reset(self, user_id):
+        """Сбрасывает диалог пользователя в памяти и на диске."""
+        with self._lock:
+            item = self._live.get(user_id)
+            self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+            self._conn.commit()
+        if item is not None:
+            item[0].reset()
+
+    def _evict_locked(self):
+        now = time.monotonic()
+        evicted = []
+        for user_id, (assistant, last_access) in list(self._live.items()):
+            over_limit = len(self._live) > self.max_sessions or self._total_bytes > self.max_bytes
+            expired = self.ttl is not None and now - last_access > self.ttl
+            if not over_limit and not expired:
+                # Дальше только более свежие сессии
+                break
+            if user_id in self._pinned:
+                continue
+            self._persist(user_id, self._serialize(assistant))
+            del self._live[user_id]
+            self._total_bytes -= self._sizes.pop(user_id, 0)
+            evicted.append(user_id)
+        if evicted:
+            self._conn.commit()
+            self.evicted += len(evicted)
+            logger.debug(f"Вытеснено сессий: {len(evicted)}")
+
+    def evict_expired(self):
+        with self._lock:
+            self._evict_locked()
+
+    def stats(self):
+        live = len(self._live)
+        return {
+            "live": live,
+            "created": self.created,
+            "rehydrated": self.rehydrated,
+            "evicted": self.evicted,
+            "persisted": self.persisted,
+            "bytes_total": self._total_bytes,
+            "bytes_per_session": round(self._total_bytes / live) if live else 0,
+        }
+
+    async def report_stats(self, interval=60.0):
+        """Периодически вытесняет простаивающие сессии и пишет статистику в лог."""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_expired()
+            logger.info(f"Статистика сессий: {self.stats()}")
+
+    def close(self):
+        """Сохраняет все живые сессии и закрывает базу."""
+        with self._lock:
+            for user_id, (assistant, _) in self._live.items():
+                self._persist(user_id, self._serialize(assistant))
+            self._conn.commit()
+            logger.info(f"Сохранено сессий при остановке: {len(self._live)}")
+            self._conn.close()
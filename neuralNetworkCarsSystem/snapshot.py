@@ -0,0 +1,239 @@
+"""
+Снимок каталога на диске: каталог с указателем CURRENT на подкаталог
+текущей версии, в которой три файла.
+
+    manifest.json      версия формата, схема, число строк, размерность и хэши
+    metadata.parquet   текст и метаданные документов, по колонке на поле
+    embeddings.npy     нормализованная матрица эмбеддингов float32 (n, d)
+
+Матрица открывается через np.load(mmap_mode="r"): процессы, открывшие один
+снимок, делят страницы в кэше ОС, а запуск не тратит время на разбор.
+Новая версия целиком пишется во временный подкаталог, переименовывается и
+публикуется подменой CURRENT через os.replace, поэтому читатель видит либо
+прежнюю версию, либо новую, но не смесь файлов из обеих. Кроме текущей
+хранится предыдущая версия - для процессов, которые уже прочитали указатель.
+Каталоги старого формата (файлы без CURRENT) по-прежнему читаются.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from langchain_core.documents import Document
+
+from utils import setup_logger
+from .AutoAssistant import EMBEDDING_MODEL, INTEGER_COLUMNS, FLOAT_COLUMNS
+from .index_schema import INDEX_VERSION
+from .ingest import add_hashes
+
+logger = setup_logger("snapshot")
+
+SNAPSHOT_VERSION = 1
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+METADATA = "metadata.parquet"
+EMBEDDINGS = "embeddings.npy"
+
+
+def is_snapshot(path):
+    return os.path.isfile(os.path.join(path, CURRENT)) or os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def resolve(path):
+    """Каталог текущей версии снимка; для каталога версии или снимка старого формата - сам path."""
+    pointer = os.path.join(path, CURRENT)
+    if not os.path.isfile(pointer):
+        return path
+    with open(pointer, encoding="utf-8") as f:
+        return os.path.join(path, f.read().strip())
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _column(field, values):
+    if field in INTEGER_COLUMNS:
+        return pa.array([None if _missing(v) else int(v) for v in values], type=pa.int64())
+    if field in FLOAT_COLUMNS:
+        return pa.array([None if _missing(v) else float(v) for v in values], type=pa.float64())
+    if field == "images":
+        return pa.array([list(v) if isinstance(v, (list, tuple)) else [] for v in values], type=pa.list_(pa.string()))
+    values = [None if _missing(v) else v for v in values]
+    # read_excel оставляет в колонках object числа рядом со строками (модели "3" и "CX-5"):
+    # такие колонки хранятся строками
+    if any(isinstance(v, str) for v in values):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _versions(path):
+    return sorted(name for name in os.listdir(path)
+                  if name.startswith("v") and os.path.isdir(os.path.join(path, name)))
+
+
+def _publish(path, version):
+    """Переключает CURRENT на version и удаляет версии старше предыдущей и файлы старого формата."""
+    previous = os.path.basename(resolve(path)) if os.path.isfile(os.path.join(path, CURRENT)) else None
+    tmp_pointer = os.path.join(path, f"{CURRENT}.tmp-{os.getpid()}")
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_pointer, os.path.join(path, CURRENT))
+
+    for name in _versions(path):
+        if name not in (version, previous):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    for name in (MANIFEST, METADATA, EMBEDDINGS):
+        legacy = os.path.join(path, name)
+        if os.path.isfile(legacy):
+            os.remove(legacy)
+
+
+def write_snapshot(path, documents, vectors=None, model=EMBEDDING_MODEL):
+    """
+    Записывает новую версию снимка и публикует ее. vectors - матрица (n, d) в порядке
+    documents; без нее снимок содержит только метаданные. Хэши документов
+    добавляются, если их нет.
+    """
+    os.makedirs(path, exist_ok=True)
+    version = f"v{time.strftime('%Y%m%d%H%M%S')}-{time.time_ns() % 10 ** 9:09d}-{os.getpid()}"
+    tmp_dir = os.path.join(path, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    try:
+        manifest = _write_files(tmp_dir, documents, vectors, model)
+        os.rename(tmp_dir, os.path.join(path, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _publish(path, version)
+    dims = manifest["dims"]
+    logger.info(f"Снимок каталога записан в {path} (версия {version}): {manifest['rows']} документов"
+                f"{f', эмбеддинги {dims}' if dims else ''}")
+    return manifest
+
+
+def _write_files(path, documents, vectors, model):
+    documents = list(documents)
+    if any("content_hash" not in doc.metadata for doc in documents):
+        add_hashes(documents)
+
+    fields = list(dict.fromkeys(key for doc in documents for key in doc.metadata))
+    columns = {"text": pa.array([doc.page_content for doc in documents], type=pa.string())}
+    for field in fields:
+        columns[field] = _column(field, [doc.metadata.get(field) for doc in documents])
+    table = pa.table(columns)
+    pq.write_table(table, os.path.join(path, METADATA), compression="zstd")
+
+    dims = None
+    if vectors is not None:
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+        dims = int(matrix.shape[1]) if matrix.ndim == 2 else 0
+        with open(os.path.join(path, EMBEDDINGS), "wb") as f:
+            np.save(f, matrix)
+
+    digest = hashlib.sha256("".join(doc.metadata["content_hash"] for doc in documents).encode("utf-8")).hexdigest()
+    manifest = {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "index_version": INDEX_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rows": len(documents),
+        "schema": {name: str(column.type) for name, column in zip(table.column_names, table.columns)},
+        "embedding_model": model if vectors is not None else None,
+        "dims": dims,
+        "content_hash": digest,
+        "text_hash": hashlib.sha256("".join(doc.metadata["text_hash"] for doc in documents).encode("utf-8")).hexdigest(),
+    }
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_manifest(path):
+    path = resolve(path)
+    with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("snapshot_version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия снимка {manifest.get('snapshot_version')} в {path}")
+    return manifest
+
+
+def load_documents(path):
+    """Документы и id из снимка (как get_docs)."""
+    path = resolve(path)
+    manifest = read_manifest(path)
+    table = pq.read_table(os.path.join(path, METADATA), memory_map=True)
+    if table.num_rows != manifest["rows"]:
+        raise ValueError(f"В {path} {table.num_rows} строк метаданных на {manifest['rows']} по манифесту")
+    columns = table.to_pydict()
+    texts = columns.pop("text")
+    fields = list(columns)
+    nan = float("nan")
+    docs = [
+        Document(page_content=text, metadata={
+            field: nan if value is None and field != "images" else value
+            for field, value in zip(fields, values)
+        })
+        for text, *values in zip(texts, *columns.values())
+    ]
+    return docs, columns.get("id", [None] * len(docs))
+
+
+def load_embeddings(path, mmap=True):
+    """Нормализованная матрица эмбеддингов; при mmap=True - отображение файла без копирования."""
+    path = resolve(path)
+    manifest = read_manifest(path)
+    if manifest.get("dims") is None:
+        raise ValueError(f"Снимок {path} не содержит эмбеддингов")
+    matrix = np.load(os.path.join(path, EMBEDDINGS), mmap_mode="r" if mmap else None)
+    if matrix.shape[0] != manifest["rows"]:
+        raise ValueError(f"В {path} {matrix.shape[0]} векторов на {manifest['rows']} документов")
+    if matrix.ndim != 2 or matrix.shape[1] != manifest["dims"]:
+        raise ValueError(f"В {path} матрица {matrix.shape} при размерности {manifest['dims']} по манифесту")
+    return matrix
+
+
+def snapshot_from_dataset(dataset_path, path, embedding_store_path=None):
+    """
+    Строит снимок по датасету. Эмбеддинги берутся из EmbeddingStore, заполненного
+    prepare_database; если каких-то текстов там нет, снимок пишется без эмбеддингов.
+    """
+    from .AutoAssistant import get_docs
+    from .cache import EmbeddingStore
+
+    docs, _ = get_docs(dataset_path)
+    add_hashes(docs)
+    store = EmbeddingStore(embedding_store_path or os.getenv("EMBEDDING_STORE_PATH", "embedding_store.sqlite"),
+                           model=EMBEDDING_MODEL)
+    try:
+        known = store.get_many(doc.metadata["text_hash"] for doc in docs)
+    finally:
+        store.close()
+
+    missing = sum(1 for doc in docs if doc.metadata["text_hash"] not in known)
+    vectors = None
+    if missing:
+        logger.warning(f"Нет эмбеддингов для {missing} документов, снимок будет без эмбеддингов")
+    elif docs:
+        vectors = np.array([known[doc.metadata["text_hash"]] for doc in docs], dtype=np.float32)
+    return write_snapshot(path, docs, vectors)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Снимок каталога из датасета и хранилища эмбеддингов")
+    parser.add_argument("dataset", help="датасет каталога (xlsx, csv, parquet, feather)")
+    parser.add_argument("path", help="каталог снимка")
+    args = parser.parse_args()
+    snapshot_from_dataset(args.dataset, args.path)
@@ -11,6 +11,7 @@ import pandas as pd
 from datetime import datetime
 from tqdm import tqdm
 from utils import setup_logger
+from neuralNetworkCarsSystem.lexicon import CAR_BRANDS
 from bs4 import BeautifulSoup
 import time
 
@@ -18,27 +19,6 @@ logger = setup_logger(__name__)
 
 load_dotenv()
 
-CAR_BRANDS = [
-    "Abarth", "Acura", "AITO", "Aiways", "Alfa Romeo", "Alpina", "Arcfox", "Aston Martin", "Audi", "Avatr",
-    "BAIC", "Bajaj", "Barkas", "BAW", "Bedford", "Belgee", "Bentley", "BMW", "Brilliance", "Bugatti", "Buick", "BYD",
-    "Cadillac", "Changan", "Changhe", "Chery", "Chevrolet", "Chrysler", "Ciimo", "Citroen", "Dacia", "Dadi", "Daewoo",
-    "Daihatsu", "Datsun", "Dayun", "DeLorean", "Denza", "Dodge", "Dongfeng", "Dorcen", "DW Hower", "EXEED", "FAW",
-    "Ferrari", "Fiat", "Fisker", "Ford", "Forthing", "Foton", "GAC", "Geely", "Genesis", "Geo", "GMC", "Great Wall",
-    "Hafei", "Haima", "Haval", "Hawtai", "HiPhi", "Holden", "Honda", "Hongqi", "Hozon", "Huanghai", "Hummer", "Hyundai",
-    "iCAR", "IM Motors", "Infiniti", "Iran Khodro", "Isuzu", "JAC", "Jaecoo", "Jaguar", "Jeep", "Jetour", "Jetta",
-    "Jinbei", "JMC", "JMEV", "Kaiyi", "KG Mobility", "Kia", "Knewstar", "Kuayue", "Lamborghini", "Lancia", "Land Rover",
-    "Landwind", "Leapmotor", "Lexus", "Li", "Lifan", "Lincoln", "Livan", "Lotus", "Lucid", "Luxeed", "Luxgen", "Lynk & Co",
-    "M-Hero", "Marussia", "Maserati", "Maxus", "Maybach", "Mazda", "McLaren", "Mercedes-Benz", "Mercury", "MG", "MINI",
-    "Mitsubishi", "Mitsuoka", "Nio", "Nissan", "Oldsmobile", "OMODA", "Opel", "ORA", "Oshan", "Oting", "Pagani", "Perodua",
-    "Peugeot", "Piaggio", "Plymouth", "Polar Stone", "Polestar", "Pontiac", "Porsche", "Qingling", "Radar", "RAM", "Ravon",
-    "Renault", "Renault Samsung", "Rimac", "Rising Auto", "Rivian", "Roewe", "Rolls-Royce", "Rover", "Saab", "SAIPA",
-    "Saturn", "Scion", "SEAT", "Seres", "Shineray", "Shuanghuan", "Skoda", "Skywell", "Smart", "Solaris", "Soueast",
-    "SsangYong", "Subaru", "Suzuki", "SWM", "Tank", "Tesla", "Tianma", "Tianye", "Toyota", "Venucia", "VGV", "Volkswagen",
-    "Volvo", "Vortex", "Voyah", "Wartburg", "Weltmeister", "WEY", "Wuling", "Xcite", "Xiaomi", "Xpeng", "Zeekr", "Zotye",
-    "ZX", "Амберавто", "Амбертрак", "Аурус", "Богдан", "Волга", "ГАЗ", "Донинвест", "ЗАЗ", "ЗИЛ", "ЗиС", "ИЖ", "Лада",
-    "ЛуАЗ", "Москвич", "Соллерс", "ТагАЗ", "УАЗ", "Эволют"
-]
-
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
 
 def save_to_excel(car_data, filename="cars_pred.xlsx"):
@@ -3,7 +3,8 @@ from dotenv import load_dotenv
 from elasticsearch import Elasticsearch
 
 from neuralNetworkCarsSystem.AutoAssistant import get_docs
-from neuralNetworkCarsSystem.carsFacade import create_db, index_settings
+from neuralNetworkCarsSystem.carsFacade import create_db
+from neuralNetworkCarsSystem.index_schema import bootstrap_index
 from utils import setup_logger
 
 load_dotenv()
@@ -12,32 +13,28 @@ logger = setup_logger("prepare_database")
 def prepare_database():
     """
     Предварительно заполняет базу данных Elasticsearch данными об автомобилях.
-    Этот скрипт нужно запустить один раз перед запуском бота.
+    Этот скрипт нужно запустить перед запуском бота и после обновления датасета:
+    повторный запуск загружает только изменения (см. OpenAiElasticsearchDB.sync_documents)
+    и продолжает прерванную загрузку с последнего подтвержденного пакета.
     """
-    logger.info("База данных уже подготовлена")
-    return True
-
     try:
         es_client = Elasticsearch([os.getenv("ELASTICSEARCH_URL")])
 
-        if es_client.indices.exists(index="langchain_index"):
-            logger.info("Удаление существующего индекса...")
-            es_client.indices.delete(index="langchain_index")
-            logger.info("Индекс успешно удален")
-
-        logger.info("Создание нового индекса...")
-        es_client.indices.create(index="langchain_index", body=index_settings)
-        logger.info("Новый индекс успешно создан")
+        logger.info("Подготовка индекса...")
+        index_name = bootstrap_index(es_client, "langchain_index")
+        logger.info(f"Индекс {index_name} готов")
 
         db = create_db()
 
         dataset_path = os.getenv("ELASTIC_DATASET_PATH")
         docs, ids = get_docs(dataset_path)
 
-        logger.info("Добавление документов в базу данных...")
-        db.add_documents(documents=docs, ids=ids)
+        logger.info("Синхронизация документов с базой данных...")
+        stats = db.sync_documents(documents=docs, ids=ids)
 
-        logger.info("База данных успешно подготовлена!")
+        logger.info(f"База данных успешно подготовлена! Новых: {stats['new']}, измененных: {stats['changed']}, "
+                    f"обновлены метаданные: {stats['metadata']}, удалено: {stats['removed']}, "
+                    f"запросов эмбеддингов для {stats['embedded']} текстов")
         return True
 
     except Exception as e:
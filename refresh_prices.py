@@ -0,0 +1,51 @@
+import argparse
+import os
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+
+from neuralNetworkCarsSystem.index_schema import require_index
+from neuralNetworkCarsSystem.local_search import LocalVectorStore
+from neuralNetworkCarsSystem.price_refresh import read_price_delta, apply_to_index
+from utils import setup_logger
+
+load_dotenv()
+logger = setup_logger("refresh_prices")
+
+
+def refresh_prices(path, index_name="langchain_index"):
+    """
+    Обновляет цены и рейтинги в Elasticsearch и в локальном индексе (LOCAL_INDEX_PATH),
+    не трогая эмбеддинги. Запущенный бот с локальным поиском увидит изменения после перезапуска.
+    """
+    try:
+        delta = read_price_delta(path)
+        if not delta:
+            logger.info("Изменений нет")
+            return True
+
+        if os.getenv("ELASTICSEARCH_URL"):
+            es_client = Elasticsearch([os.getenv("ELASTICSEARCH_URL")])
+            # Обновление цен не создает и не мигрирует индекс
+            require_index(es_client, index_name)
+            updated = apply_to_index(es_client, index_name, delta)
+            logger.info(f"Обновлено документов в Elasticsearch: {updated}")
+
+        local_path = os.getenv("LOCAL_INDEX_PATH", "local_index.npz")
+        if os.path.exists(local_path):
+            store = LocalVectorStore.load(local_path, embedding=None)
+            updated = store.update_metadata(delta)
+            store.save(local_path)
+            logger.info(f"Обновлено документов в локальном индексе: {updated}")
+
+        return True
+
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении цен: {e}", exc_info=True)
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обновление цен и рейтингов каталога без переэмбеддинга")
+    parser.add_argument("path", help="xlsx/CSV с колонками _id, median, rating или JSON {id: цены с parser.get_prices_from_offer}")
+    args = parser.parse_args()
+    refresh_prices(args.path)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# AutoAssistant читает MAX_QUERY при импорте; модули проекта импортируются от корня репозитория
+os.environ.setdefault("MAX_QUERY", "3")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
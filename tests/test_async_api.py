@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from neuralNetworkCarsSystem.AutoAssistant import AsyncOpenAIApi, RateLimitError
+
+
+@pytest.fixture
+def server(monkeypatch):
+    def start(**kwargs):
+        fake = FakeOpenAIServer(latency=0.0, jitter=0.0, embedding_latency=0.0, **kwargs)
+        base_url = fake.start()
+        monkeypatch.setenv("OPENAI_EMBEDDING_URL", f"{base_url}/embeddings")
+        started.append(fake)
+        return fake
+
+    started = []
+    yield start
+    for fake in started:
+        fake.stop()
+
+
+def test_retry_after_is_honoured_and_connection_released(server):
+    fake = server(rate_limit=0.5, retry_after=0, seed=1)
+    # Одно соединение на весь пул: если пауза после 429 держала бы его, параллельные запросы ждали бы delay
+    api = AsyncOpenAIApi({}, max_connections=1, delay=30, max_retries=20)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(api.get_embedding([f"text {i}"]) for i in range(8)))
+        finally:
+            await api.close()
+
+    started_at = time.perf_counter()
+    results = asyncio.run(run())
+    assert time.perf_counter() - started_at < 5
+    assert len(results) == 8
+    assert fake.rate_limited > 0
+
+
+def test_rate_limit_error_after_last_attempt(server):
+    server(rate_limit=1.0, retry_after=0)
+    api = AsyncOpenAIApi({}, max_retries=2, delay=30)
+
+    async def run():
+        try:
+            await api.get_embedding(["text"])
+        finally:
+            await api.close()
+
+    with pytest.raises(RateLimitError) as error:
+        asyncio.run(run())
+    assert error.value.retry_after == 0
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from neuralNetworkCarsSystem import cache
+from neuralNetworkCarsSystem.cache import EmbeddingCache, LRUCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock.time)
+    return clock
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_size=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_ttl_counts_from_created_at(clock):
+    lru = LRUCache(ttl=10)
+    lru.set("a", 1, created_at=clock.now - 8)
+    assert lru.get("a") == 1
+    clock.now += 3
+    assert lru.get("a") is None
+
+
+def test_disk_hit_keeps_disk_ttl(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    writer = EmbeddingCache(path, ttl=100)
+    writer.set("model", "Кроссовер  до 3 млн", [1.0, 2.0])
+    writer.close()
+
+    clock.now += 90
+    reader = EmbeddingCache(path, ttl=100)
+    assert reader.get("model", "кроссовер до 3 млн") == [1.0, 2.0]
+    assert reader.stats()["disk_hits"] == 1
+
+    # Запись на диске истекает через 10 с, и в памяти она не живет дольше
+    clock.now += 11
+    assert reader.get("model", "кроссовер до 3 млн") is None
+    reader.close()
+
+
+def test_disk_hits_do_not_commit_each_access(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    writer = EmbeddingCache(path)
+    writer.set("model", "седан", [1.0])
+    writer.close()
+
+    reader = EmbeddingCache(path, max_size=1, touch_batch=100)
+    clock.now += 50
+    assert reader.get("model", "седан") == [1.0]
+
+    def accessed_at():
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT accessed_at FROM embeddings").fetchone()[0]
+
+    assert accessed_at() == 1000.0
+    reader.close()
+    assert accessed_at() == 1050.0
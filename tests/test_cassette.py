@@ -0,0 +1,60 @@
+import asyncio
+import gzip
+import json
+
+from neuralNetworkCarsSystem.AutoAssistant import AsyncOpenAIApi, OpenAIApi
+from neuralNetworkCarsSystem.cassette import Cassette, CassetteTransport, request_key
+
+
+def write_entries(path, entries, tail=b""):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    with open(path, "ab") as f:
+        f.write(tail)
+
+
+def entry(body, payload=None):
+    return {"key": request_key("http://proxy/embeddings", payload), "path": "/embeddings", "status": 200,
+            "body": body, "elapsed": 0.0}
+
+
+def test_replay_returns_recorded_responses_in_order(tmp_path):
+    path = tmp_path / "dialogue.jsonl.gz"
+    write_entries(path, [entry({"n": 1}, {"input": "a"}), entry({"n": 2}, {"input": "a"})])
+    transport = CassetteTransport(Cassette(str(path)))
+    replies = [transport.post("http://other/embeddings", json={"input": "a"}).json() for _ in range(3)]
+    assert replies == [{"n": 1}, {"n": 2}, {"n": 2}]
+
+
+def test_truncated_cassette_keeps_complete_records(tmp_path):
+    path = tmp_path / "dialogue.jsonl.gz"
+    # Начало следующего gzip-члена, оборванное при аварийной остановке записи
+    write_entries(path, [entry({"n": 1})], tail=b"\x1f\x8b\x08\x00\x00")
+    cassette = Cassette(str(path))
+    assert cassette.lookup("http://proxy/embeddings", None)["body"] == {"n": 1}
+
+    write_entries(path, [entry({"n": 1})], tail=b"garbage")
+    assert Cassette(str(path)).lookup("http://proxy/embeddings", None)["body"] == {"n": 1}
+
+
+def test_async_transport_uses_client_settings(tmp_path):
+    api = OpenAIApi(None, None, transport=CassetteTransport(Cassette(str(tmp_path / "new.jsonl.gz"), mode="record")))
+    api.headers = {"Authorization": "Bearer token"}
+    client = AsyncOpenAIApi.from_api(api, max_connections=7, timeout=30)
+    assert client.transport.max_connections == 7
+    assert client.transport.timeout == 30
+
+    async def session():
+        # В режиме record сессия создается при первом запросе
+        transport = client.transport
+        transport._session = None
+        request = transport.post("http://127.0.0.1:1/embeddings", json={})
+        created = transport._session
+        request.request.close()
+        try:
+            return created.connector.limit, created.timeout.total
+        finally:
+            await transport.close()
+
+    assert asyncio.run(session()) == (7, 30)
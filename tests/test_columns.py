@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from neuralNetworkCarsSystem.columns import CatalogColumns
+from neuralNetworkCarsSystem.filters import FilterSpec, compile_query
+from neuralNetworkCarsSystem.models import CarFilter
+
+METADATAS = [
+    {"brand": "Kia", "body_type": "седан", "price": 1500000, "start_year": 2017, "transmission": "автомат"},
+    {"brand": "BMW", "body_type": "Внедорожник", "price": 4000000, "start_year": 2020, "transmission": "автомат"},
+    {"brand": "kia", "body_type": "хэтчбек", "price": 1200000, "start_year": 2012, "transmission": "механика"},
+    {"brand": "Лада", "body_type": "седан", "price": "nan", "start_year": 2019},
+    {"brand": "Toyota", "body_type": "SUV", "price": 3000000, "start_year": 2015, "transmission": "вариатор"},
+]
+
+
+@pytest.fixture
+def columns():
+    return CatalogColumns(METADATAS)
+
+
+def positions(mask):
+    return list(np.flatnonzero(mask))
+
+
+def test_ranges_and_terms(columns):
+    spec = FilterSpec()
+    spec.add_range("price", lte=2000000)
+    assert positions(columns.mask(spec)) == [0, 2]
+    spec.add_terms("body_type", ["Седан"])
+    assert positions(columns.mask(spec)) == [0]
+    assert columns.count(FilterSpec()) == len(METADATAS)
+
+
+def test_missing_numeric_value_does_not_pass_range(columns):
+    spec = FilterSpec()
+    spec.add_range("price", gte=0)
+    assert 3 not in positions(columns.mask(spec))
+
+
+def test_catalog_synonyms(columns):
+    spec = FilterSpec()
+    spec.add_terms("body_type", ["внедорожник"])
+    spec.add_terms("transmission", ["механическая", "автомат"])
+    assert positions(columns.mask(spec)) == [1]
+
+
+@pytest.mark.parametrize("filter", [
+    CarFilter(brands=["KIA"], min_year=2015),
+    {"Марка автомобиля": ["Kia"], "Год выпуска": [2015, float("nan")]},
+])
+def test_filter_forms_agree_with_compiled_query(columns, filter):
+    expected = positions(columns.mask(filter))
+    assert expected == [0]
+    assert positions(columns.mask(compile_query(filter))) == expected
+
+
+def test_update_numeric(columns):
+    spec = FilterSpec()
+    spec.add_range("price", lte=2000000)
+    columns.update_numeric("price", [1, 3], [1900000, 100000])
+    assert positions(columns.mask(spec)) == [0, 1, 2, 3]
+
+
+def test_unknown_field_is_rejected(columns):
+    with pytest.raises(ValueError):
+        columns.mask(FilterSpec(ranges={"weight": (1, None)}))
+    with pytest.raises(ValueError):
+        columns.mask(FilterSpec(terms={"color": {"red"}}))
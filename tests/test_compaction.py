@@ -0,0 +1,84 @@
+import json
+
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem.AutoAssistant import (
+    OpenAiDialogueAssistant, OpenAiElasticsearchFilter, compact_mode, format_filter_compact, format_results_table,
+)
+from neuralNetworkCarsSystem.fast_filter import EMPTY_FILTER
+
+ANSWER = {"action": "show_cars", "message": "Вот варианты", "confidence": 0.9}
+
+
+class FakeApi:
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    def post_query(self, messages):
+        self.calls.append(list(messages))
+        return {"choices": [{"message": {"role": "assistant", "content": self.content}}]}
+
+
+def make_car(**metadata):
+    base = {"brand": "kia", "model": "rio", "price": 1500000.0, "start_year": 2017, "end_year": 2023,
+            "engine_type": "бензин", "horsepower": 123, "transmission": "автомат", "drive": "передний",
+            "fuel_consumption": float("nan"), "clearance": 160, "seats": 5, "body_type": "седан"}
+    return Document(page_content="car", metadata={**base, **metadata})
+
+
+def test_compact_mode_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("CONTEXT_MODE", raising=False)
+    assert compact_mode() is False
+    monkeypatch.setenv("CONTEXT_MODE", "compact")
+    assert compact_mode() is True
+
+
+def test_format_filter_compact_skips_unset_fields():
+    assert format_filter_compact({}) == "не задан"
+    data = {**EMPTY_FILTER, "Год выпуска": ["2018", "NaN"], "Максимальная цена": "2000000", "Привод": ["полный"]}
+    assert format_filter_compact(data) == "Год выпуска от 2018; Максимальная цена: 2000000; Привод: полный"
+
+
+def test_results_table():
+    table = format_results_table([make_car(), make_car(brand="bmw", price=4000000.0)]).splitlines()
+    assert table[0].startswith("№|Марка|Модель|Цена")
+    assert table[1].startswith("1|kia|rio|1500000|2017|2023")
+    # Пропущенное значение - прочерк
+    assert "|-|" in table[1]
+    assert len(table) == 3
+
+
+def test_compact_filter_keeps_only_current_filter():
+    content = OpenAiElasticsearchFilter.format_data({**EMPTY_FILTER, "Максимальная цена": "2000000"})
+    filter = OpenAiElasticsearchFilter(FakeApi(content), max_query=3, compact=True)
+    for query in ("недорогую", "седан", "с автоматом", "японскую", "поновее"):
+        filter.post_query(query)
+    assert len(filter.messages) == 2
+    assert filter.messages[1] == {"role": "assistant", "content": content}
+    # Каждый вызов видит промпт, текущий фильтр и новый запрос
+    assert [len(call) for call in filter.api.calls] == [2, 3, 3, 3, 3]
+
+
+def test_full_filter_history_is_trimmed():
+    content = OpenAiElasticsearchFilter.format_data(EMPTY_FILTER)
+    filter = OpenAiElasticsearchFilter(FakeApi(content), max_query=2, compact=False)
+    for query in ("первый", "второй", "третий"):
+        filter.post_query(query)
+    assert [message["content"] for message in filter.messages[1::2]] == ["второй", "третий"]
+
+
+def test_compact_dialogue_sends_filter_and_table():
+    current = {**EMPTY_FILTER, "Максимальная цена": "2000000"}
+    dialogue = OpenAiDialogueAssistant(FakeApi(json.dumps(ANSWER, ensure_ascii=False)), compact=True,
+                                       memory=lambda: current)
+    for query in ("седан", "покажи ещё"):
+        response = dialogue.post_query(query, [make_car()])
+    assert response.message == "Вот варианты"
+
+    sent = dialogue.api.calls[-1]
+    # Промпт, предыдущий ответ модели и новое сообщение
+    assert len(sent) == 3
+    assert sent[-1]["content"].startswith("Текущий фильтр: Максимальная цена: 2000000\n\nЗапрос пользователя: покажи ещё")
+    assert "1|kia|rio|1500000" in sent[-1]["content"]
+    assert len(dialogue.messages) == 2
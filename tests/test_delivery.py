@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from neuralNetworkCarsSystem.cache import FileIdCache
+from neuralNetworkCarsSystem.delivery import TelegramDelivery
+
+IMAGES = ["https://example.com/1.jpg", "https://example.com/2.jpg"]
+
+
+class AlbumBot:
+    """Принимает альбом, если в нем нет отклоняемых значений media."""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.albums = []
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        sent = [item.media for item in media]
+        self.albums.append(sent)
+        if self.rejected & set(sent):
+            raise BadRequest("wrong file identifier")
+        return [SimpleNamespace(photo=[SimpleNamespace(file_id=f"id:{url}")]) for url in sent]
+
+
+@pytest.fixture
+def file_cache(tmp_path):
+    cache = FileIdCache(str(tmp_path / "file_ids.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_album_is_resent_by_file_id(file_cache):
+    delivery = TelegramDelivery(file_cache=file_cache)
+    bot = AlbumBot()
+    asyncio.run(delivery.send_album(bot, 1, IMAGES, "car"))
+    asyncio.run(delivery.send_album(bot, 1, IMAGES, "car"))
+    assert bot.albums[1] == [f"id:{url}" for url in IMAGES]
+
+
+def test_stale_file_ids_are_replaced_after_url_retry(file_cache):
+    file_cache.set_many("car", [(url, "stale") for url in IMAGES])
+    delivery = TelegramDelivery(file_cache=file_cache)
+    bot = AlbumBot(rejected={"stale"})
+    asyncio.run(delivery.send_album(bot, 1, IMAGES, "car"))
+    assert bot.albums == [["stale", "stale"], IMAGES]
+    assert file_cache.get_many(IMAGES) == {url: f"id:{url}" for url in IMAGES}
+
+
+def test_file_ids_are_kept_when_url_retry_fails(file_cache):
+    file_cache.set_many("car", [(url, "cached") for url in IMAGES])
+    delivery = TelegramDelivery(file_cache=file_cache)
+    # Альбом отклонен целиком (например, чат недоступен): file_id не виноваты
+    bot = AlbumBot(rejected={"cached", *IMAGES})
+    with pytest.raises(BadRequest):
+        asyncio.run(delivery.send_album(bot, 1, IMAGES, "car"))
+    assert file_cache.get_many(IMAGES) == {url: "cached" for url in IMAGES}
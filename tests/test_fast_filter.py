@@ -0,0 +1,57 @@
+import pytest
+
+from neuralNetworkCarsSystem.fast_filter import EMPTY_FILTER, FastFilterExtractor
+from neuralNetworkCarsSystem.filters import spec_from_data
+
+
+@pytest.fixture
+def extractor():
+    return FastFilterExtractor(threshold=0.8)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("седан", {"Тип кузова": ["седан"]}),
+    ("полный привод", {"Привод": ["полный"]}),
+    ("тойоту до 2 млн", {"Максимальная цена": "2000000", "Марка автомобиля": ["Toyota"]}),
+    ("от 1,5 до 2,5 млн", {"Минимальная цена": "1500000", "Максимальная цена": "2500000"}),
+    ("кроссовер от 2018 года с автоматом",
+     {"Год выпуска": ["2018", "NaN"], "Тип кузова": ["кроссовер"], "Тип коробки": ["автоматическая"]}),
+    ("не менее 150 л.с. и клиренс от 200 мм", {"Лошадиные силы": ["150", "NaN"], "Клиренс": ["200", "NaN"]}),
+    ("7 мест", {"Количество мест": ["7", "NaN"]}),
+])
+def test_simple_messages_are_extracted(extractor, text, expected):
+    data, confidence = extractor.extract(text)
+    assert data == expected
+    assert confidence == 1.0
+
+
+def test_jeep_is_a_body_type_not_a_brand(extractor):
+    assert extractor.extract("хочу джип") == ({"Тип кузова": ["внедорожник", "suv"]}, 1.0)
+    assert extractor.extract("jeep до 3 млн") == ({"Максимальная цена": "3000000", "Марка автомобиля": ["Jeep"]}, 1.0)
+
+
+def test_unrecognized_words_go_to_the_model(extractor):
+    # Модель "солярис" не входит в словари: доля распознанных слов 0.5
+    assert extractor.extract("хендай солярис") == ({"Марка автомобиля": ["Hyundai"]}, 0.5)
+    assert extractor.try_extract("хендай солярис") is None
+    assert extractor.try_extract("хочу машину для рыбалки и семьи") is None
+    assert extractor.try_extract("седан") == {"Тип кузова": ["седан"]}
+    assert extractor.stats() == {"fast_path": 1, "llm_path": 2, "fast_path_share": 0.333}
+
+
+def test_merge_keeps_previous_conditions():
+    merged = FastFilterExtractor.merge({"Год выпуска": ["2018", "NaN"], "Марка автомобиля": ["Kia"]},
+                                       {"Год выпуска": ["NaN", "2020"], "Привод": ["полный"]})
+    assert set(merged) == set(EMPTY_FILTER)
+    assert merged["Год выпуска"] == ["2018", "2020"]
+    assert merged["Марка автомобиля"] == ["Kia"]
+    assert merged["Привод"] == ["полный"]
+    assert merged["Тип кузова"] == "NaN"
+
+
+def test_extracted_values_match_catalog_spelling(extractor):
+    data, _ = extractor.extract("внедорожник на механике")
+    spec = spec_from_data(FastFilterExtractor.merge({}, data))
+    assert {"внедорожник", "suv"} <= spec.terms["body_type"]
+    # "механическая" в каталоге записана как "механика"
+    assert "механика" in spec.terms["transmission"]
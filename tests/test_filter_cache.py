@@ -0,0 +1,76 @@
+import pytest
+
+from neuralNetworkCarsSystem.AutoAssistant import OpenAiElasticsearchFilter
+from neuralNetworkCarsSystem.cache import LRUCache
+from neuralNetworkCarsSystem.fast_filter import EMPTY_FILTER
+
+
+def filter_text(**values):
+    return OpenAiElasticsearchFilter.format_data({**EMPTY_FILTER, **values})
+
+
+class FakeApi:
+    """Отвечает фильтром с максимальной ценой, равной номеру вызова."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def post_query(self, messages):
+        self.calls += 1
+        content = filter_text(**{"Максимальная цена": str(self.calls * 1000000)})
+        return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+@pytest.fixture
+def api():
+    return FakeApi()
+
+
+@pytest.fixture
+def cache():
+    return LRUCache(max_size=16)
+
+
+def make_filter(api, cache):
+    return OpenAiElasticsearchFilter(api, max_query=3, cache=cache, query_mode="terms", compact=False)
+
+
+def test_same_history_is_served_from_cache(api, cache):
+    first, second = make_filter(api, cache), make_filter(api, cache)
+    query = first.post_query("недорогую машину")
+    assert second.post_query("недорогую машину") == query
+    assert api.calls == 1
+    assert second.current == first.current
+    # Ответ из кэша тоже попадает в историю
+    assert second.messages == first.messages
+
+
+def test_different_history_misses(api, cache):
+    first, second = make_filter(api, cache), make_filter(api, cache)
+    first.post_query("недорогую машину")
+    second.post_query("японскую машину")
+    second.post_query("недорогую машину")
+    assert api.calls == 3
+
+    # Ход с той же предысторией снова берется из кэша
+    first.reset()
+    first.post_query("японскую машину")
+    first.post_query("недорогую машину")
+    assert api.calls == 3
+    assert first.current["Максимальная цена"] == "3000000"
+
+
+def test_cache_key_depends_on_model(api, cache):
+    filter = make_filter(api, cache)
+    filter.messages.append({"role": "user", "content": "седан"})
+    assert filter._cache_key("gpt-4o") != filter._cache_key("gpt-4o-mini")
+
+
+def test_cached_entry_is_not_shared_by_reference(api, cache):
+    first, second = make_filter(api, cache), make_filter(api, cache)
+    first.post_query("недорогую машину")
+    first.current["Максимальная цена"] = "1"
+    first.messages[-1]["content"] = "изменено"
+    second.post_query("недорогую машину")
+    assert second.current["Максимальная цена"] == "1000000"
+    assert second.messages[-1]["content"] != "изменено"
@@ -0,0 +1,83 @@
+from neuralNetworkCarsSystem.filters import (
+    FilterSpec, compile_query, spec_from_car_filter, spec_from_data, spec_from_query, to_spec,
+)
+from neuralNetworkCarsSystem.models import CarFilter
+
+NaN = float("nan")
+
+
+def make_data(**values):
+    data = {
+        "Год выпуска": [NaN, NaN], "Минимальная цена": NaN, "Максимальная цена": NaN,
+        "Марка автомобиля": "NaN", "Привод": "NaN", "Тип двигателя": "NaN", "Тип кузова": "NaN",
+        "Тип коробки": "NaN",
+    }
+    data.update(values)
+    return data
+
+
+def test_unset_fields_give_empty_query():
+    spec = spec_from_data(make_data())
+    assert spec.is_empty()
+    assert compile_query(spec) == []
+
+
+def test_lists_are_widened_like_get_filter():
+    spec = spec_from_data(make_data(**{"Привод": ["Полный"], "Тип двигателя": "Дизель", "Тип кузова": ["Хэтчбек"]}))
+    assert spec.terms["drive"] == {"полный", "передний"}
+    assert spec.terms["engine_type"] == {"дизель", "бензин"}
+    assert spec.terms["body_type"] >= {"хэтчбек", "седан", "suv", "фургон"}
+    # Марка не расширяется
+    spec = spec_from_data(make_data(**{"Марка автомобиля": ["Kia"]}))
+    assert spec.terms == {"brand": {"kia"}}
+
+
+def test_compile_query_matches_get_filter_terms():
+    from neuralNetworkCarsSystem.AutoAssistant import OpenAiElasticsearchFilter
+
+    data = make_data(**{"Привод": ["Полный"], "Тип кузова": ["Хэтчбек"], "Тип коробки": ["Автомат"]})
+    baseline = OpenAiElasticsearchFilter.get_filter(None, drives=["Полный"], body_types=["Хэтчбек"],
+                                                    transmissions=["Автомат"])
+    expected = spec_from_query(baseline).terms
+    actual = spec_from_data(data).terms
+    for field in ("drive", "transmission"):
+        assert actual[field] == expected[field]
+    # Каталожные синонимы только добавляют значения
+    assert actual["body_type"] >= expected["body_type"]
+
+
+def test_compile_query_is_canonical():
+    first = compile_query(make_data(**{"Максимальная цена": 2000000.0, "Марка автомобиля": ["Kia", "BMW"],
+                                       "Год выпуска": [2015, NaN]}))
+    second = compile_query(make_data(**{"Марка автомобиля": ["bmw", "kia "], "Год выпуска": [2015.0, NaN],
+                                        "Максимальная цена": 2000000}))
+    assert first == second
+    assert first == [{"bool": {"filter": [
+        {"range": {"metadata.price": {"lte": 2000000}}},
+        {"range": {"metadata.start_year": {"gte": 2015}}},
+        {"terms": {"metadata.brand": ["bmw", "kia"]}},
+    ]}}]
+
+
+def test_compiled_query_round_trips():
+    spec = spec_from_data(make_data(**{"Минимальная цена": 1000000, "Привод": ["Полный"]}))
+    assert spec_from_query(compile_query(spec)) == spec
+
+
+def test_ranges_and_terms_intersect():
+    spec = FilterSpec()
+    spec.add_range("price", gte=100, lte=500)
+    spec.add_range("price", gte=200)
+    spec.add_terms("brand", ["Kia", "BMW"])
+    spec.add_terms("brand", ["kia"])
+    assert spec.ranges["price"] == (200, 500)
+    assert spec.terms["brand"] == {"kia"}
+
+
+def test_car_filter_spec():
+    car_filter = CarFilter(min_price=1000000, brands=["Kia"], min_year=2018)
+    spec = to_spec(car_filter)
+    assert spec == spec_from_car_filter(car_filter)
+    assert spec.ranges == {"price": (1000000, None), "start_year": (2018, None)}
+    assert spec.terms == {"brand": {"kia"}}
+
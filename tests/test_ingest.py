@@ -0,0 +1,209 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem import ingest
+from neuralNetworkCarsSystem.AutoAssistant import RateLimitError
+from neuralNetworkCarsSystem.cache import EmbeddingStore
+from neuralNetworkCarsSystem.ingest import BulkIngestor, IncrementalIndexer, IngestCheckpoint, add_hashes
+from utils import AdaptiveRateLimiter
+
+
+class FakeIndices:
+    def __init__(self):
+        self.refreshed = 0
+        self.uuid = "uuid-1"
+
+    def get(self, index):
+        return {f"{index}_v2": {"settings": {"index": {"uuid": self.uuid}}}}
+
+    def refresh(self, index):
+        self.refreshed += 1
+
+
+class FakeEs:
+    """Индекс в памяти; документы из fail_ids отклоняются при записи."""
+
+    def __init__(self):
+        self.indices = FakeIndices()
+        self.docs = {}
+        self.fail_ids = set()
+
+
+def fake_streaming_bulk(es, actions, **kwargs):
+    for action in actions:
+        op, doc_id = action["_op_type"], action["_id"]
+        if doc_id in es.fail_ids:
+            yield False, {op: {"_id": doc_id, "status": 500}}
+            continue
+        if op == "index":
+            es.docs[doc_id] = action["_source"]
+        elif op == "update":
+            es.docs[doc_id]["metadata"].update(action["doc"]["metadata"])
+        elif op == "delete":
+            if doc_id not in es.docs:
+                yield False, {op: {"_id": doc_id, "status": 404}}
+                continue
+            del es.docs[doc_id]
+        yield True, {op: {"_id": doc_id}}
+
+
+def fake_scan(es, index, query, _source):
+    wanted = query["query"].get("ids", {}).get("values")
+    for doc_id, source in list(es.docs.items()):
+        if wanted is None or doc_id in wanted:
+            yield {"_id": doc_id, "_source": source}
+
+
+@pytest.fixture(autouse=True)
+def fake_bulk(monkeypatch):
+    monkeypatch.setattr(ingest, "streaming_bulk", fake_streaming_bulk)
+    monkeypatch.setattr(ingest, "scan", fake_scan)
+
+
+class FakeEmbeddings:
+    def __init__(self, rate_limited=0):
+        self.rate_limited = rate_limited
+        self.texts = []
+
+    async def get_embedding(self, texts):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise RateLimitError(retry_after=0)
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def make_docs(count):
+    return [Document(page_content=f"car {i}", metadata={"id": str(i), "price": 1000 * i}) for i in range(count)]
+
+
+def make_ingestor(es, api, tmp_path, **kwargs):
+    return BulkIngestor(es, "cars", api, batch_size=2, concurrency=1, checkpoint_path=str(tmp_path / "checkpoint.jsonl"),
+                        limiter=AdaptiveRateLimiter(rate=1000), **kwargs)
+
+
+def test_batches_respect_size_tokens_and_done(tmp_path):
+    ingestor = make_ingestor(FakeEs(), FakeEmbeddings(), tmp_path, batch_tokens=5)
+    docs = make_docs(3) + [Document(page_content="x" * 20)]
+    batches = [ids for _, ids in ingestor.batches(docs, [0, 1, 2, 3], done={"1"})]
+    # "car N" - 3 токена по оценке, в пакет с лимитом 5 помещается один документ
+    assert batches == [["0"], ["2"], ["3"]]
+
+
+def test_resume_skips_confirmed_batches(tmp_path):
+    es = FakeEs()
+    api = FakeEmbeddings()
+    docs = make_docs(5)
+    ids = [doc.metadata["id"] for doc in docs]
+
+    es.fail_ids = {"2"}
+    with pytest.raises(RuntimeError):
+        asyncio.run(make_ingestor(es, api, tmp_path).run(docs, ids))
+    assert IngestCheckpoint(str(tmp_path / "checkpoint.jsonl")).load("cars_v2/uuid-1") == {"0", "1"}
+
+    es.fail_ids = set()
+    api.texts = []
+    stats = asyncio.run(make_ingestor(es, api, tmp_path).run(docs, ids))
+    assert stats["documents"] == 3
+    assert api.texts == ["car 2", "car 3", "car 4"]
+    assert sorted(es.docs) == ids
+    assert es.docs["4"]["vector"] == [5.0, 1.0]
+    # После успешной загрузки журнал удаляется
+    assert not (tmp_path / "checkpoint.jsonl").exists()
+
+
+def test_rate_limited_batches_are_retried(tmp_path):
+    es = FakeEs()
+    ingestor = make_ingestor(es, FakeEmbeddings(rate_limited=2), tmp_path)
+    stats = asyncio.run(ingestor.run(make_docs(2), ["0", "1"]))
+    assert stats["rate_limited"] == 2
+    assert sorted(es.docs) == ["0", "1"]
+
+
+def test_truncated_checkpoint_line_is_ignored(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text('{"target": "cars"}\n["0", "1"]\n["2", "3', encoding="utf-8")
+    assert IngestCheckpoint(str(path)).load("cars") == {"0", "1"}
+
+
+@pytest.mark.parametrize("change", ["index_name", "recreated"])
+def test_checkpoint_of_another_index_is_ignored(tmp_path, change):
+    es = FakeEs()
+    api = FakeEmbeddings()
+    docs = make_docs(4)
+    ids = [doc.metadata["id"] for doc in docs]
+    es.fail_ids = {"2"}
+    with pytest.raises(RuntimeError):
+        asyncio.run(make_ingestor(es, api, tmp_path).run(docs, ids))
+
+    es.fail_ids = set()
+    ingestor = make_ingestor(es, api, tmp_path)
+    if change == "index_name":
+        ingestor.index_name = "cars_new"
+    else:
+        es.indices.uuid = "uuid-2"
+    api.texts = []
+    assert asyncio.run(ingestor.run(docs, ids))["documents"] == 4
+    assert api.texts == [doc.page_content for doc in docs]
+
+
+def test_checkpoint_without_header_is_ignored(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text('["0", "1"]\n', encoding="utf-8")
+    assert IngestCheckpoint(str(path)).load("cars") == set()
+    assert not path.exists()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite"))
+    yield store
+    store.close()
+
+
+def test_diff_classifies_documents():
+    docs = add_hashes(make_docs(4))
+    state = {
+        "0": (docs[0].metadata["content_hash"], docs[0].metadata["text_hash"]),
+        "1": ("old", docs[1].metadata["text_hash"]),
+        "2": ("old", "old"),
+        "9": ("old", "old"),
+    }
+    diff = IncrementalIndexer(None, "cars", None).diff(docs, ["0", "1", "2", "3"], state)
+    assert diff == {"new": ["3"], "changed": ["2"], "metadata": ["1"], "unchanged": ["0"], "removed": ["9"]}
+
+
+def test_sync_embeds_only_new_texts(tmp_path, store):
+    es = FakeEs()
+    api = FakeEmbeddings()
+    indexer = IncrementalIndexer(es, "cars", make_ingestor(es, api, tmp_path, embedding_store=store))
+    docs = make_docs(4)
+    ids = [doc.metadata["id"] for doc in docs]
+    assert asyncio.run(indexer.run(docs, ids))["new"] == 4
+
+    docs = make_docs(4)
+    docs[1].metadata["body_type"] = "седан"
+    docs[2].page_content = "car 0"
+    api.texts = []
+    stats = asyncio.run(indexer.run(docs[:3], ids[:3]))
+    assert {key: stats[key] for key in ("new", "changed", "metadata", "unchanged", "removed")} == \
+        {"new": 0, "changed": 1, "metadata": 1, "unchanged": 1, "removed": 1}
+    # Текст документа 2 совпал с уже загруженным: вектор взят из хранилища
+    assert api.texts == []
+    assert stats["reused"] == 1
+    assert es.docs["1"]["metadata"]["body_type"] == "седан"
+    assert es.docs["2"]["vector"] == es.docs["0"]["vector"]
+    assert sorted(es.docs) == ["0", "1", "2"]
+
+
+def test_documents_without_hashes_seed_the_store(tmp_path, store):
+    es = FakeEs()
+    es.docs["0"] = {"text": "car 0", "vector": [5.0, 1.0], "metadata": {"id": "0"}}
+    api = FakeEmbeddings()
+    indexer = IncrementalIndexer(es, "cars", make_ingestor(es, api, tmp_path, embedding_store=store))
+    stats = asyncio.run(indexer.run(make_docs(1), ["0"]))
+    assert stats["changed"] == 1
+    assert api.texts == []
+    assert es.docs["0"]["metadata"]["content_hash"]
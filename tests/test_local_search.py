@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem.local_search import LocalVectorStore
+
+BRANDS = ["kia", "bmw", "toyota", "lada"]
+
+
+class FakeEmbeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, query):
+        return self.vectors[int(query)].tolist()
+
+
+def make_store(n=1500, dims=32, seed=0, **kwargs):
+    rng = np.random.default_rng(seed)
+    # Кластеры, как у эмбеддингов похожих описаний
+    centers = rng.normal(size=(30, dims))
+    vectors = (centers[rng.integers(0, 30, n)] + 0.3 * rng.normal(size=(n, dims))).astype(np.float32)
+    documents = [
+        Document(page_content=f"car {i}", metadata={
+            "id": str(i), "brand": BRANDS[i % 4], "price": float(100000 * (i % 50)), "body_type": "седан",
+        })
+        for i in range(n)
+    ]
+    return LocalVectorStore(FakeEmbeddings(vectors), documents, vectors, **kwargs), vectors
+
+
+def exact_top(vectors, query, k, candidates=None):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    order = np.argsort(-scores)
+    if candidates is not None:
+        order = [i for i in order if i in candidates]
+    return list(order[:k])
+
+
+def test_brute_force_is_exact():
+    store, vectors = make_store(use_graph=False)
+    ids, scores = store.search_vectors(vectors[:5], k=10)
+    for row in range(5):
+        assert list(ids[row]) == exact_top(vectors, vectors[row], 10)
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_graph_recall():
+    store, vectors = make_store(use_graph=True)
+    assert store.graph is not None
+    queries = np.random.default_rng(1).integers(0, len(vectors), 50)
+    found = 0
+    for query in queries:
+        ids, _ = store.search_vectors(vectors[query], k=10)
+        found += len(set(ids[0]) & set(exact_top(vectors, vectors[query], 10)))
+    assert found / (10 * len(queries)) >= 0.95
+
+
+def test_filter_is_applied_before_ranking():
+    store, vectors = make_store(use_graph=True)
+    filter = [{"bool": {"filter": [{"terms": {"metadata.brand": ["kia"]}},
+                                   {"range": {"metadata.price": {"lte": 1000000}}}]}}]
+    docs = store.similarity_search("7", k=5, filter=filter)
+    assert len(docs) == 5
+    assert all(doc.metadata["brand"] == "kia" and doc.metadata["price"] <= 1000000 for doc in docs)
+    candidates = {i for i, doc in enumerate(store.documents)
+                  if doc.metadata["brand"] == "kia" and doc.metadata["price"] <= 1000000}
+    assert [int(doc.metadata["id"]) for doc in docs] == exact_top(vectors, vectors[7], 5, candidates)
+
+
+def test_unsupported_filter_falls_back_to_documents():
+    store, _ = make_store(n=100, use_graph=False)
+    filter = [{"bool": {"must_not": [{"match": {"metadata.brand": "kia"}}]}}]
+    assert store.count(filter) == 75
+
+
+def test_update_metadata_refreshes_columns():
+    store, _ = make_store(n=100, use_graph=False)
+    cheap = [{"range": {"metadata.price": {"lte": 0}}}]
+    assert store.count(cheap) == 2
+    assert store.update_metadata({"1": {"price": 0}, "missing": {"price": 0}}) == 1
+    assert store.count(cheap) == 3
+
+    store.update_metadata({"2": {"brand": "haval"}})
+    assert store.count([{"terms": {"metadata.brand": ["haval"]}}]) == 1
+
+
+def test_snapshot_round_trip_is_memory_mapped(tmp_path):
+    store, vectors = make_store(n=200, use_graph=False)
+    path = str(tmp_path / "catalog")
+    store.save(path)
+    loaded = LocalVectorStore.load(path, store.embedding, use_graph=False)
+    assert isinstance(loaded.matrix, np.memmap)
+    assert [doc.metadata["id"] for doc in loaded.documents] == [doc.metadata["id"] for doc in store.documents]
+    expected, _ = store.search_vectors(vectors[:3], k=5)
+    actual, _ = loaded.search_vectors(vectors[:3], k=5)
+    assert (actual == expected).all()
+
+
+def test_npz_round_trip(tmp_path):
+    store, vectors = make_store(n=50, use_graph=False)
+    path = str(tmp_path / "local_index.npz")
+    store.save(path)
+    loaded = LocalVectorStore.load(path, store.embedding)
+    assert loaded.documents[3].metadata == store.documents[3].metadata
+    assert np.allclose(loaded.matrix, store.matrix)
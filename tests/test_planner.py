@@ -0,0 +1,173 @@
+import asyncio
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem.AutoAssistant import OpenAiElasticsearchDB, OpenAiElasticsearchFilter, OpenAiPlanner
+from neuralNetworkCarsSystem.models import ActionType, CarFilter, ModelResponse
+from utils import StageTimer
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def aembed_query(self, query):
+        self.started += 1
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return [1.0, 0.0]
+
+
+class FakePlanner:
+    def __init__(self, action):
+        self.action = action
+
+    async def apost_query(self, query):
+        await asyncio.sleep(0.01)
+        return ModelResponse(action=self.action, message="ok", confidence=0.9, filter=CarFilter(max_price=3000000))
+
+
+def make_db(action, current=None, summary="empty"):
+    db = OpenAiElasticsearchDB.__new__(OpenAiElasticsearchDB)
+    db.summary = summary
+    db.filter = OpenAiElasticsearchFilter(None)
+    db.filter.current = current or {}
+    db.planner = FakePlanner(action)
+    db.embeddings = FakeEmbeddings()
+    db.searched = []
+
+    async def search(embedding, filter=None):
+        db.searched.append(embedding)
+        return [Document(page_content="car")]
+
+    db.asimilarity_search_by_vector = search
+    return db
+
+
+def run(db):
+    async def turn():
+        timer = StageTimer()
+        response = await db._apost_query_planner("запрос", timer)
+        # Даем отмененной задаче завершиться до закрытия цикла
+        await asyncio.sleep(0.1)
+        return response, timer
+
+    return asyncio.run(turn())
+
+
+def test_first_clarifying_turn_skips_embedding():
+    db = make_db(ActionType.ASK_QUESTION)
+    response, timer = run(db)
+    assert response.action == ActionType.ASK_QUESTION
+    assert db.embeddings.started == 0
+    assert "embedding" not in timer.stages
+
+
+def test_speculative_embedding_is_cancelled_without_search():
+    db = make_db(ActionType.ASK_QUESTION, current={"price": [None, 3000000]})
+    run(db)
+    assert db.embeddings.started == 1
+    assert db.embeddings.cancelled == 1
+    assert db.searched == []
+
+
+def test_speculative_embedding_feeds_search():
+    db = make_db(ActionType.SHOW_CARS, current={"price": [None, 3000000]})
+    response, timer = run(db)
+    assert db.embeddings.started == 1
+    assert db.embeddings.cancelled == 0
+    assert db.searched == [[1.0, 0.0]]
+    assert [doc.page_content for doc in response.docs] == ["car"]
+    assert "embedding_wait" in timer.stages
+
+
+def test_search_without_speculation_embeds_after_plan():
+    db = make_db(ActionType.SHOW_CARS)
+    _, timer = run(db)
+    assert db.embeddings.started == 1
+    assert db.searched == [[1.0, 0.0]]
+    # Эмбеддинг шел после планировщика: выигрыша от параллельности нет
+    db._log_timings(timer)
+    assert "embedding_after_plan" in db.last_timings
+    assert "overlap_saved" not in db.last_timings
+
+
+def test_overlap_is_reported_for_speculative_embedding():
+    db = make_db(ActionType.SHOW_CARS, current={"price": [None, 3000000]})
+    _, timer = run(db)
+    db._log_timings(timer)
+    assert db.last_timings["overlap_saved"] > 0
+
+
+@pytest.mark.parametrize("action, docs, summary, expected", [
+    (ActionType.SHOW_CARS, [], "empty", True),
+    (ActionType.SHOW_CARS, [Document(page_content="car")], "empty", False),
+    (ActionType.SHOW_CARS, [Document(page_content="car")], "always", True),
+    (ActionType.ASK_QUESTION, [], "always", False),
+])
+def test_needs_summary(action, docs, summary, expected):
+    db = make_db(action, summary=summary)
+    plan = ModelResponse(action=action, message="ok", confidence=0.9)
+    assert db._needs_summary(plan, docs) is expected
+
+
+class FakeApi:
+    """Отвечает заранее заданными JSON-ответами и запоминает переданные истории."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = []
+
+    def post_query(self, messages):
+        self.calls.append([dict(message) for message in messages])
+        content = json.dumps(self.answers.pop(0), ensure_ascii=False)
+        return {"choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 10}}
+
+
+def make_planner_db(api, docs, summary="empty"):
+    db = OpenAiElasticsearchDB.__new__(OpenAiElasticsearchDB)
+    db.summary = summary
+    db.filter = OpenAiElasticsearchFilter(None)
+    db.filter.current = {}
+    db.planner = OpenAiPlanner(api, compact=False)
+    db.similarity_search = lambda query, filter=None: docs
+    return db
+
+
+PLAN = {"action": "show_cars", "message": "Ищу кроссоверы", "confidence": 0.9,
+        "filter": {"body_types": ["кроссовер"], "max_price": 3000000}}
+
+
+def test_planner_summarizes_empty_result_with_its_history():
+    api = FakeApi(PLAN, {"action": "ask_question", "message": "Ничего не нашлось, поднять бюджет?", "confidence": 0.6,
+                         "filter": {"max_price": 1}})
+    db = make_planner_db(api, docs=[])
+    response = db._post_query_planner("кроссовер до 3 млн", StageTimer())
+
+    assert response.action == ActionType.ASK_QUESTION
+    assert response.message == "Ничего не нашлось, поднять бюджет?"
+    # Фильтр хода остается из ответа планировщика
+    assert response.filter.max_price == 3000000
+    assert db.filter.current["Максимальная цена"] == "3000000"
+    # Второй вызов видит запрос и ответ планировщика
+    summary_call = api.calls[1]
+    assert summary_call[1]["content"] == "кроссовер до 3 млн"
+    assert "Ищу кроссоверы" in summary_call[2]["content"]
+    assert "ничего не найдено" in summary_call[3]["content"]
+    assert db.planner.last_usage == {"prompt_tokens": 200, "completion_tokens": 20}
+
+
+def test_planner_skips_summary_when_cars_are_found():
+    api = FakeApi(PLAN)
+    docs = [Document(page_content="car", metadata={"brand": "kia"})]
+    response = make_planner_db(api, docs)._post_query_planner("кроссовер до 3 млн", StageTimer())
+    assert len(api.calls) == 1
+    assert response.message == "Ищу кроссоверы"
+    assert response.docs == docs
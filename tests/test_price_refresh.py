@@ -0,0 +1,73 @@
+import pytest
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem.index_schema import INDEX_VERSION, require_index
+from neuralNetworkCarsSystem.ingest import IncrementalIndexer, add_hashes, content_hash
+from neuralNetworkCarsSystem.price_refresh import delta_from_offers, read_price_delta
+
+
+def make_doc(price=1500000, body="седан"):
+    return Document(page_content="Kia Rio", metadata={"id": "1", "brand": "kia", "price": price, "body_type": body})
+
+
+def test_refreshed_fields_do_not_change_content_hash():
+    assert content_hash(make_doc(price=1500000)) == content_hash(make_doc(price=1700000))
+    assert content_hash(make_doc(body="седан")) != content_hash(make_doc(body="хэтчбек"))
+
+
+def test_dataset_sync_keeps_refreshed_price():
+    indexed = add_hashes([make_doc(price=1700000)])[0]
+    state = {"1": (indexed.metadata["content_hash"], indexed.metadata["text_hash"])}
+    # В датасете старая цена и другой кузов: документ меняется только по метаданным
+    doc = add_hashes([make_doc(price=1500000, body="хэтчбек")])[0]
+
+    diff = IncrementalIndexer(None, "cars", None).diff([doc], ["1"], state)
+    assert diff["metadata"] == ["1"]
+
+    by_id = {"1": doc}
+    IncrementalIndexer.keep_refreshed(by_id, diff["metadata"], {"1": {"price": 1700000}})
+    assert doc.metadata["price"] == 1700000
+    assert doc.metadata["body_type"] == "хэтчбек"
+
+
+def test_price_only_change_in_dataset_is_unchanged():
+    indexed = add_hashes([make_doc(price=1700000)])[0]
+    state = {"1": (indexed.metadata["content_hash"], indexed.metadata["text_hash"])}
+    doc = add_hashes([make_doc(price=1500000)])[0]
+    assert IncrementalIndexer(None, "cars", None).diff([doc], ["1"], state)["unchanged"] == ["1"]
+
+
+def test_read_price_delta_from_csv(tmp_path):
+    path = tmp_path / "prices.csv"
+    path.write_text("_id,median,rating\n1,1500000,4.5\n2,,\n3,n/a,3\n", encoding="utf-8")
+    assert read_price_delta(str(path)) == {"1": {"price": 1500000.0, "rating": 4.5}, "3": {"rating": 3.0}}
+
+
+def test_delta_from_offers_skips_missing_median():
+    assert delta_from_offers({"1": {"median": 100}, "2": {}, "3": None}) == {"1": {"price": 100.0}}
+
+
+class FakeIndices:
+    def __init__(self, version):
+        self.version = version
+
+    def exists(self, index):
+        return self.version is not None
+
+    def get_mapping(self, index):
+        return {f"{index}_v{self.version}": {"mappings": {"_meta": {"version": self.version}}}}
+
+
+class FakeEs:
+    def __init__(self, version):
+        self.indices = FakeIndices(version)
+
+
+def test_require_index_accepts_current_version():
+    assert require_index(FakeEs(INDEX_VERSION), "cars") == f"cars_v{INDEX_VERSION}"
+
+
+@pytest.mark.parametrize("version", [None, INDEX_VERSION - 1])
+def test_require_index_fails_without_migration(version):
+    with pytest.raises(RuntimeError):
+        require_index(FakeEs(version), "cars")
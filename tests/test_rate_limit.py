@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+from neuralNetworkCarsSystem.delivery import TelegramDelivery
+from utils import AdaptiveRateLimiter, TokenBucket
+
+
+def test_bucket_allows_burst_then_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=3)
+        waits = [await bucket.acquire() for _ in range(5)]
+        return waits
+
+    waits = asyncio.run(run())
+    assert max(waits[:3]) < 0.01
+    # Четвертая и пятая операции ждут по 1 / rate
+    assert sum(waits[3:]) == pytest.approx(0.1, abs=0.04)
+
+
+def test_pause_leaves_tokens_for_the_retried_operation():
+    async def run():
+        bucket = TokenBucket(rate=1, capacity=5)
+        bucket.pause(0.05, tokens=2)
+        started_at = time.monotonic()
+        await bucket.acquire(2)
+        return time.monotonic() - started_at
+
+    # Альбом стоимостью 2 отправляется сразу после паузы, без ожидания refill
+    assert asyncio.run(run()) == pytest.approx(0.05, abs=0.04)
+
+
+def test_pause_tokens_are_capped_by_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.pause(0, tokens=10)
+    assert bucket.tokens == 2
+
+
+def test_adaptive_limiter_backs_off_and_recovers():
+    limiter = AdaptiveRateLimiter(rate=4, min_rate=1, max_rate=5, backoff=0.5, increase_step=1, increase_every=2)
+    limiter.on_rate_limit(retry_after=0)
+    assert limiter.rate == 2
+    limiter.on_rate_limit(retry_after=0)
+    limiter.on_rate_limit(retry_after=0)
+    assert limiter.rate == 1
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.rate == 3
+    assert limiter.rate_limited == 3
+
+
+def test_adaptive_limiter_pauses_all_requests():
+    async def run():
+        limiter = AdaptiveRateLimiter(rate=100)
+        limiter.on_rate_limit(retry_after=0.1)
+        started_at = time.monotonic()
+        await asyncio.gather(limiter.acquire(), limiter.acquire())
+        return time.monotonic() - started_at
+
+    assert asyncio.run(run()) >= 0.09
+
+
+class FlakyBot:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+        return text
+
+
+def test_retry_after_pauses_chat_and_global_bucket():
+    delivery = TelegramDelivery(global_pause_after=1)
+    bot = FlakyBot([RetryAfter(1)])
+
+    async def run():
+        started_at = time.monotonic()
+        await delivery.send_message(bot, 1, "hello")
+        return time.monotonic() - started_at
+
+    assert asyncio.run(run()) >= 0.95
+    assert bot.sent == [(1, "hello")]
+    assert delivery.global_bucket._paused_until > 0
+    assert delivery.stats()["retried"] == 1
+
+
+def test_short_retry_after_pauses_only_the_chat():
+    delivery = TelegramDelivery(global_pause_after=5)
+    bot = FlakyBot([RetryAfter(1)])
+    asyncio.run(delivery.send_message(bot, 1, "hello"))
+    assert delivery.global_bucket._paused_until == 0
+    assert delivery._chats[1]._paused_until > 0
+
+
+def test_bad_request_is_not_retried():
+    delivery = TelegramDelivery()
+    bot = FlakyBot([BadRequest("chat not found")])
+    with pytest.raises(BadRequest):
+        asyncio.run(delivery.send_message(bot, 1, "hello"))
+    assert delivery.stats()["failed"] == 1
+    assert bot.sent == []
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from utils import UserTaskScheduler
+
+
+def test_tasks_of_one_user_run_in_order():
+    async def run():
+        scheduler = UserTaskScheduler(max_workers=4)
+        order = []
+
+        async def task(key, i):
+            await asyncio.sleep(0.001 * (5 - i))
+            order.append((key, i))
+
+        futures = [scheduler.submit(key, task, key, i) for i in range(5) for key in ("a", "b")]
+        await asyncio.gather(*futures)
+        return scheduler, order
+
+    scheduler, order = asyncio.run(run())
+    assert [i for key, i in order if key == "a"] == list(range(5))
+    assert [i for key, i in order if key == "b"] == list(range(5))
+    assert scheduler.stats()["processed"] == 10
+    assert scheduler.queue_depth() == 0
+
+
+def test_stats_can_be_read_from_another_thread():
+    scheduler = UserTaskScheduler(max_workers=8)
+    errors = []
+    done = threading.Event()
+
+    def scrape():
+        # Так метрики читает поток HTTP-сервера /metrics
+        while not done.is_set():
+            try:
+                scheduler.queue_depth()
+                scheduler.stats()
+            except RuntimeError as e:
+                errors.append(e)
+
+    async def run():
+        async def task():
+            await asyncio.sleep(0)
+
+        for _ in range(20):
+            await asyncio.gather(*(scheduler.submit(key, task) for key in range(200)))
+
+    reader = threading.Thread(target=scrape)
+    reader.start()
+    try:
+        asyncio.run(run())
+    finally:
+        done.set()
+        reader.join()
+    assert errors == []
@@ -0,0 +1,124 @@
+import pytest
+
+from neuralNetworkCarsSystem import sessions
+from neuralNetworkCarsSystem.sessions import SessionStore
+
+
+class FakeAssistant:
+    def __init__(self):
+        self.history = []
+
+    def get_state(self):
+        return {"history": self.history}
+
+    def load_state(self, state):
+        self.history = state["history"]
+
+    def reset(self):
+        self.history = []
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, "monotonic", clock.monotonic)
+    return clock
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        kwargs.setdefault("ttl", None)
+        store = SessionStore(FakeAssistant, path=str(tmp_path / "sessions.sqlite"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        try:
+            store.close()
+        except Exception:
+            pass
+
+
+def test_least_recently_used_session_is_evicted_and_rehydrated(make_store):
+    store = make_store(max_sessions=2)
+    store.get(1).history.append("first")
+    store.get(2)
+    store.get(1)
+    store.get(3)
+    assert store.stats()["live"] == 2
+    assert store.evicted == 1
+
+    # Сессия 2 была вытеснена последней по времени использования, 1 осталась в памяти
+    assert store.get(1).history == ["first"]
+    store.get(2)
+    assert store.rehydrated == 1
+
+
+def test_evicted_state_survives_rehydration(make_store):
+    store = make_store(max_sessions=1)
+    with store.session(1) as assistant:
+        assistant.history.append("hello")
+    store.get(2)
+    assert store.get(1).history == ["hello"]
+    assert store.stats()["rehydrated"] == 1
+
+
+def test_idle_sessions_expire(make_store, clock):
+    store = make_store(ttl=10)
+    store.get(1)
+    clock.now = 5
+    store.get(2)
+    clock.now = 12
+    store.evict_expired()
+    assert list(store._live) == [2]
+
+
+def test_pinned_session_is_not_evicted(make_store):
+    store = make_store(max_sessions=1)
+    assistant = store.acquire(1)
+    with store.session(2) as other:
+        other.history.append("other")
+    # Лимит соблюдается за счет незанятой сессии
+    assert list(store._live) == [1]
+    assistant.history.append("reply")
+    store.release(1)
+    assert store.get(2).history == ["other"]
+    assert 1 not in store._live
+    assert store.get(1).history == ["reply"]
+
+
+def test_byte_limit(make_store):
+    store = make_store(max_bytes=60)
+    with store.session(1) as assistant:
+        assistant.history.append("x" * 40)
+    with store.session(2) as assistant:
+        assistant.history.append("y" * 40)
+    assert list(store._live) == [2]
+    assert store.stats()["bytes_total"] <= 60
+
+
+def test_reset_clears_memory_and_disk(make_store):
+    store = make_store(max_sessions=1)
+    store.get(1).history.append("old")
+    store.get(2)
+    store.reset(1)
+    assert store.get(1).history == []
+
+
+def test_close_persists_live_sessions(make_store):
+    store = make_store()
+    store.get(1).history.append("saved")
+    store.close()
+    assert make_store().get(1).history == ["saved"]
@@ -0,0 +1,90 @@
+import math
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from neuralNetworkCarsSystem import snapshot
+from neuralNetworkCarsSystem.snapshot import (
+    CURRENT, load_documents, load_embeddings, read_manifest, resolve, write_snapshot,
+)
+
+
+def make_docs():
+    # Модели из read_excel: числа рядом со строками в одной колонке
+    rows = [("mazda", 3, 1500000), ("mazda", "CX-5", 3200000), ("peugeot", 308, float("nan"))]
+    return [
+        Document(page_content=f"{brand} {model}", metadata={
+            "id": str(i), "brand": brand, "model": model, "price": price, "images": [f"https://img/{i}.jpg"],
+        })
+        for i, (brand, model, price) in enumerate(rows)
+    ]
+
+
+def test_mixed_type_column_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot")
+    write_snapshot(path, make_docs(), np.eye(3, 4, dtype=np.float32))
+
+    docs, ids = load_documents(path)
+    assert ids == ["0", "1", "2"]
+    assert [doc.metadata["model"] for doc in docs] == ["3", "CX-5", "308"]
+    assert docs[0].metadata["images"] == ["https://img/0.jpg"]
+    assert math.isnan(docs[2].metadata["price"])
+    assert load_embeddings(path).shape == (3, 4)
+
+
+def test_new_version_is_published_through_pointer(tmp_path):
+    path = str(tmp_path / "snapshot")
+    write_snapshot(path, make_docs(), np.ones((3, 4), dtype=np.float32))
+    first = resolve(path)
+    write_snapshot(path, make_docs()[:2], np.ones((2, 4), dtype=np.float32))
+    second = resolve(path)
+
+    assert first != second
+    # Прежняя версия остается для читателей, которые уже открыли ее
+    assert os.path.isdir(first)
+    assert read_manifest(path)["rows"] == 2
+    assert len(load_documents(path)[0]) == 2
+    assert load_embeddings(path).shape == (2, 4)
+
+    write_snapshot(path, make_docs()[:1], np.ones((1, 4), dtype=np.float32))
+    assert not os.path.exists(first)
+    assert sorted(os.listdir(path)) == sorted([CURRENT, os.path.basename(second), os.path.basename(resolve(path))])
+
+
+def test_failed_write_keeps_current_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    write_snapshot(path, make_docs(), np.ones((3, 4), dtype=np.float32))
+    current = resolve(path)
+
+    def broken(*args):
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(snapshot, "_write_files", broken)
+    with pytest.raises(OSError):
+        write_snapshot(path, make_docs()[:1])
+    assert resolve(path) == current
+    assert not [name for name in os.listdir(path) if name.startswith(".tmp-")]
+
+
+def test_row_count_mismatch_is_detected(tmp_path):
+    path = str(tmp_path / "snapshot")
+    write_snapshot(path, make_docs(), np.ones((3, 4), dtype=np.float32))
+    version = resolve(path)
+    np.save(os.path.join(version, snapshot.EMBEDDINGS), np.ones((2, 4), dtype=np.float32))
+
+    with pytest.raises(ValueError):
+        load_embeddings(path)
+
+
+def test_legacy_flat_snapshot_is_readable(tmp_path):
+    path = str(tmp_path / "snapshot")
+    write_snapshot(path, make_docs(), np.ones((3, 4), dtype=np.float32))
+    version = resolve(path)
+    for name in os.listdir(version):
+        os.replace(os.path.join(version, name), os.path.join(path, name))
+    os.remove(os.path.join(path, CURRENT))
+
+    assert resolve(path) == path
+    assert len(load_documents(path)[0]) == 3
@@ -1,142 +1,122 @@
-from telegram import InputMediaPhoto, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, CallbackQueryHandler, CommandHandler, filters
 import os
 from dotenv import load_dotenv
-from neuralNetworkCarsSystem.carsFacade import createAutoAssistantInstance
-from utils import setup_logger
-import asyncio
+from neuralNetworkCarsSystem.carsFacade import createAutoAssistantInstance, get_runtime
+from utils import setup_logger, UserTaskScheduler, StageTimer, REGISTRY, start_metrics_server
 from neuralNetworkCarsSystem.models import ActionType
+from neuralNetworkCarsSystem.sessions import SessionStore
+from neuralNetworkCarsSystem.delivery import TelegramDelivery
 
 logger = setup_logger("tg_bot")
 
 load_dotenv()
 
 API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-user_assistants = {}
+sessions = SessionStore.from_env(createAutoAssistantInstance)
+scheduler = UserTaskScheduler()
+delivery = TelegramDelivery.from_env()
+
+BOT_TURN_SECONDS = REGISTRY.histogram("bot_turn_seconds", "Длительность обработки сообщения ботом по стадиям",
+                                      ["handler", "stage"])
+REGISTRY.collect("bot_sessions", "Сессии пользователей в памяти", lambda: sessions.stats()["live"])
+REGISTRY.collect("bot_sessions_evicted_total", "Вытесненные из памяти сессии", lambda: sessions.evicted,
+                 kind="counter")
+REGISTRY.collect("bot_scheduler_tasks", "Задачи планировщика", lambda: {
+    "queued": scheduler.queue_depth(),
+    "running": scheduler.stats()["running"],
+}, labelname="state")
+if delivery.file_cache is not None:
+    REGISTRY.collect("bot_file_id_cache_total", "Фотографии альбомов по file_id (hits) и по ссылкам (misses)",
+                     lambda: delivery.file_cache.stats(), kind="counter", labelname="result")
+
+
+def _observe_turn(handler, timer):
+    """Все, что после ответа ассистента, - доставка сообщений в Telegram."""
+    total = timer.total()
+    assistant = timer.stages.get("assistant", 0.0)
+    BOT_TURN_SECONDS.observe(assistant, handler=handler, stage="assistant")
+    BOT_TURN_SECONDS.observe(total - assistant, handler=handler, stage="delivery")
+    BOT_TURN_SECONDS.observe(total, handler=handler, stage="total")
+
+
+async def _send_response(bot, chat_id, response, query_text):
+    """Отправляет ответ ассистента: вопрос с вариантами, карточки автомобилей или уточнение."""
+    if response.action == ActionType.ASK_QUESTION:
+        # Если нужно задать вопрос
+        message_text = response.message
+        if response.question and response.question.options:
+            # Создаем клавиатуру с вариантами ответов
+            keyboard = []
+            for option in response.question.options:
+                keyboard.append([InlineKeyboardButton(option, callback_data=f"answer_{option}")])
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await delivery.send_message(bot, chat_id, message_text, reply_markup=reply_markup)
+        else:
+            await delivery.send_message(bot, chat_id, message_text)
+
+    elif response.action == ActionType.SHOW_CARS:
+        # Если нужно показать машины
+        pre_message = "🔍 Начинаю поиск автомобилей по вашим критериям...\n" \
+                     "Я подберу 3 наиболее подходящих варианта."
+        await delivery.send_message(bot, chat_id, pre_message)
+
+        docs = response.docs
+        logger.info(f"Найдено {len(docs)} автомобилей для запроса: {query_text}")
+
+        if len(docs) == 0:
+            message_text = "❌ К сожалению, не удалось найти подходящих автомобилей по вашему запросу.\n\n" \
+                         "Попробуйте изменить критерии поиска или начать поиск заново."
+            await delivery.send_message(bot, chat_id, message_text)
+            return
+
+        await delivery.send_cars(bot, chat_id, docs)
+
+    elif response.action == ActionType.CLARIFY:
+        # Если нужно уточнить
+        await delivery.send_message(bot, chat_id, response.message)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Сообщения одного пользователя обрабатываются строго по очереди,
+    # разных пользователей - параллельно
+    await scheduler.submit(update.message.from_user.id, _handle_message, update, context)
+
+
+async def _handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     chat_id = update.effective_chat.id
+    timer = StageTimer()
 
     try:
-        if user_id not in user_assistants:
-            assistant = createAutoAssistantInstance()
-            user_assistants[user_id] = assistant
-        else:
-            assistant = user_assistants[user_id]
+        assistant = sessions.acquire(user_id)
 
         user_message = update.message.text
         logger.info(f"Получен запрос от пользователя {user_id}: {user_message}")
 
         try:
-            response = assistant.process_message(user_message)
+            response = await timer.measure("assistant", assistant.aprocess_message(user_message))
             
-            if response.action == ActionType.ASK_QUESTION:
-                # Если нужно задать вопрос
-                message_text = response.message
-                if response.question and response.question.options:
-                    # Создаем клавиатуру с вариантами ответов
-                    keyboard = []
-                    for option in response.question.options:
-                        keyboard.append([InlineKeyboardButton(option, callback_data=f"answer_{option}")])
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=message_text,
-                        reply_markup=reply_markup
-                    )
-                else:
-                    await context.bot.send_message(chat_id=chat_id, text=message_text)
-                    
-            elif response.action == ActionType.SHOW_CARS:
-                # Если нужно показать машины
-                pre_message = "🔍 Начинаю поиск автомобилей по вашим критериям...\n" \
-                             "Я подберу 3 наиболее подходящих варианта."
-                await context.bot.send_message(chat_id=chat_id, text=pre_message)
-
-                docs = response.docs
-                logger.info(f"Найдено {len(docs)} автомобилей для запроса: {user_message}")
-                
-                if len(docs) == 0:
-                    message_text = "❌ К сожалению, не удалось найти подходящих автомобилей по вашему запросу.\n\n" \
-                                 "Попробуйте изменить критерии поиска или начать поиск заново."
-                    await context.bot.send_message(chat_id=chat_id, text=message_text)
-                    return
-
-                for doc in docs:
-                    metadata = doc.metadata
-                    logger.debug(f"Обработка автомобиля: {metadata.get('brand')} {metadata.get('model')}")
-
-                    brand = metadata.get('brand', '').upper()
-                    model = metadata.get('model', '').upper()
-                    price = metadata.get('price', 0)
-                    desc_summarization = metadata.get('desc_summarization', '')
-                    desc_plus = metadata.get('desc_plus', '')
-                    desc_minus = metadata.get('desc_minus', '')
-
-                    formatted_price = f"{int(price):,}".replace(',', ' ')
-
-                    message_text = (
-                        f"🚗 <b>{brand} {model}</b>\n\n"
-                        f"💰 <b>Средняя цена:</b> {formatted_price} ₽\n\n"
-                        f"📝 <b>Описание:</b>\n{desc_summarization}\n\n"
-                        f"✅ <b>Плюсы:</b>\n{desc_plus}\n\n"
-                        f"❌ <b>Минусы:</b>\n{desc_minus}\n\n"
-                    )
-
-                    brand_link = metadata.get('brand', '').lower().replace(' ', '_')
-                    model_link = metadata.get('model', '').lower().replace(' ', '_')
-                    link = f"https://auto.drom.ru/{brand_link}/{model_link}/"
-
-                    message_text += f'🔗 <a href="{link}">Посмотреть объявления на Drom.ru</a>'
-
-                    images = metadata.get('images', [])[:5]
-                
-                    if images:
-                        message_text += f'\n\n📸 Галерея автомобиля ⬇️'
-
-                    retry_count = 3
-                    for attempt in range(retry_count):
-                        try:
-                            await context.bot.send_message(
-                                chat_id=chat_id,
-                                text=message_text,
-                                parse_mode='HTML',
-                                disable_web_page_preview=True
-                            )
-                            break
-                        except Exception as e:
-                            logger.error(f"Попытка {attempt + 1}/{retry_count}: Ошибка при отправке сообщения для {brand} {model}: {e}")
-                            if attempt == retry_count - 1:
-                                raise
-
-                    if images:
-                        try:
-                            media_group = [InputMediaPhoto(media=image_url) for image_url in images]
-                            await context.bot.send_media_group(chat_id=chat_id, media=media_group)
-                        except Exception as e:
-                            logger.error(f"Ошибка при отправке изображений для {brand} {model}: {e}")
-
-                    await asyncio.sleep(1)
-
-            elif response.action == ActionType.CLARIFY:
-                # Если нужно уточнить
-                await context.bot.send_message(chat_id=chat_id, text=response.message)
+            await _send_response(context.bot, chat_id, response, user_message)
 
         except Exception as e:
             logger.error(f"Ошибка при обработке запроса: {e}", exc_info=True)
-            await context.bot.send_message(
+            await delivery.send_message(
+                context.bot,
                 chat_id=chat_id,
                 text="❌ Произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз."
             )
 
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения от пользователя {user_id}: {e}", exc_info=True)
-        await context.bot.send_message(
+        await delivery.send_message(
+            context.bot,
             chat_id=chat_id,
             text="❌ Произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз."
         )
+    finally:
+        sessions.release(user_id)
+        _observe_turn("message", timer)
 
 
 async def reset_context(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -147,17 +127,18 @@ async def reset_context(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
 
     if data == f"reset_{user_id}":
-        assistant = user_assistants.get(user_id)
-        if assistant:
-            assistant.reset()
-            await query.edit_message_text(text="Все забыл! Готов к новому поиску")
+        sessions.reset(user_id)
+        await query.edit_message_text(text="Все забыл! Готов к новому поиску")
 
 
 async def reset_context_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await scheduler.submit(update.message.from_user.id, _reset_context_command, update, context)
+
+
+async def _reset_context_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    assistant = user_assistants.get(user_id)
-    assistant.reset()
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="Все забыл! Готов к новому поиску")
+    sessions.reset(user_id)
+    await delivery.send_message(context.bot, chat_id=update.effective_chat.id, text="Все забыл! Готов к новому поиску")
 
 
 async def start_context_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -169,21 +150,22 @@ async def start_context_command(update: Update, context: ContextTypes.DEFAULT_TY
         "/filter - Показать текущие фильтры\n\n"
         "Просто напишите мне ваши предпочтения, и я помогу найти подходящий автомобиль!"
     )
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=welcome_text)
+    await delivery.send_message(context.bot, chat_id=update.effective_chat.id, text=welcome_text)
 
 
 async def handle_filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await scheduler.submit(update.message.from_user.id, _handle_filter_command, update, context)
+
+
+async def _handle_filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     chat_id = update.effective_chat.id
 
     try:
-        if user_id not in user_assistants:
-            assistant = createAutoAssistantInstance()
-            user_assistants[user_id] = assistant
-        else:
-            assistant = user_assistants[user_id]
+        assistant = sessions.get(user_id)
 
-        filter_data = assistant.db.filter.messages[-1]['content'] if len(assistant.db.filter.messages) > 1 else "Нет активных фильтров"
+        current_filter = assistant.db.filter.current
+        filter_data = assistant.db.filter.format_data(current_filter) if current_filter else "Нет активных фильтров"
         
         # Форматируем сообщение
         message = "🔍 *Текущие фильтры поиска*\n\n"
@@ -259,7 +241,8 @@ async def handle_filter_command(update: Update, context: ContextTypes.DEFAULT_TY
 
         # Отправляем сообщения
         if len(parts) == 1:
-            await context.bot.send_message(
+            await delivery.send_message(
+                context.bot,
                 chat_id=chat_id,
                 text=parts[0],
                 parse_mode='Markdown'
@@ -267,154 +250,99 @@ async def handle_filter_command(update: Update, context: ContextTypes.DEFAULT_TY
         else:
             for i, part in enumerate(parts, 1):
                 if i == 1:
-                    await context.bot.send_message(
+                    await delivery.send_message(
+                        context.bot,
                         chat_id=chat_id,
                         text=f"{part}\n\n*Часть {i}/{len(parts)}*",
                         parse_mode='Markdown'
                     )
                 else:
-                    await context.bot.send_message(
+                    await delivery.send_message(
+                        context.bot,
                         chat_id=chat_id,
                         text=f"{part}\n\n*Часть {i}/{len(parts)}*",
                         parse_mode='Markdown'
                     )
-                await asyncio.sleep(0.5)
 
     except Exception as e:
         logger.error(f"Ошибка при обработке команды /filter для пользователя {user_id}: {e}", exc_info=True)
-        await context.bot.send_message(
+        await delivery.send_message(
+            context.bot,
             chat_id=chat_id,
             text="❌ Произошла ошибка при получении фильтров. Пожалуйста, попробуйте еще раз."
         )
 
 
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Ставим ответ в очередь до первого await, чтобы сохранить порядок сообщений пользователя
+    future = scheduler.submit(update.callback_query.from_user.id, _handle_answer, update, context)
+    await update.callback_query.answer()
+    await future
+
+
+async def _handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
 
     user_id = update.callback_query.from_user.id
     chat_id = update.effective_chat.id
     answer = query.data.replace('answer_', '')
+    timer = StageTimer()
 
     try:
-        if user_id not in user_assistants:
-            assistant = createAutoAssistantInstance()
-            user_assistants[user_id] = assistant
-        else:
-            assistant = user_assistants[user_id]
+        assistant = sessions.acquire(user_id)
 
         # Обрабатываем ответ пользователя
-        response = assistant.process_message(answer)
+        response = await timer.measure("assistant", assistant.aprocess_message(answer))
         
         # Удаляем сообщение с вопросом
         await query.message.delete()
         
         # Отправляем ответ пользователя как новое сообщение
-        await context.bot.send_message(chat_id=chat_id, text=answer)
+        await delivery.send_message(context.bot, chat_id=chat_id, text=answer)
         
         # Обрабатываем ответ
-        if response.action == ActionType.ASK_QUESTION:
-            # Если нужно задать вопрос
-            message_text = response.message
-            if response.question and response.question.options:
-                # Создаем клавиатуру с вариантами ответов
-                keyboard = []
-                for option in response.question.options:
-                    keyboard.append([InlineKeyboardButton(option, callback_data=f"answer_{option}")])
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=message_text,
-                    reply_markup=reply_markup
-                )
-            else:
-                await context.bot.send_message(chat_id=chat_id, text=message_text)
-                
-        elif response.action == ActionType.SHOW_CARS:
-            # Если нужно показать машины
-            pre_message = "🔍 Начинаю поиск автомобилей по вашим критериям...\n" \
-                         "Я подберу 3 наиболее подходящих варианта."
-            await context.bot.send_message(chat_id=chat_id, text=pre_message)
-
-            docs = response.docs
-            logger.info(f"Найдено {len(docs)} автомобилей для запроса: {answer}")
-            
-            if len(docs) == 0:
-                message_text = "❌ К сожалению, не удалось найти подходящих автомобилей по вашему запросу.\n\n" \
-                             "Попробуйте изменить критерии поиска или начать поиск заново."
-                await context.bot.send_message(chat_id=chat_id, text=message_text)
-                return
-
-            for car in docs:
-                metadata = car.metadata
-                logger.debug(f"Обработка автомобиля: {metadata.get('brand')} {metadata.get('model')}")
-
-                brand = metadata.get('brand', '').upper()
-                model = metadata.get('model', '').upper()
-                price = metadata.get('price', 0)
-                desc_summarization = metadata.get('desc_summarization', '')
-                desc_plus = metadata.get('desc_plus', '')
-                desc_minus = metadata.get('desc_minus', '')
-
-                formatted_price = f"{int(price):,}".replace(',', ' ')
-
-                message_text = (
-                    f"🚗 <b>{brand} {model}</b>\n\n"
-                    f"💰 <b>Средняя цена:</b> {formatted_price} ₽\n\n"
-                    f"📝 <b>Описание:</b>\n{desc_summarization}\n\n"
-                    f"✅ <b>Плюсы:</b>\n{desc_plus}\n\n"
-                    f"❌ <b>Минусы:</b>\n{desc_minus}\n\n"
-                )
-
-                brand_link = metadata.get('brand', '').lower().replace(' ', '_')
-                model_link = metadata.get('model', '').lower().replace(' ', '_')
-                link = f"https://auto.drom.ru/{brand_link}/{model_link}/"
-
-                message_text += f'🔗 <a href="{link}">Посмотреть объявления на Drom.ru</a>'
-
-                images = metadata.get('images', [])[:5]
-            
-                if images:
-                    message_text += f'\n\n📸 Галерея автомобиля ⬇️'
-
-                retry_count = 3
-                for attempt in range(retry_count):
-                    try:
-                        await context.bot.send_message(
-                            chat_id=chat_id,
-                            text=message_text,
-                            parse_mode='HTML',
-                            disable_web_page_preview=True
-                        )
-                        break
-                    except Exception as e:
-                        logger.error(f"Попытка {attempt + 1}/{retry_count}: Ошибка при отправке сообщения для {brand} {model}: {e}")
-                        if attempt == retry_count - 1:
-                            raise
-
-                if images:
-                    try:
-                        media_group = [InputMediaPhoto(media=image_url) for image_url in images]
-                        await context.bot.send_media_group(chat_id=chat_id, media=media_group)
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке изображений для {brand} {model}: {e}")
-
-                await asyncio.sleep(1)
-
-        elif response.action == ActionType.CLARIFY:
-            # Если нужно уточнить
-            await context.bot.send_message(chat_id=chat_id, text=response.message)
+        await _send_response(context.bot, chat_id, response, answer)
 
     except Exception as e:
         logger.error(f"Ошибка при обработке ответа от пользователя {user_id}: {e}", exc_info=True)
-        await context.bot.send_message(
+        await delivery.send_message(
+            context.bot,
             chat_id=chat_id,
             text="❌ Произошла ошибка при обработке вашего ответа. Пожалуйста, попробуйте еще раз."
         )
+    finally:
+        sessions.release(user_id)
+        _observe_turn("answer", timer)
+
+
+async def post_init(application):
+    interval = float(os.getenv("SCHEDULER_STATS_INTERVAL", 60))
+    application.create_task(scheduler.report_stats(interval))
+    application.create_task(sessions.report_stats(interval))
+    # Пустой METRICS_PORT отключает экспорт метрик
+    metrics_port = os.getenv("METRICS_PORT", "9464")
+    if metrics_port:
+        start_metrics_server(int(metrics_port), os.getenv("METRICS_HOST", "127.0.0.1"))
+
+
+async def post_shutdown(application):
+    sessions.close()
+    delivery.close()
+    await get_runtime().aclose()
 
 
 def main():
-    application = ApplicationBuilder().token(API_TOKEN).build()
+    # Поднимаем общий рантайм заранее, чтобы первый пользователь не ждал инициализации
+    get_runtime()
+
+    application = (
+        ApplicationBuilder()
+        .token(API_TOKEN)
+        .concurrent_updates(int(os.getenv("BOT_CONCURRENT_UPDATES", 256)))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Регистрируем обработчики
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -424,7 +352,10 @@ def main():
     application.add_handler(CommandHandler('start', start_context_command))
 
     logger.info("--------------------------------Бот запущен!--------------------------------")
-    application.run_polling()
+    try:
+        application.run_polling()
+    finally:
+        logger.info(f"Статистика планировщика: {scheduler.stats()}")
 
 
 if __name__ == '__main__':
@@ -1,3 +1,8 @@
 from .logger import setup_logger
+from .scheduler import UserTaskScheduler
+from .timing import StageTimer
+from .rate_limit import AdaptiveRateLimiter, TokenBucket
+from .metrics import MetricsRegistry, REGISTRY, start_metrics_server
 
-__all__ = ['setup_logger']
\ No newline at end of file
+__all__ = ['setup_logger', 'UserTaskScheduler', 'StageTimer', 'AdaptiveRateLimiter', 'TokenBucket',
+           'MetricsRegistry', 'REGISTRY', 'start_metrics_server']
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from .logger import setup_logger
+
+logger = setup_logger("rate_limit")
+
+
+class AdaptiveRateLimiter:
+    """
+    Ограничитель частоты запросов, подстраивающийся под ответы 429.
+
+    Запросы разносятся во времени с интервалом 1 / rate. После 429 частота
+    уменьшается в backoff раз и все запросы ждут retry_after секунд, после
+    каждых increase_every успешных ответов частота растет на increase_step
+    (до max_rate) - аддитивное увеличение, мультипликативное уменьшение.
+    """
+
+    def __init__(self, rate=5.0, min_rate=0.1, max_rate=50.0, backoff=0.5, increase_step=0.5, increase_every=10):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.backoff = backoff
+        self.increase_step = increase_step
+        self.increase_every = increase_every
+        self.rate_limited = 0
+        self._successes = 0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.increase_every and self.rate < self.max_rate:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_rate_limit(self, retry_after=None):
+        self.rate_limited += 1
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate * self.backoff)
+        pause = retry_after if retry_after is not None else 1.0 / self.rate
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logger.warning(f"Получен 429: частота снижена до {self.rate:.2f} запр/с, пауза {pause:.1f} с")
+
+
+class TokenBucket:
+    """
+    Ведро токенов: в среднем rate операций в секунду с допустимой пачкой до
+    capacity подряд. Ожидающие получают токены в порядке очереди; pause
+    останавливает выдачу на заданное время (например, по retry_after).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    async def acquire(self, cost=1):
+        """Ждет cost токенов и возвращает время ожидания в секундах."""
+        cost = min(cost, self.capacity)
+        started_at = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return now - started_at
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+    def pause(self, seconds, tokens=1):
+        """
+        Останавливает выдачу на seconds секунд. После паузы сразу доступно tokens
+        токенов (не больше capacity), остальные копятся заново; tokens должно
+        покрывать стоимость повторяемой операции, иначе она подождет еще и refill.
+        """
+        now = time.monotonic()
+        self.tokens = min(float(tokens), self.capacity)
+        self._paused_until = max(self._paused_until, now + max(0.0, seconds))
+        self._updated = self._paused_until
+
+    def idle(self):
+        """Ведро заполнено и никто не ждет - его можно удалить без потери ограничения."""
+        now = time.monotonic()
+        if self._lock.locked() or now < self._paused_until:
+            return False
+        return self.tokens + (now - self._updated) * self.rate >= self.capacity
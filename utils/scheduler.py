@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from .logger import setup_logger
+
+logger = setup_logger("scheduler")
+
+
+class UserTaskScheduler:
+    """
+    Планировщик обработки обновлений бота.
+
+    Задачи разных пользователей выполняются параллельно (не более max_workers
+    одновременно), задачи одного пользователя - строго в порядке поступления.
+    """
+
+    def __init__(self, max_workers=None, slow_wait_seconds=5.0, history_size=1000):
+        self.max_workers = max_workers or int(os.getenv("BOT_MAX_WORKERS", 256))
+        self.slow_wait_seconds = slow_wait_seconds
+        self._semaphore = None
+        self._queues = {}
+        self._workers = {}
+        self._running = 0
+        self._waits = deque(maxlen=history_size)
+        self.processed = 0
+        self.failed = 0
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Ставит корутину func(*args, **kwargs) в очередь пользователя key.
+        Возвращает future с результатом. Порядок задач определяется моментом
+        вызова submit, поэтому его нужно вызывать до первого await в обработчике.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.setdefault(key, deque())
+        queue.append((func, args, kwargs, future, time.monotonic()))
+
+        if key not in self._workers:
+            self._workers[key] = loop.create_task(self._drain(key))
+        return future
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                func, args, kwargs, future, enqueued_at = queue.popleft()
+                async with self._get_semaphore():
+                    wait = time.monotonic() - enqueued_at
+                    self._waits.append(wait)
+                    if wait > self.slow_wait_seconds:
+                        logger.warning(f"Задача пользователя {key} ждала в очереди {wait:.1f} с. {self.stats()}")
+
+                    self._running += 1
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        self.failed += 1
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+                    finally:
+                        self._running -= 1
+                        self.processed += 1
+        finally:
+            del self._workers[key]
+            if not queue:
+                del self._queues[key]
+
+    def queue_depth(self):
+        """Количество задач, ожидающих выполнения."""
+        # Вызывается и из потока сервера метрик: list() копирует словарь за один шаг,
+        # а генератор по values() упал бы, если цикл событий добавит или удалит очередь
+        return sum(len(queue) for queue in list(self._queues.values()))
+
+    def stats(self):
+        waits = list(self._waits)
+        waits.sort()
+        if waits:
+            wait_avg = sum(waits) / len(waits)
+            wait_p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+            wait_max = waits[-1]
+        else:
+            wait_avg = wait_p95 = wait_max = 0.0
+
+        return {
+            "queue_depth": self.queue_depth(),
+            "running": self._running,
+            "active_users": len(self._workers),
+            "max_workers": self.max_workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_avg": round(wait_avg, 3),
+            "wait_p95": round(wait_p95, 3),
+            "wait_max": round(wait_max, 3),
+        }
+
+    async def report_stats(self, interval=60.0):
+        """Периодически пишет в лог глубину очереди и время ожидания."""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"Статистика планировщика: {self.stats()}")
@@ -0,0 +1,31 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Замеряет длительность стадий одного хода (в секундах)."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    async def measure(self, name, awaitable):
+        """Дожидается awaitable и записывает время ожидания как стадию name."""
+        with self.stage(name):
+            return await awaitable
+
+    def total(self):
+        return time.perf_counter() - self.started_at
+
+    def summary(self):
+        result = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        result["total"] = round(self.total() * 1000, 1)
+        return result